@@ -2,10 +2,23 @@ from datetime import datetime
 from fastapi import HTTPException, status
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.database import Reserva, Usuario, Log
+from app.database import IntentoReserva, Reserva, Usuario, Log, LogHistorico
+from sqlalchemy import case, delete, func, insert, select
+from app.utils.log_buffer import LOG_BUFFER_ACTIVO, log_buffer
+from app.utils.jwt_auth import principal_cache
+from app.gateway.login_cache import login_cache
 from datetime import timedelta
 
 def insertar_log(db: Session, id_usuario, id_reserva, mensaje):
+    """
+    Guarda un log de una reserva.
+    Por defecto (LOG_BUFFER_ACTIVO) el log se acumula en log_buffer y se escribe en bloque en
+    segundo plano: el Log devuelto no está en la sesión y su id_log es None, porque aún no
+    está en la base de datos. Sin buffer se escribe al momento y se devuelve con su id_log.
+    """
+    if LOG_BUFFER_ACTIVO:
+        return Log(**log_buffer.añadir(id_usuario, id_reserva, mensaje))
+
     log = Log(id_usuario=id_usuario, id_reserva=id_reserva, mensaje=mensaje)
     db.add(log)
     db.commit()  
@@ -13,6 +26,144 @@ def insertar_log(db: Session, id_usuario, id_reserva, mensaje):
     return log
 
 
+def listar_logs(db: Session, id_usuario: str, id_reserva: int = None, desde: datetime = None, hasta: datetime = None, cursor: int = None, limite: int = 50):
+    """
+    Devuelve los logs de un usuario del más reciente al más antiguo, paginados por cursor.
+    cursor es el id_log a partir del cual continuar (exclusivo); None para la primera página.
+    Returns (lista de logs, cursor de la siguiente página o None si no hay más).
+    """
+    consulta = select(Log.id_log, Log.id_reserva, Log.mensaje, Log.fecha_creacion).where(Log.id_usuario == id_usuario)
+
+    if id_reserva is not None:
+        consulta = consulta.where(Log.id_reserva == id_reserva)
+    if desde is not None:
+        consulta = consulta.where(Log.fecha_creacion >= desde)
+    if hasta is not None:
+        consulta = consulta.where(Log.fecha_creacion < hasta)
+    if cursor is not None:
+        consulta = consulta.where(Log.id_log < cursor)
+
+    # Se pide un log de más para saber si hay página siguiente
+    filas = db.execute(consulta.order_by(Log.id_log.desc()).limit(limite + 1)).all()
+    siguiente = filas[limite - 1].id_log if len(filas) > limite else None
+    return [dict(fila._mapping) for fila in filas[:limite]], siguiente
+
+
+def archivar_logs(db: Session, antes_de: datetime, lote: int = 5000) -> int:
+    """
+    Mueve a logs_historico los logs anteriores a antes_de, en lotes de `lote` filas
+    con una transacción por lote para no bloquear la base de datos durante mucho tiempo.
+    Returns el número de logs archivados.
+    """
+    total = 0
+    while True:
+        ids = db.execute(
+            select(Log.id_log).where(Log.fecha_creacion < antes_de).order_by(Log.id_log).limit(lote)
+        ).scalars().all()
+        if not ids:
+            return total
+
+        try:
+            db.execute(insert(LogHistorico).from_select(
+                ["id_log", "mensaje", "fecha_creacion", "id_usuario", "id_reserva"],
+                select(Log.id_log, Log.mensaje, Log.fecha_creacion, Log.id_usuario, Log.id_reserva).where(Log.id_log.in_(ids)),
+            ))
+            db.execute(delete(Log).where(Log.id_log.in_(ids)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        total += len(ids)
+
+
+# Columnas de reservas que se pueden pedir en GET /reservas/
+COLUMNAS_RESERVA = {columna.name: columna for columna in Reserva.__table__.columns}
+
+
+def consulta_reservas(campos: list = None, centro: str = None, dia_semana: str = None, activa: bool = None, cursor: int = None):
+    """
+    Construye la consulta de reservas con las columnas pedidas (todas si campos es None),
+    ordenada por id_reserva y a partir del cursor (exclusivo).
+    id_reserva se incluye siempre porque es el cursor de la paginación.
+    """
+    campos = campos or list(COLUMNAS_RESERVA)
+    desconocidos = [campo for campo in campos if campo not in COLUMNAS_RESERVA]
+    if desconocidos:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Campos desconocidos: {desconocidos}. Campos válidos: {list(COLUMNAS_RESERVA)}"
+        )
+    if "id_reserva" not in campos:
+        campos = ["id_reserva"] + campos
+
+    consulta = select(*(COLUMNAS_RESERVA[campo] for campo in campos))
+    if centro is not None:
+        consulta = consulta.where(Reserva.centro == centro)
+    if dia_semana is not None:
+        consulta = consulta.where(Reserva.dia_semana == dia_semana)
+    if activa is not None:
+        consulta = consulta.where(Reserva.reserva_activa == activa)
+    if cursor is not None:
+        consulta = consulta.where(Reserva.id_reserva > cursor)
+    return consulta.order_by(Reserva.id_reserva)
+
+
+def listar_reservas_pagina(db: Session, consulta, limite: int):
+    """
+    Ejecuta una consulta de consulta_reservas y devuelve una página.
+    Returns (lista de reservas, cursor de la siguiente página o None si no hay más).
+    """
+    filas = db.execute(consulta.limit(limite + 1)).all()
+    siguiente = filas[limite - 1].id_reserva if len(filas) > limite else None
+    return [dict(fila._mapping) for fila in filas[:limite]], siguiente
+
+
+def reserva_confirmada_sql(ahora: datetime):
+    """
+    Equivalente en SQL de reserva_confirmada: faltar 24 horas o menos o haber pasado menos
+    de 1 hora desde la clase se reduce a que la clase sea posterior a ahora - 1 hora.
+    """
+    return case((Reserva.fecha_reserva > ahora - timedelta(hours=1), True), else_=False)
+
+
+def estado_reservas_usuario(db: Session, id_usuario: str, ahora: datetime):
+    """
+    Devuelve (version_reservas, reservas_modificadas, número de reservas confirmadas) del usuario
+    o None si no existe. Las reservas confirmadas cambian con el paso del tiempo aunque
+    no cambie la versión, por eso forman parte del ETag.
+    """
+    confirmadas = (
+        select(func.count())
+        .where(Reserva.id_usuario == id_usuario, Reserva.fecha_reserva > ahora - timedelta(hours=1))
+        .scalar_subquery()
+    )
+    return db.execute(
+        select(Usuario.version_reservas, Usuario.reservas_modificadas, confirmadas).where(Usuario.id_usuario == id_usuario)
+    ).first()
+
+
+def listar_reservas_de_usuario(db: Session, id_usuario: str, ahora: datetime) -> list:
+    """
+    Devuelve las reservas del usuario con la confirmación calculada en la propia consulta.
+    """
+    filas = db.execute(
+        select(
+            Reserva.id_reserva,
+            Reserva.dia_semana,
+            Reserva.hora,
+            Reserva.centro,
+            Reserva.clase,
+            Reserva.reserva_activa.label("activa"),
+            Reserva.fecha_reserva,
+            reserva_confirmada_sql(ahora).label("confirmada"),
+        )
+        .where(Reserva.id_usuario == id_usuario)
+        .order_by(Reserva.id_reserva)
+    ).all()
+    return [dict(fila._mapping) for fila in filas]
+
+
 def reserva_confirmada(reserva: Reserva) -> bool:
     """
     Comprueba si una reserva está confirmada:
@@ -88,6 +239,29 @@ def obtener_usuario_por_reserva(db: Session, id_reserva: int) -> Usuario:
     usuario_reserva = reserva.usuario
     return usuario_reserva
 
+def contraseñas_con_reservas_activas(db: Session, ids_usuario: list) -> dict:
+    """
+    Devuelve {id_usuario: contraseña cifrada} de los usuarios de ids_usuario que tienen alguna reserva activa.
+    """
+    consulta = (
+        select(Usuario.id_usuario, Usuario.contraseña)
+        .where(Usuario.id_usuario.in_(ids_usuario))
+        .where(Usuario.reservas.any(Reserva.reserva_activa.is_(True)))
+    )
+    return {id_usuario: contraseña for id_usuario, contraseña in db.execute(consulta)}
+
+def max_reservas_por_apertura(db: Session) -> int:
+    """
+    Devuelve el mayor número de reservas activas que comparten apertura (día de la semana y hora).
+    """
+    por_apertura = (
+        select(func.count().label("reservas"))
+        .where(Reserva.reserva_activa.is_(True))
+        .group_by(Reserva.dia_semana, Reserva.hora)
+        .subquery()
+    )
+    return db.scalar(select(func.max(por_apertura.c.reservas))) or 0
+
 def reserva_activa(db: Session, id_reserva: int):
     """
         Consulta el estado de la reserva
@@ -157,6 +331,88 @@ def confirmar_reserva(db: Session, id_reserva: int, fecha_reserva: datetime, id_
 
 
 
+def insertar_intento_reserva(db: Session, **campos) -> IntentoReserva:
+    """
+    Guarda una ejecución de una reserva en intentos_reserva. Un fallo al guardarla
+    no debe afectar a la reserva, así que solo se informa del error.
+    """
+    intento = IntentoReserva(**campos)
+    db.add(intento)
+    try:
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Error al guardar el intento de la reserva {campos.get('id_reserva')}: {e}")
+    return intento
+
+
+# Fases de intentos_reserva cuyos percentiles se devuelven en las estadísticas
+FASES_INTENTO = {
+    "descifrado": IntentoReserva.ms_descifrado,
+    "autenticacion": IntentoReserva.ms_autenticacion,
+    "busqueda": IntentoReserva.ms_busqueda,
+    "creacion": IntentoReserva.ms_creacion,
+    "selenium": IntentoReserva.ms_selenium,
+    "hasta_reserva": IntentoReserva.ms_hasta_reserva,
+}
+
+
+def percentil(valores: list, p: float):
+    """
+    Percentil p (0-100) por el método del rango más cercano. valores debe estar ordenado.
+    """
+    if not valores:
+        return None
+    rango = max(1, -(-len(valores) * p // 100))  # ceil(n * p / 100)
+    return valores[int(rango) - 1]
+
+
+def estadisticas_intentos(db: Session, desde: datetime, hasta: datetime, centro: str = None, backend: str = None) -> list:
+    """
+    Resume por centro y clase los intentos de reserva cuya apertura está en [desde, hasta):
+    número de intentos, éxitos y percentiles p50/p95 (ms) del tiempo hasta la reserva y de cada fase.
+    El tiempo hasta la reserva solo cuenta los intentos con éxito.
+    """
+    consulta = select(IntentoReserva.centro, IntentoReserva.clase, IntentoReserva.resultado, *FASES_INTENTO.values()).where(
+        IntentoReserva.programada_para >= desde,
+        IntentoReserva.programada_para < hasta,
+    )
+    if centro is not None:
+        consulta = consulta.where(IntentoReserva.centro == centro)
+    if backend is not None:
+        consulta = consulta.where(IntentoReserva.backend == backend)
+
+    grupos = {}
+    for fila in db.execute(consulta):
+        grupo = grupos.setdefault((fila.centro, fila.clase), {"intentos": 0, "exitos": 0, "fases": {fase: [] for fase in FASES_INTENTO}})
+        grupo["intentos"] += 1
+        exito = fila.resultado == "exito"
+        grupo["exitos"] += exito
+        for fase, columna in FASES_INTENTO.items():
+            valor = getattr(fila, columna.key)
+            if valor is not None and (exito or fase != "hasta_reserva"):
+                grupo["fases"][fase].append(valor)
+
+    estadisticas = []
+    for (centro_grupo, clase), grupo in sorted(grupos.items()):
+        fases = {}
+        for fase, valores in grupo["fases"].items():
+            if valores:
+                valores.sort()
+                fases[fase] = {"p50_ms": percentil(valores, 50), "p95_ms": percentil(valores, 95), "muestras": len(valores)}
+        hasta_reserva = fases.get("hasta_reserva", {})
+        estadisticas.append({
+            "centro": centro_grupo,
+            "clase": clase,
+            "intentos": grupo["intentos"],
+            "exitos": grupo["exitos"],
+            "p50_ms": hasta_reserva.get("p50_ms"),
+            "p95_ms": hasta_reserva.get("p95_ms"),
+            "fases": fases,
+        })
+    return estadisticas
+
+
 # Esta función guarda el objeto que recibe como parámetro en la base de datos.
 # Trata de evitar código repetido.
 def guardar_en_db(db: Session, obj: object):
@@ -179,6 +435,9 @@ def actualizar_contraseña_usuario(db: Session, usuario: Usuario, nueva_contrase
     try:
         db.commit()
         db.refresh(usuario)
+        # El usuario en caché tiene la contraseña anterior, y un login reciente con ella ya no vale
+        principal_cache.invalidate(usuario.id_usuario)
+        login_cache.olvidar(usuario.id_usuario)
     except IntegrityError:
         db.rollback()
         raise HTTPException(
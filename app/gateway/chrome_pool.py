@@ -0,0 +1,226 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+load_dotenv()
+
+CHROMEDRIVER_PATH = os.getenv("CHROMEDRIVER_PATH", "/usr/bin/chromedriver")
+# Máximo de navegadores abiertos a la vez (en uso o libres)
+CHROME_POOL_MAXIMO = int(os.getenv("CHROME_POOL_MAXIMO", "2"))
+# Navegadores que se arrancan al iniciar el scheduler
+CHROME_POOL_PRECALENTAR = int(os.getenv("CHROME_POOL_PRECALENTAR", "1"))
+# Un navegador se cierra y se sustituye tras este número de usos o si supera esta memoria (MB)
+CHROME_MAX_USOS = int(os.getenv("CHROME_MAX_USOS", "50"))
+CHROME_MEMORIA_MAX_MB = float(os.getenv("CHROME_MEMORIA_MAX_MB", "1024"))
+# Segundos máximos de espera por un navegador libre
+CHROME_POOL_ESPERA = float(os.getenv("CHROME_POOL_ESPERA", "60"))
+
+# Orígenes cuyos datos se borran al devolver un navegador al pool
+ORIGENES = ["https://gimnasios.vivagym.es"]
+
+
+def _opciones() -> Options:
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # Ejecutar en modo headless
+    chrome_options.add_argument("--no-sandbox")  # Necesario en entornos Docker
+    chrome_options.add_argument("--disable-dev-shm-usage")  # Para evitar errores relacionados con /dev/shm
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-gpu")  # Opcional si no se utiliza GPU
+    return chrome_options
+
+
+def memoria_mb(pid: int) -> float:
+    """
+    Memoria residente (MB) de un proceso y todos sus descendientes, leída de /proc.
+    Devuelve 0 si /proc no está disponible.
+    """
+    hijos = {}
+    try:
+        for entrada in os.listdir("/proc"):
+            if not entrada.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entrada}/stat") as f:
+                    # El nombre del proceso va entre paréntesis y puede contener espacios
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                hijos.setdefault(ppid, []).append(int(entrada))
+            except (OSError, IndexError, ValueError):
+                continue
+    except OSError:
+        return 0.0
+
+    total_kb = 0
+    pendientes = [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        pendientes.extend(hijos.get(actual, []))
+        try:
+            with open(f"/proc/{actual}/status") as f:
+                for linea in f:
+                    if linea.startswith("VmRSS:"):
+                        total_kb += int(linea.split()[1])
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+class SinNavegadorLibre(Exception):
+    """
+    No ha quedado libre ningún navegador del pool en el tiempo de espera.
+    """
+
+
+class _Navegador:
+    def __init__(self):
+        self.driver = webdriver.Chrome(service=Service(CHROMEDRIVER_PATH), options=_opciones())
+        self.usos = 0
+
+    def sano(self) -> bool:
+        try:
+            return self.driver.execute_script("return 1") == 1
+        except WebDriverException:
+            return False
+
+    def memoria_mb(self) -> float:
+        proceso = getattr(self.driver.service, "process", None)
+        return memoria_mb(proceso.pid) if proceso else 0.0
+
+    def limpiar(self):
+        """
+        Deja el navegador como recién abierto: sin cookies ni almacenamiento del gimnasio.
+        """
+        self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        for origen in ORIGENES:
+            self.driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origen, "storageTypes": "all"})
+        self.driver.get("about:blank")
+
+    def cerrar(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            print(f"Error al cerrar el navegador: {e}")
+
+
+class ChromePool:
+    """
+    Pool de navegadores Chrome headless ya arrancados para vg_selenium.
+
+    Cada uso recibe un navegador sin cookies ni datos de la sesión anterior. Los navegadores
+    se comprueban antes de entregarse y se sustituyen tras CHROME_MAX_USOS usos o si superan
+    CHROME_MEMORIA_MAX_MB. Nunca hay más de CHROME_POOL_MAXIMO navegadores abiertos.
+    """
+
+    def __init__(self, maximo: int = CHROME_POOL_MAXIMO, max_usos: int = CHROME_MAX_USOS, memoria_max: float = CHROME_MEMORIA_MAX_MB):
+        self.maximo = maximo
+        self.max_usos = max_usos
+        self.memoria_max = memoria_max
+        self._libres = queue.LifoQueue()
+        self._plazas = threading.BoundedSemaphore(maximo)
+        self._lock = threading.Lock()
+        self._abiertos = 0
+        self._cerrado = False
+
+    def _nuevo(self) -> _Navegador:
+        inicio = time.perf_counter()
+        navegador = _Navegador()
+        with self._lock:
+            self._abiertos += 1
+        print(f"Navegador Chrome arrancado en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return navegador
+
+    def _descartar(self, navegador: _Navegador):
+        navegador.cerrar()
+        with self._lock:
+            self._abiertos -= 1
+
+    def _obtener(self) -> _Navegador:
+        while True:
+            try:
+                navegador = self._libres.get_nowait()
+            except queue.Empty:
+                return self._nuevo()
+            if navegador.sano():
+                return navegador
+            print("Navegador del pool no responde. Se sustituye.")
+            self._descartar(navegador)
+
+    def _devolver(self, navegador: _Navegador):
+        navegador.usos += 1
+        if self._cerrado or navegador.usos >= self.max_usos:
+            self._descartar(navegador)
+            return
+
+        memoria = navegador.memoria_mb()
+        if self.memoria_max and memoria > self.memoria_max:
+            print(f"Navegador con {memoria:.0f} MB tras {navegador.usos} usos. Se recicla.")
+            self._descartar(navegador)
+            return
+
+        try:
+            navegador.limpiar()
+        except WebDriverException as e:
+            print(f"Error al limpiar el navegador: {e}")
+            self._descartar(navegador)
+            return
+        self._libres.put(navegador)
+
+    @contextmanager
+    def driver(self, espera: float = CHROME_POOL_ESPERA):
+        """
+        Presta un driver del pool durante el bloque with y lo devuelve al terminar.
+        Lanza SinNavegadorLibre si no queda ninguno libre tras `espera` segundos.
+        """
+        if not self._plazas.acquire(timeout=espera):
+            raise SinNavegadorLibre(f"No hay navegadores libres tras {espera} s")
+        try:
+            navegador = self._obtener()
+            try:
+                yield navegador.driver
+            finally:
+                self._devolver(navegador)
+        finally:
+            self._plazas.release()
+
+    def precalentar(self, cantidad: int = CHROME_POOL_PRECALENTAR):
+        """
+        Arranca navegadores hasta tener `cantidad` libres, sin superar el máximo del pool.
+        """
+        for _ in range(min(cantidad, self.maximo)):
+            if not self._plazas.acquire(blocking=False):
+                return
+            try:
+                with self._lock:
+                    if self._abiertos >= min(cantidad, self.maximo):
+                        return
+                self._libres.put(self._nuevo())
+            except Exception as e:
+                print(f"Error al precalentar el pool de navegadores: {e}")
+                return
+            finally:
+                self._plazas.release()
+
+    def cerrar(self):
+        self._cerrado = True
+        while True:
+            try:
+                self._descartar(self._libres.get_nowait())
+            except queue.Empty:
+                return
+
+    def estado(self) -> dict:
+        with self._lock:
+            return {"abiertos": self._abiertos, "libres": self._libres.qsize(), "maximo": self.maximo}
+
+
+# Pool compartido por todo el proceso
+chrome_pool = ChromePool()
+atexit.register(chrome_pool.cerrar)
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Fallos consecutivos que abren el circuito y segundos que permanece abierto antes de probar de nuevo
+CIRCUITO_UMBRAL_FALLOS = int(os.getenv("CIRCUITO_UMBRAL_FALLOS", "5"))
+CIRCUITO_ESPERA_SEGUNDOS = float(os.getenv("CIRCUITO_ESPERA_SEGUNDOS", "30"))
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+
+def es_fallo_backend(estado) -> bool:
+    """
+    Indica si el estado de una petición al gimnasio (código HTTP, "timeout" o "conexion")
+    se debe a que el servicio no está disponible, y no a la propia reserva o al usuario.
+    """
+    if estado in ("timeout", "conexion"):
+        return True
+    return isinstance(estado, int) and estado >= 500
+
+
+class CircuitBreaker:
+    """
+    Circuito por backend de reservas (API o Selenium).
+
+    - Cerrado: se usa el backend. Tras `umbral` fallos consecutivos se abre.
+    - Abierto: no se usa el backend durante `espera` segundos; las reservas fallan al instante
+      o se desvían a otro backend en lugar de esperar a un timeout.
+    - Semiabierto: pasada la espera se deja pasar una única reserva de prueba. Si sale bien
+      el circuito se cierra y si falla vuelve a abrirse.
+    """
+
+    def __init__(self, nombre: str, umbral: int = CIRCUITO_UMBRAL_FALLOS, espera: float = CIRCUITO_ESPERA_SEGUNDOS):
+        self.nombre = nombre
+        self.umbral = umbral
+        self.espera = espera
+        self.estado = CERRADO
+        self._fallos = 0
+        self._abierto_hasta = 0.0
+        self._prueba_desde = None  # Inicio de la reserva de prueba en curso en estado semiabierto
+        self._lock = threading.Lock()
+
+    def permite(self) -> bool:
+        """
+        Indica si se puede usar el backend. Cada llamada que devuelve True debe
+        seguirse de exito(), fallo() o registrar() con el resultado.
+        """
+        with self._lock:
+            if self.estado == CERRADO:
+                return True
+            if self.estado == ABIERTO and time.monotonic() >= self._abierto_hasta:
+                self._cambiar(SEMIABIERTO)
+            # Si la prueba no informa de su resultado (p. ej. por una excepción) se permite otra
+            ahora = time.monotonic()
+            if self.estado == SEMIABIERTO and (self._prueba_desde is None or ahora - self._prueba_desde > self.espera):
+                self._prueba_desde = ahora
+                return True
+            return False
+
+    def exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._prueba_desde = None
+            if self.estado != CERRADO:
+                self._cambiar(CERRADO)
+
+    def fallo(self):
+        with self._lock:
+            self._fallos += 1
+            self._prueba_desde = None
+            if self.estado == SEMIABIERTO or self._fallos >= self.umbral:
+                self._abierto_hasta = time.monotonic() + self.espera
+                if self.estado != ABIERTO:
+                    self._cambiar(ABIERTO)
+
+    def registrar(self, estado) -> bool:
+        """
+        Registra el resultado a partir del estado de la última petición al backend.
+        Returns True si ha sido un fallo del backend.
+        """
+        if es_fallo_backend(estado):
+            self.fallo()
+            return True
+        self.exito()
+        return False
+
+    def _cambiar(self, estado: str):
+        print(f"Circuito {self.nombre}: {self.estado} -> {estado} ({self._fallos} fallos consecutivos)")
+        self.estado = estado
+
+
+# Un circuito por backend, compartido por todas las reservas del proceso
+circuito_api = CircuitBreaker("api")
+circuito_selenium = CircuitBreaker("selenium")
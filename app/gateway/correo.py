@@ -1,9 +1,11 @@
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 from app.reserva import CENTROS
-from datetime import datetime 
+from app.database import CorreoPendiente, SessionLocal
+from datetime import datetime, timedelta
 import os
 
 # Cargar las variables de entorno
@@ -15,10 +17,42 @@ EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
 SMTP_SERVER = os.getenv('SMTP_SERVER')
 SMTP_PORT = os.getenv('SMTP_PORT')
 SEND_TO_EMAIL = os.getenv('SEND_TO_EMAIL')
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'  # False solo para servidores SMTP locales de prueba
 
-# Funcion para notificar reserva por correo electronico
+# Configuración de la bandeja de salida
+OUTBOX_INTERVALO = float(os.getenv('OUTBOX_INTERVALO', '10'))  # Segundos entre revisiones de correos pendientes
+OUTBOX_LOTE = int(os.getenv('OUTBOX_LOTE', '50'))  # Correos enviados por cada sesión SMTP
+OUTBOX_MAX_INTENTOS = int(os.getenv('OUTBOX_MAX_INTENTOS', '5'))
+OUTBOX_BACKOFF = float(os.getenv('OUTBOX_BACKOFF', '30'))  # Segundos de espera tras el primer fallo, se duplica en cada intento
+OUTBOX_BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX', '3600'))
+
+# Despierta al hilo de envío cuando se encola un correo en este proceso
+_hay_correos = threading.Event()
+_hilo_envio = None
+
+
+# Funcion para notificar reserva por correo electronico.
+# El correo se guarda en la bandeja de salida y lo envía el hilo de envío, así la reserva no espera al servidor SMTP.
 def send_email(email, center, date, class_name, hour):
-    
+    subject, body = construir_correo(center, date, class_name, hour)
+    try:
+        encolar_correo(email, subject, body)
+        print("Correo de confirmacion encolado.")
+    except Exception as e:
+        print("Error al encolar el correo:", e)
+
+
+def encolar_correo(destinatario, asunto, cuerpo):
+    with SessionLocal() as db:
+        db.add(CorreoPendiente(destinatario=destinatario, asunto=asunto, cuerpo=cuerpo))
+        db.commit()
+    _hay_correos.set()
+
+
+def construir_correo(center, date, class_name, hour):
+    """
+    Returns (asunto, cuerpo HTML) del correo de confirmación de una reserva.
+    """
     center_name = next((name for name, code in CENTROS.items() if code == center), None)
 
     if not center_name:
@@ -73,21 +107,115 @@ def send_email(email, center, date, class_name, hour):
     </html>
     """
 
+    return subject, body
+
+
+def _mensaje(correo: CorreoPendiente) -> MIMEMultipart:
     msg = MIMEMultipart()
     msg['From'] = EMAIL_ADDRESS
-    msg['To'] = email
-    msg['Subject'] = subject
+    msg['To'] = correo.destinatario
+    msg['Subject'] = correo.asunto
 
-    msg.attach(MIMEText(body, 'html'))  # Cambio de 'plain' a 'html'
+    msg.attach(MIMEText(correo.cuerpo, 'html'))  # Cambio de 'plain' a 'html'
+    return msg
 
-    try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()  
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.send_message(msg)
-            print("Correo de confirmacion enviado.")
-    except Exception as e:
-        print("Error al enviar el correo:", e)
 
-# Llamada de prueba a la fun
-#send_email("Centro Deportivo", "2024-10-20", "Yoga", "15:10")
+def enviar_pendientes(lote: int = OUTBOX_LOTE) -> int:
+    """
+    Envía un lote de correos pendientes usando una única sesión SMTP.
+    Los correos que fallan se reprograman con backoff exponencial; al llegar a
+    OUTBOX_MAX_INTENTOS se marcan como fallidos (fecha_fallo) y dejan de estar pendientes.
+    Returns el número de correos procesados.
+    """
+    ahora = datetime.now()
+    with SessionLocal() as db:
+        correos = (
+            db.query(CorreoPendiente)
+            .filter(
+                CorreoPendiente.fecha_envio.is_(None),
+                CorreoPendiente.fecha_fallo.is_(None),
+                CorreoPendiente.proximo_intento <= ahora,
+                CorreoPendiente.intentos < OUTBOX_MAX_INTENTOS,
+            )
+            .order_by(CorreoPendiente.proximo_intento)
+            .limit(lote)
+            .all()
+        )
+        if not correos:
+            return 0
+
+        server = None
+        try:
+            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+            if SMTP_STARTTLS:
+                server.starttls()
+            # Tras STARTTLS hay que repetir el EHLO para conocer las extensiones del servidor.
+            # Sin credenciales, o si el servidor no ofrece AUTH (p. ej. uno local de prueba), no se autentica.
+            server.ehlo_or_helo_if_needed()
+            if EMAIL_ADDRESS and EMAIL_PASSWORD and server.has_extn("auth"):
+                server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+        except Exception as e:
+            # Sin conexión con el servidor no se puede enviar ninguno: se reprograma todo el lote
+            print("Error al conectar con el servidor de correo:", e)
+            for correo in correos:
+                _reprogramar(correo, e)
+            db.commit()
+            return len(correos)
+
+        try:
+            for correo in correos:
+                try:
+                    server.send_message(_mensaje(correo))
+                    correo.fecha_envio = datetime.now()
+                    correo.error = None
+                except smtplib.SMTPServerDisconnected as e:
+                    # Se reintenta el resto del lote en la siguiente pasada
+                    _reprogramar(correo, e)
+                    break
+                except Exception as e:
+                    _reprogramar(correo, e)
+        finally:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+        enviados = sum(1 for correo in correos if correo.fecha_envio is not None)
+        db.commit()
+
+    print(f"Correos de confirmacion enviados: {enviados}/{len(correos)}")
+    return len(correos)
+
+
+def _reprogramar(correo: CorreoPendiente, error: Exception):
+    correo.intentos += 1
+    correo.error = str(error)
+    if correo.intentos >= OUTBOX_MAX_INTENTOS:
+        correo.fecha_fallo = datetime.now()
+        print(f"Correo {correo.id_correo} a {correo.destinatario} descartado tras {correo.intentos} intentos: {error}")
+        return
+    espera = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF * 2 ** (correo.intentos - 1))
+    correo.proximo_intento = datetime.now() + timedelta(seconds=espera)
+
+
+def _bucle_envio():
+    while True:
+        _hay_correos.wait(OUTBOX_INTERVALO)
+        _hay_correos.clear()
+        try:
+            # Mientras se llenen lotes completos quedan correos por enviar
+            while enviar_pendientes() >= OUTBOX_LOTE:
+                pass
+        except Exception as e:
+            print("Error en el envío de correos pendientes:", e)
+
+
+def iniciar_outbox():
+    """
+    Arranca el hilo que envía los correos de la bandeja de salida. Debe ejecutarse
+    solo en el proceso que ejecuta las reservas.
+    """
+    global _hilo_envio
+    if _hilo_envio is None:
+        _hilo_envio = threading.Thread(target=_bucle_envio, name="outbox-correo", daemon=True)
+        _hilo_envio.start()
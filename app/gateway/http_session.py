@@ -0,0 +1,243 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util.connection import create_connection
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tamaño del pool de conexiones keep-alive. POOL_MAXSIZE debería ser al menos el número
+# de reservas que se disparan a la vez, si no urllib3 descarta las conexiones sobrantes.
+POOL_CONNECTIONS = int(os.getenv("VG_POOL_CONNECTIONS", "4"))
+POOL_MAXSIZE = int(os.getenv("VG_POOL_MAXSIZE", "50"))
+# Si es True, las peticiones esperan a que quede una conexión libre en lugar de abrir una nueva
+POOL_BLOCK = os.getenv("VG_POOL_BLOCK", "false").lower() == "true"
+
+# Conexiones simultáneas del cliente asíncrono y uso de HTTP/2 (requiere el paquete h2)
+ASYNC_MAX_CONNECTIONS = int(os.getenv("VG_ASYNC_MAX_CONNECTIONS", "100"))
+HTTP2 = os.getenv("VG_HTTP2", "false").lower() == "true"
+
+# Segundos durante los que se reutiliza la resolución DNS del gimnasio (0 la desactiva)
+DNS_CACHE_TTL = float(os.getenv("VG_DNS_CACHE_TTL", "300"))
+
+# Timeouts (conexión, lectura) en segundos por tipo de endpoint
+CONNECT_TIMEOUT = float(os.getenv("VG_CONNECT_TIMEOUT", "3"))
+TIMEOUTS = {
+    "login": (CONNECT_TIMEOUT, float(os.getenv("VG_TIMEOUT_LOGIN", "5"))),
+    "search": (CONNECT_TIMEOUT, float(os.getenv("VG_TIMEOUT_SEARCH", "5"))),
+    "create": (CONNECT_TIMEOUT, float(os.getenv("VG_TIMEOUT_CREATE", "5"))),
+    "cancel": (CONNECT_TIMEOUT, float(os.getenv("VG_TIMEOUT_CANCEL", "5"))),
+    "warm_up": (CONNECT_TIMEOUT, 3.0),
+}
+
+_session = None
+_session_lock = threading.Lock()
+_async_client = None
+_async_client_lock = threading.Lock()
+
+
+def _sin_cookies() -> DefaultCookiePolicy:
+    """
+    Política que rechaza todas las cookies. El transporte se comparte entre todos los
+    usuarios, así que ninguna cookie de una respuesta debe enviarse en las peticiones de otro:
+    la autenticación va siempre en la cabecera Authorization.
+    """
+    return DefaultCookiePolicy(allowed_domains=[])
+
+
+def get_session() -> requests.Session:
+    """
+    Devuelve la sesión HTTP compartida por todo el proceso. Reutiliza las conexiones
+    TCP/TLS abiertas con el gimnasio en lugar de abrir una por petición.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.cookies.set_policy(_sin_cookies())
+                adapter = _AdaptadorDNS(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=POOL_BLOCK)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"Connection": "keep-alive"})
+                _session = session
+    return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Devuelve el cliente asíncrono compartido. Debe usarse siempre desde el mismo
+    bucle de eventos (el ejecutor asíncrono de reservas).
+    """
+    global _async_client
+    if _async_client is None:
+        with _async_client_lock:
+            if _async_client is None:
+                limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=ASYNC_MAX_CONNECTIONS)
+                transporte = _TransporteDNS(limits=limits, http2=HTTP2)
+                _async_client = httpx.AsyncClient(transport=transporte, cookies=CookieJar(policy=_sin_cookies()), headers={"Connection": "keep-alive"})
+    return _async_client
+
+
+def async_timeout(endpoint: str) -> httpx.Timeout:
+    conexion, lectura = TIMEOUTS[endpoint]
+    return httpx.Timeout(lectura, connect=conexion)
+
+
+def warm_up(url: str, conexiones: int = 1):
+    """
+    Abre (o refresca) conexiones keep-alive contra url antes de una ráfaga de peticiones
+    conocida, para que las reservas no paguen el handshake TCP/TLS en el momento crítico.
+    """
+    def _abrir(_):
+        try:
+            get_session().head(url, timeout=TIMEOUTS["warm_up"])
+        except requests.exceptions.RequestException as e:
+            print(f"Error al precalentar la conexión con {url}: {e}")
+
+    conexiones = max(1, min(conexiones, POOL_MAXSIZE))
+    if conexiones == 1:
+        _abrir(0)
+        return
+    with ThreadPoolExecutor(max_workers=conexiones) as executor:
+        list(executor.map(_abrir, range(conexiones)))
+
+
+# Caché DNS. Solo afecta a los hosts registrados con cache_dns y a las conexiones que abren
+# get_session y get_async_client; el resto del proceso resuelve los nombres como siempre.
+_dns_hosts = set()
+_dns_cache = {}  # host -> (instante de expiración, dirección IP)
+_dns_lock = threading.Lock()
+
+
+def cache_dns(host: str):
+    """
+    Registra un host para cachear su resolución DNS durante DNS_CACHE_TTL segundos.
+    """
+    if DNS_CACHE_TTL <= 0 or not host:
+        return
+    _dns_hosts.add(host)
+
+
+def _direccion_cacheada(host: str):
+    with _dns_lock:
+        entrada = _dns_cache.get(host)
+        if entrada and entrada[0] > time.monotonic():
+            return entrada[1]
+    return None
+
+
+def _guardar_direccion(host: str, direcciones: list) -> str:
+    direccion = direcciones[0][4][0]
+    with _dns_lock:
+        _dns_cache[host] = (time.monotonic() + DNS_CACHE_TTL, direccion)
+    return direccion
+
+
+def _olvidar_direccion(host: str):
+    # Si la conexión con la dirección cacheada falla, la siguiente vuelve a resolver el nombre
+    with _dns_lock:
+        _dns_cache.pop(host, None)
+
+
+def resolver(host: str, port: int) -> str:
+    """
+    Returns la dirección IP cacheada del host si está registrado con cache_dns, o el propio host.
+    """
+    if host not in _dns_hosts:
+        return host
+    return _direccion_cacheada(host) or _guardar_direccion(host, socket.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+
+
+async def resolver_async(host: str, port: int) -> str:
+    if host not in _dns_hosts:
+        return host
+    direccion = _direccion_cacheada(host)
+    if direccion is None:
+        direcciones = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        direccion = _guardar_direccion(host, direcciones)
+    return direccion
+
+
+class _ConexionDNS:
+    """
+    Conexión de urllib3 que abre el socket con la dirección cacheada del host. El nombre
+    del host se sigue usando para el SNI y la verificación del certificado.
+    """
+    def _new_conn(self) -> socket.socket:
+        if self.host not in _dns_hosts:
+            return super()._new_conn()
+
+        try:
+            return create_connection(
+                (resolver(self.host, self.port), self.port),
+                self.timeout,
+                source_address=self.source_address,
+                socket_options=self.socket_options,
+            )
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        except socket.timeout as e:
+            _olvidar_direccion(self.host)
+            raise ConnectTimeoutError(self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})") from e
+        except OSError as e:
+            _olvidar_direccion(self.host)
+            raise NewConnectionError(self, f"Failed to establish a new connection: {e}") from e
+
+
+class _ConexionHTTP(_ConexionDNS, HTTPConnection):
+    pass
+
+
+class _ConexionHTTPS(_ConexionDNS, HTTPSConnection):
+    pass
+
+
+class _PoolHTTP(HTTPConnectionPool):
+    ConnectionCls = _ConexionHTTP
+
+
+class _PoolHTTPS(HTTPSConnectionPool):
+    ConnectionCls = _ConexionHTTPS
+
+
+class _AdaptadorDNS(HTTPAdapter):
+    """
+    Adaptador de requests cuyos pools de conexiones usan la caché DNS.
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _PoolHTTP, "https": _PoolHTTPS}
+
+
+class _TransporteDNS(httpx.AsyncHTTPTransport):
+    """
+    Transporte de httpx que envía las peticiones a los hosts registrados con cache_dns a su
+    dirección cacheada. El nombre del host se mantiene en la cabecera Host y en la extensión
+    sni_hostname, con la que httpcore hace el SNI y la verificación del certificado.
+    """
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        url = request.url
+        if url.host not in _dns_hosts:
+            return await super().handle_async_request(request)
+
+        request.url = url.copy_with(host=await resolver_async(url.host, url.port or (443 if url.scheme == "https" else 80)))
+        request.extensions = {**request.extensions, "sni_hostname": url.host}
+        try:
+            return await super().handle_async_request(request)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            _olvidar_direccion(url.host)
+            raise
+        finally:
+            # La respuesta y los errores muestran la URL original
+            request.url = url
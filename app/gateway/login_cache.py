@@ -0,0 +1,66 @@
+import asyncio
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from app.gateway.token_cache import _huella
+
+load_dotenv()
+
+# Segundos durante los que se recuerda un login correcto (0 lo desactiva)
+LOGIN_RECUERDO = float(os.getenv("LOGIN_RECUERDO_SEGUNDOS", "300"))
+
+
+class LoginCache:
+    """
+    Recuerda durante LOGIN_RECUERDO segundos los logins correctos por (usuario, huella de la
+    contraseña) y agrupa las verificaciones simultáneas contra el gimnasio del mismo usuario
+    y contraseña en una sola petición.
+    """
+
+    def __init__(self, recuerdo: float = LOGIN_RECUERDO):
+        self.recuerdo = recuerdo
+        self._correctos = {}  # usuario -> (huella de la última contraseña correcta, instante de expiración)
+        self._en_curso = {}  # (usuario, huella) -> asyncio.Future
+        self._lock = threading.Lock()
+
+    def reciente(self, username: str, password: str) -> bool:
+        with self._lock:
+            entrada = self._correctos.get(username)
+        return entrada is not None and entrada[0] == _huella(password) and entrada[1] > time.monotonic()
+
+    def recordar(self, username: str, password: str):
+        if self.recuerdo <= 0:
+            return
+        with self._lock:
+            self._correctos[username] = (_huella(password), time.monotonic() + self.recuerdo)
+
+    def olvidar(self, username: str):
+        with self._lock:
+            self._correctos.pop(username, None)
+
+    async def verificar(self, username: str, password: str, autenticar) -> bool:
+        """
+        Comprueba la contraseña con el gimnasio. autenticar es una función sin argumentos que
+        devuelve la corrutina de verificación. Las corrutinas que verifican el mismo usuario
+        y contraseña a la vez comparten su resultado.
+        """
+        clave = (username, _huella(password))
+
+        futuro = self._en_curso.get(clave)
+        if futuro is not None:
+            return await asyncio.shield(futuro)
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_curso[clave] = futuro
+        correcto = False
+        try:
+            correcto = bool(await autenticar())
+            return correcto
+        finally:
+            self._en_curso.pop(clave, None)
+            futuro.set_result(correcto)
+
+
+# Caché compartida por todas las peticiones de login del proceso
+login_cache = LoginCache()
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from app.utils.metricas import ESPERA_RATE_LIMIT
+
+load_dotenv()
+
+RATE_LIMIT_ACTIVO = os.getenv("VG_RATE_LIMIT", "true").lower() == "true"
+
+# Presupuesto global de peticiones al gimnasio (peticiones/s y ráfaga máxima). Los últimos
+# VG_RATE_RESERVA_PRIORITARIA tokens de la ráfaga solo los pueden usar las peticiones de reserva,
+# para que logins y búsquedas no dejen sin hueco a las reservas en la apertura.
+RATE_GLOBAL = float(os.getenv("VG_RATE_GLOBAL", "50"))
+RAFAGA_GLOBAL = float(os.getenv("VG_RATE_GLOBAL_RAFAGA", "100"))
+RESERVA_PRIORITARIA = float(os.getenv("VG_RATE_RESERVA_PRIORITARIA", "30"))
+
+# Presupuesto por tipo de endpoint: (peticiones/s, ráfaga). Una tasa de 0 deja el tipo sin límite propio.
+PRESUPUESTOS = {
+    "login": (float(os.getenv("VG_RATE_LOGIN", "10")), float(os.getenv("VG_RATE_LOGIN_RAFAGA", "20"))),
+    # Logins de los usuarios en la aplicación: presupuesto aparte para no competir con los de las reservas
+    "login_interactivo": (float(os.getenv("VG_RATE_LOGIN_INTERACTIVO", "5")), float(os.getenv("VG_RATE_LOGIN_INTERACTIVO_RAFAGA", "10"))),
+    "search": (float(os.getenv("VG_RATE_SEARCH", "10")), float(os.getenv("VG_RATE_SEARCH_RAFAGA", "20"))),
+    "create": (float(os.getenv("VG_RATE_CREATE", "0")), float(os.getenv("VG_RATE_CREATE_RAFAGA", "0"))),
+    "cancel": (float(os.getenv("VG_RATE_CANCEL", "5")), float(os.getenv("VG_RATE_CANCEL_RAFAGA", "10"))),
+}
+
+# Endpoints que pueden usar la reserva prioritaria del presupuesto global
+PRIORITARIOS = {"create"}
+
+
+class TokenBucket:
+    def __init__(self, tasa: float, rafaga: float):
+        self.tasa = tasa
+        self.rafaga = max(rafaga, 1.0)
+        self.tokens = self.rafaga
+        self._ultimo = time.monotonic()
+
+    def _rellenar(self, ahora: float):
+        self.tokens = min(self.rafaga, self.tokens + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    def espera(self, ahora: float, minimo: float = 0.0) -> float:
+        """
+        Segundos hasta que se pueda tomar un token dejando al menos `minimo` en el cubo.
+        """
+        self._rellenar(ahora)
+        falta = 1 + minimo - self.tokens
+        return 0.0 if falta <= 0 else falta / self.tasa
+
+
+class RateLimiter:
+    """
+    Limitador de peticiones al gimnasio compartido por todo el proceso (hilos y bucle async).
+    Cada petición toma un token del cubo global y otro del cubo de su tipo de endpoint; si no
+    hay, espera lo justo hasta que se rellenen. Guarda métricas de la espera por endpoint.
+    """
+
+    def __init__(self, tasa_global: float = RATE_GLOBAL, rafaga_global: float = RAFAGA_GLOBAL,
+                 reserva_prioritaria: float = RESERVA_PRIORITARIA, presupuestos: dict = PRESUPUESTOS, activo: bool = RATE_LIMIT_ACTIVO):
+        self.activo = activo and tasa_global > 0
+        self._global = TokenBucket(tasa_global, rafaga_global) if tasa_global > 0 else None
+        self.reserva_prioritaria = min(reserva_prioritaria, rafaga_global - 1)
+        self._cubos = {endpoint: TokenBucket(tasa, rafaga) for endpoint, (tasa, rafaga) in presupuestos.items() if tasa > 0}
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _intentar(self, endpoint: str) -> float:
+        """
+        Toma los tokens si están disponibles y devuelve 0, o devuelve los segundos a esperar.
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            minimo = 0.0 if endpoint in PRIORITARIOS else self.reserva_prioritaria
+            espera = self._global.espera(ahora, minimo) if self._global else 0.0
+            cubo = self._cubos.get(endpoint)
+            if cubo is not None:
+                espera = max(espera, cubo.espera(ahora))
+            if espera > 0:
+                return espera
+            if self._global:
+                self._global.tokens -= 1
+            if cubo is not None:
+                cubo.tokens -= 1
+            return 0.0
+
+    def _registrar(self, endpoint: str, esperado: float):
+        ESPERA_RATE_LIMIT.labels(endpoint).observe(esperado)
+        with self._lock:
+            metrica = self._metricas.setdefault(endpoint, {"peticiones": 0, "esperas": 0, "espera_total_s": 0.0, "espera_max_s": 0.0})
+            metrica["peticiones"] += 1
+            # Por debajo de 1 ms no se ha esperado a ningún token, solo al propio lock
+            if esperado > 0.001:
+                metrica["esperas"] += 1
+                metrica["espera_total_s"] += esperado
+                metrica["espera_max_s"] = max(metrica["espera_max_s"], esperado)
+
+    def adquirir(self, endpoint: str) -> float:
+        """
+        Bloquea hasta que la petición al endpoint esté dentro del presupuesto.
+        Returns los segundos esperados.
+        """
+        if not self.activo:
+            return 0.0
+        inicio = time.perf_counter()
+        while (espera := self._intentar(endpoint)) > 0:
+            time.sleep(espera)
+        esperado = time.perf_counter() - inicio
+        self._registrar(endpoint, esperado)
+        return esperado
+
+    async def adquirir_async(self, endpoint: str) -> float:
+        """
+        Versión asíncrona de adquirir: espera sin bloquear el bucle de eventos.
+        """
+        if not self.activo:
+            return 0.0
+        inicio = time.perf_counter()
+        while (espera := self._intentar(endpoint)) > 0:
+            await asyncio.sleep(espera)
+        esperado = time.perf_counter() - inicio
+        self._registrar(endpoint, esperado)
+        return esperado
+
+    def metricas(self) -> dict:
+        """
+        Métricas de espera por endpoint desde el arranque del proceso.
+        """
+        with self._lock:
+            return {
+                endpoint: {
+                    **metrica,
+                    "espera_media_ms": round(metrica["espera_total_s"] / metrica["peticiones"] * 1000, 2) if metrica["peticiones"] else 0.0,
+                }
+                for endpoint, metrica in self._metricas.items()
+            }
+
+
+# Limitador compartido por VG_API y VG_API_Async
+rate_limiter = RateLimiter()
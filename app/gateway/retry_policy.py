@@ -0,0 +1,150 @@
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Estados que indican un error transitorio o una clase que aún no se ha abierto.
+# "timeout" y "conexion" representan errores de red sin respuesta del gimnasio.
+# 409 no se reintenta: el usuario ya tiene la reserva y repetirla no la crea.
+# 400 tampoco: es una petición inválida y repetirla no cambia la respuesta.
+ESTADOS_REINTENTABLES = os.getenv("RESERVA_ESTADOS_REINTENTABLES", "timeout,conexion,408,425,429,500,502,503,504")
+
+# Sin respuesta del gimnasio la reserva pudo crearse igualmente: antes de repetirla se busca
+ESTADOS_SIN_RESPUESTA = ("timeout", "conexion")
+
+
+def segundos_retry_after(valor):
+    """
+    Segundos que indica la cabecera Retry-After (en segundos o como fecha HTTP).
+    Returns None si no hay cabecera o no se puede interpretar.
+    """
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        fecha = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (fecha - datetime.now(fecha.tzinfo)).total_seconds())
+
+
+class RetryPolicy:
+    """
+    Política de reintentos del disparo de una reserva: reintentos rápidos con backoff
+    exponencial y jitter durante una ventana de segundos tras la apertura.
+
+    - Si el gimnasio indica Retry-After (p. ej. con 429) no se reintenta antes de ese plazo.
+    - Tras un timeout o un error de conexión, antes de repetir la reserva (y antes de darla
+      por fallida) se busca en el horario si ya se creó, para no duplicarla.
+    """
+
+    def __init__(self, ventana: float, base: float, maximo: float, jitter: float, max_intentos: int, estados: str = ESTADOS_REINTENTABLES):
+        self.ventana = ventana
+        self.base = base
+        self.maximo = maximo
+        self.jitter = jitter
+        self.max_intentos = max_intentos
+        self.estados = {estado.strip() for estado in estados.split(",") if estado.strip()}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ventana=float(os.getenv("RESERVA_REINTENTO_VENTANA", "10")),
+            base=float(os.getenv("RESERVA_REINTENTO_BASE", "0.2")),
+            maximo=float(os.getenv("RESERVA_REINTENTO_MAX", "2")),
+            jitter=float(os.getenv("RESERVA_REINTENTO_JITTER", "0.5")),
+            max_intentos=int(os.getenv("RESERVA_REINTENTO_MAX_INTENTOS", "20")),
+        )
+
+    def es_reintentable(self, estado) -> bool:
+        return estado is not None and str(estado) in self.estados
+
+    def espera(self, intento: int) -> float:
+        """
+        Segundos de espera antes del siguiente intento, con jitter para que las reservas
+        que fallan a la vez no vuelvan a llegar juntas al gimnasio.
+        """
+        espera = min(self.maximo, self.base * 2 ** (intento - 1))
+        return espera * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _siguiente_espera(self, intento: int, estado, limite: datetime, retry_after: float = None):
+        """
+        Devuelve los segundos a esperar antes de reintentar o None si no se debe reintentar.
+        """
+        if not self.es_reintentable(estado) or intento >= self.max_intentos:
+            return None
+        espera = self.espera(intento)
+        if retry_after is not None:
+            espera = max(espera, retry_after)
+        if datetime.now() + timedelta(seconds=espera) > limite:
+            return None
+        return espera
+
+    def run(self, vg_api, payload: dict, apertura: datetime = None, fecha: str = None):
+        """
+        Envía la reserva con reintentos hasta que se cree, el error sea definitivo
+        o se agote la ventana contada desde la apertura (o desde ahora si no hay apertura).
+        fecha es el día de la clase (YYYY-MM-DD), necesario para comprobar si una reserva
+        sin respuesta se llegó a crear; sin ella se repite directamente.
+        Returns (participation_id o None, número de intentos).
+        """
+        limite = (apertura or datetime.now()) + timedelta(seconds=self.ventana)
+        intento = 0
+        while True:
+            intento += 1
+            participation_id = vg_api.commit_booking(payload)
+            if participation_id is not None:
+                return participation_id, intento
+
+            estado = vg_api.last_booking_status
+            espera = self._siguiente_espera(intento, estado, limite, vg_api.last_retry_after)
+            if espera is not None:
+                print(f"Intento {intento} de reserva fallido (estado {estado}). Reintentando en {espera:.2f} s")
+                time.sleep(espera)
+
+            # Sin respuesta, tanto antes de repetir la reserva como antes de darla por fallida
+            if estado in ESTADOS_SIN_RESPUESTA and fecha is not None:
+                participation_id = vg_api.find_participation(payload["selectedUserCenterId"], fecha, payload["bookingId"])
+                if participation_id is not None:
+                    print(f"La reserva del intento {intento} se creó aunque no llegó la respuesta. No se repite.")
+                    return participation_id, intento
+
+            if espera is None:
+                print(f"Intento {intento} de reserva fallido (estado {estado}). No se reintenta.")
+                return None, intento
+
+    async def run_async(self, vg_api, payload: dict, apertura: datetime = None, fecha: str = None):
+        """
+        Versión asíncrona de run para VG_API_Async.
+        """
+        limite = (apertura or datetime.now()) + timedelta(seconds=self.ventana)
+        intento = 0
+        while True:
+            intento += 1
+            participation_id = await vg_api.commit_booking(payload)
+            if participation_id is not None:
+                return participation_id, intento
+
+            estado = vg_api.last_booking_status
+            espera = self._siguiente_espera(intento, estado, limite, vg_api.last_retry_after)
+            if espera is not None:
+                print(f"Intento {intento} de reserva fallido (estado {estado}). Reintentando en {espera:.2f} s")
+                await asyncio.sleep(espera)
+
+            if estado in ESTADOS_SIN_RESPUESTA and fecha is not None:
+                participation_id = await vg_api.find_participation(payload["selectedUserCenterId"], fecha, payload["bookingId"])
+                if participation_id is not None:
+                    print(f"La reserva del intento {intento} se creó aunque no llegó la respuesta. No se repite.")
+                    return participation_id, intento
+
+            if espera is None:
+                print(f"Intento {intento} de reserva fallido (estado {estado}). No se reintenta.")
+                return None, intento
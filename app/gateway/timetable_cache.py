@@ -0,0 +1,226 @@
+import asyncio
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Segundos durante los que se reutiliza el horario de un centro para una fecha
+TIMETABLE_TTL = float(os.getenv("VG_TIMETABLE_TTL", "300"))
+
+
+# Un horario en caché que no contiene la clase buscada solo se vuelve a descargar si tiene
+# más de estos segundos: la clase puede haberse publicado después, pero una clase inexistente
+# no debe costar una búsqueda por reserva.
+TIMETABLE_REFRESCO = float(os.getenv("VG_TIMETABLE_REFRESCO", "60"))
+
+
+class _Peticion:
+    """
+    Descarga en curso de un horario. El resto de hilos y corrutinas que piden el mismo
+    (centro, fecha) esperan a que termine y reutilizan su resultado.
+    """
+    def __init__(self):
+        self.evento = threading.Event()
+        self.indice = None
+        self.estado = None
+        self._futuros = []  # (bucle de eventos, futuro) de las corrutinas que esperan
+        self._lock = threading.Lock()
+
+    def esperar_async(self) -> asyncio.Future:
+        futuro = asyncio.get_running_loop().create_future()
+        with self._lock:
+            if self.evento.is_set():
+                futuro.set_result(None)
+            else:
+                self._futuros.append((asyncio.get_running_loop(), futuro))
+        return futuro
+
+    def terminar(self, indice, estado):
+        self.indice = indice
+        self.estado = estado
+        with self._lock:
+            self.evento.set()
+            futuros, self._futuros = self._futuros, []
+        for bucle, futuro in futuros:
+            bucle.call_soon_threadsafe(_resolver, futuro)
+
+
+def _resolver(futuro: asyncio.Future):
+    if not futuro.done():
+        futuro.set_result(None)
+
+
+class TimetableCache:
+    """
+    Caché en memoria del horario de clases por (centro, fecha).
+
+    Cada entrada guarda un índice {(nombre de la clase, hora de inicio): id de la clase}
+    para resolver el booking_id en O(1). Las descargas concurrentes del mismo horario,
+    desde hilos o desde el bucle de eventos, se agrupan en una sola petición HTTP.
+    Las entradas caducadas se eliminan al leerlas y cada vez que se guarda un horario nuevo.
+    """
+
+    def __init__(self, ttl: float = TIMETABLE_TTL):
+        self.ttl = ttl
+        self._entradas = {}  # (centro, fecha) -> (instante de expiración, índice)
+        self._en_curso = {}  # (centro, fecha) -> _Peticion
+        self._lock = threading.Lock()
+
+    def get_index(self, center, date: str, fetch):
+        """
+        Devuelve el índice de clases del centro para la fecha indicada.
+        fetch es la función que descarga el horario si no está en caché y devuelve
+        (respuesta, estado de la petición: código HTTP, "timeout" o "conexion").
+        Returns (dict o None si no se pudo obtener el horario, estado de la descarga
+        o None si el horario estaba en caché). Los que esperan a otra descarga
+        reciben el estado de esa descarga.
+        """
+        clave = (str(center), date)
+        indice, peticion, propietario = self._consultar(clave)
+        if peticion is None:
+            return indice, None
+
+        if not propietario:
+            # Otro hilo o corrutina ya está descargando este horario
+            peticion.evento.wait()
+            return peticion.indice, peticion.estado
+
+        indice = estado = None
+        try:
+            respuesta, estado = fetch()
+            indice = self._guardar(clave, respuesta)
+            return indice, estado
+        finally:
+            self._terminar(clave, peticion, indice, estado)
+
+    async def get_index_async(self, center, date: str, fetch):
+        """
+        Versión asíncrona de get_index. fetch es una corrutina que descarga el horario y
+        devuelve (respuesta, estado). Comparte las descargas en curso con get_index.
+        """
+        clave = (str(center), date)
+        indice, peticion, propietario = self._consultar(clave)
+        if peticion is None:
+            return indice, None
+
+        if not propietario:
+            await peticion.esperar_async()
+            return peticion.indice, peticion.estado
+
+        indice = estado = None
+        try:
+            respuesta, estado = await fetch()
+            indice = self._guardar(clave, respuesta)
+            return indice, estado
+        finally:
+            self._terminar(clave, peticion, indice, estado)
+
+    def expire_if_older(self, center, date: str, edad: float = TIMETABLE_REFRESCO) -> bool:
+        """
+        Elimina el horario de un (centro, fecha) si se descargó hace más de `edad` segundos.
+        Returns True si el horario ya no está en caché (eliminado ahora, por otro o caducado),
+        es decir, si get_index lo descargará de nuevo o esperará a la descarga en curso.
+        """
+        clave = (str(center), date)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return True
+            if entrada[0] - self.ttl > time.monotonic() - edad:
+                return False
+            del self._entradas[clave]
+            return True
+
+    def invalidate(self, center=None, date: str = None):
+        """
+        Elimina el horario de un (centro, fecha). Sin fecha elimina todas las fechas del
+        centro y sin argumentos vacía toda la caché.
+        """
+        with self._lock:
+            if center is None and date is None:
+                self._entradas.clear()
+            elif date is None:
+                for clave in [clave for clave in self._entradas if clave[0] == str(center)]:
+                    del self._entradas[clave]
+            else:
+                self._entradas.pop((str(center), date), None)
+
+    def _vigente(self, clave):
+        # Debe llamarse con self._lock adquirido. Elimina la entrada si ha caducado.
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        if entrada[0] <= time.monotonic():
+            del self._entradas[clave]
+            return None
+        return entrada[1]
+
+    def _consultar(self, clave):
+        """
+        Returns (índice, None, False) si el horario está en caché, o (None, petición, propietario)
+        con la descarga en curso; si propietario es True la descarga le corresponde al llamante.
+        """
+        with self._lock:
+            indice = self._vigente(clave)
+            if indice is not None:
+                return indice, None, False
+
+            peticion = self._en_curso.get(clave)
+            if peticion is not None:
+                return None, peticion, False
+            peticion = self._en_curso[clave] = _Peticion()
+            return None, peticion, True
+
+    def _guardar(self, clave, respuesta):
+        indice = build_index(respuesta)
+        if indice is None:
+            return None
+        ahora = time.monotonic()
+        with self._lock:
+            for caducada in [c for c, (expira, _) in self._entradas.items() if expira <= ahora]:
+                del self._entradas[caducada]
+            self._entradas[clave] = (ahora + self.ttl, indice)
+        return indice
+
+    def _terminar(self, clave, peticion: _Peticion, indice, estado):
+        with self._lock:
+            self._en_curso.pop(clave, None)
+        peticion.terminar(indice, estado)
+
+
+def build_index(response):
+    """
+    Construye el índice {(nombre, hora de inicio): id} a partir de la respuesta de
+    search-booking-participations. Si una clase aparece repetida se queda la primera.
+    """
+    if not response or not isinstance(response, list):
+        return None
+
+    indice = {}
+    for elem in response:
+        booking = elem.get("booking", {})
+        clave = (booking.get("name"), booking.get("startTime"))
+        if booking.get("id") is not None and clave not in indice:
+            indice[clave] = booking.get("id")
+    return indice
+
+
+def find_participation_id(response, booking_id):
+    """
+    Busca en la respuesta de search-booking-participations la participación del usuario
+    autenticado en la clase booking_id. Returns su id o None si no está apuntado.
+    """
+    if not response or not isinstance(response, list):
+        return None
+
+    for elem in response:
+        if elem.get("booking", {}).get("id") == booking_id:
+            participacion = elem.get("participation") or {}
+            return participacion.get("id")
+    return None
+
+
+# Caché compartida por todas las instancias de VG_API del proceso
+timetable_cache = TimetableCache()
@@ -0,0 +1,114 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from app.utils.fernet_encryption import descifrar_contraseña
+
+load_dotenv()
+
+# Vigencia que se asume para el token del gimnasio cuando no se puede leer su expiración
+TOKEN_TTL = float(os.getenv("VG_TOKEN_TTL", "43200"))
+# Un token que expira antes de este margen (segundos) ya no se usa en una reserva
+TOKEN_MARGEN = float(os.getenv("VG_TOKEN_MARGEN", "300"))
+
+
+def _huella(contraseña: str) -> str:
+    return hashlib.sha256(contraseña.encode("utf-8")).hexdigest()
+
+
+def token_expiration(token: str):
+    """
+    Devuelve el instante de expiración (epoch) del token si es un JWT con claim exp, o None.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenCache:
+    """
+    Caché por usuario del token del gimnasio junto con su userId, centerId y expiración.
+    Las entradas solo se devuelven si la contraseña coincide con la que se usó para obtenerlas.
+    De la contraseña solo se guarda su huella: para renovar un token hay que volver a leerla
+    cifrada de la base de datos (ver VG_API.refresh_cached_tokens).
+    """
+
+    def __init__(self, margen: float = TOKEN_MARGEN):
+        self.margen = margen
+        self._entradas = {}  # username -> dict
+        self._lock = threading.Lock()
+
+    def get(self, username: str, password: str):
+        with self._lock:
+            entrada = self._entradas.get(username)
+        if entrada is None or entrada["huella"] != _huella(password):
+            return None
+        if entrada["expira"] - time.time() < self.margen:
+            return None
+        return entrada
+
+    def store(self, username: str, password: str, token: str, user_id, center_id):
+        expira = token_expiration(token) or time.time() + TOKEN_TTL
+        with self._lock:
+            self._entradas[username] = {
+                "token": token,
+                "user_id": user_id,
+                "center_id": center_id,
+                "expira": expira,
+                "huella": _huella(password),
+            }
+
+    def invalidate(self, username: str = None):
+        with self._lock:
+            if username is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(username, None)
+
+    def expiring(self, antelacion: float):
+        """
+        Devuelve los usernames de los tokens que expiran en menos de antelacion segundos.
+        """
+        limite = time.time() + antelacion
+        with self._lock:
+            return [username for username, entrada in self._entradas.items() if entrada["expira"] < limite]
+
+
+class CredentialCache:
+    """
+    Caché por usuario de la contraseña descifrada. Se indexa también por el texto cifrado,
+    así un cambio de contraseña en la base de datos invalida la entrada automáticamente.
+    """
+
+    def __init__(self):
+        self._entradas = {}  # id_usuario -> (contraseña cifrada, contraseña descifrada)
+        self._lock = threading.Lock()
+
+    def get(self, id_usuario: str, contraseña_cifrada: str) -> str:
+        with self._lock:
+            entrada = self._entradas.get(id_usuario)
+        if entrada and entrada[0] == contraseña_cifrada:
+            return entrada[1]
+
+        contraseña = descifrar_contraseña(contraseña_cifrada)
+        with self._lock:
+            self._entradas[id_usuario] = (contraseña_cifrada, contraseña)
+        return contraseña
+
+    def invalidate(self, id_usuario: str = None):
+        with self._lock:
+            if id_usuario is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(id_usuario, None)
+
+
+# Cachés compartidas por todo el proceso
+token_cache = TokenCache()
+credential_cache = CredentialCache()
@@ -1,8 +1,24 @@
 import requests
 from datetime import datetime
-class VG_API:
+from app.gateway.timetable_cache import find_participation_id, timetable_cache
+from app.gateway.retry_policy import segundos_retry_after
+from app.gateway import http_session
+from app.gateway.token_cache import credential_cache, token_cache
+from app.utils.fernet_encryption import descifrar_contraseña
+from app.gateway.rate_limiter import rate_limiter
+from app.utils.metricas import LATENCIA_GIMNASIO
+import os
+from urllib.parse import urlparse
 
-    BASE_URL = "https://gimnasios.vivagym.es"
+class ClienteVG:
+    """
+    Parte común de VG_API y VG_API_Async: endpoints, estado de la sesión y de las últimas
+    peticiones, construcción de los cuerpos de las peticiones y lectura de las respuestas.
+    Cada cliente solo añade el envío de las peticiones (síncrono o asíncrono).
+    """
+
+    # Se puede apuntar a otro servidor, p. ej. al gimnasio simulado de benchmarks.vivagym_stub
+    BASE_URL = os.getenv("VG_BASE_URL", "https://gimnasios.vivagym.es").rstrip("/")
 
     # Endpoints
     LOGIN_ENDPOINT = "/api/user/authenticate"
@@ -10,44 +26,138 @@ class VG_API:
     CREATE_BOOKING_ENDPOINT = "/api/booking/create-booking"
     CANCEL_BOOKING_ENDPOINT = "/api/booking/cancel-booking"
 
-    def __init__(self, username: str, password: str):
+    def __init__(self, username: str, password: str, interactivo: bool = False):
         self.username = username
         self.password = password
+        # Presupuesto del limitador para los logins: los de un usuario en la aplicación van aparte
+        self.presupuesto_login = "login_interactivo" if interactivo else "login"
         self.user_id = None
         self.center_id = None
         self.token = None
-        self.sessionTimeoutOneMonth = False
+        # Estado de la última petición de reserva: código HTTP, "timeout" o "conexion"
+        self.last_booking_status = None
+        # Estado de la última autenticación contra el gimnasio, con los mismos valores
+        self.last_auth_status = None
+        # Estado de la última búsqueda del horario (None si se tomó de la caché), con los mismos valores
+        self.last_search_status = None
+        # Segundos de espera que pide el gimnasio (Retry-After) en la última petición de reserva
+        self.last_retry_after = None
+        # Fecha de la clase de la última reserva preparada, para invalidar su horario si la clase no existe
+        self.booking_date = None
+        # Pide al gimnasio un token de larga duración, que se reutiliza desde token_cache
+        self.sessionTimeoutOneMonth = os.getenv("VG_SESSION_ONE_MONTH", "true").lower() == "true"
 
-    def authenticate(self):
-        url = f"{self.BASE_URL}{self.LOGIN_ENDPOINT}"
-        data = {
-            "email": self.username, 
-            "password": self.password, 
+    # Toma la sesión de token_cache si hay un token vigente para el usuario y la contraseña
+    def _sesion_en_cache(self) -> bool:
+        entrada = token_cache.get(self.username, self.password)
+        if not entrada:
+            return False
+        self.token = entrada["token"]
+        self.user_id = entrada["user_id"]
+        self.center_id = entrada["center_id"]
+        return True
+
+    def _datos_login(self) -> dict:
+        return {
+            "email": self.username,
+            "password": self.password,
             "sessionTimeoutOneMonth": self.sessionTimeoutOneMonth
         }
- 
+
+    # Guarda la sesión de la respuesta del login. Devuelve False si le falta el token o el usuario.
+    def _guardar_sesion(self, response_data: dict) -> bool:
+        if not all(key in response_data for key in ["token", "user"]):
+            print(f"Error en la autenticación: Missing token or user data.")
+            return False
+        self.token = response_data["token"]
+        self.user_id = response_data["user"]["userId"]
+        self.center_id = response_data["user"]["centerId"]
+        token_cache.store(self.username, self.password, self.token, self.user_id, self.center_id)
+        return True
+
+    def _cabeceras(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def _datos_reserva(self, selectedUserCenterId: int, booking_id: int) -> dict:
+        return {
+            "selectedUserId": self.user_id,
+            "selectedUserCenterId": selectedUserCenterId,
+            "bookingCenterId": self.center_id,
+            "bookingId": booking_id
+        }
+
+    def _datos_cancelacion(self, selected_user_center_id: int, participation_id: int) -> dict:
+        return {
+            "selectedUserId": self.user_id,
+            "selectedUserCenterId": selected_user_center_id,
+            "participationCenterId": self.center_id,
+            "participationId": participation_id
+        }
+
+    @staticmethod
+    def _datos_busqueda(center: int, date_from: str, date_to: str) -> dict:
+        return {
+            "centers": [center],
+            "dateFrom": date_from,
+            "dateTo": date_to
+        }
+
+    # Anota el estado de la respuesta a una petición de reserva
+    def _registrar_reserva(self, response, data: dict):
+        self.last_booking_status = response.status_code
+        self.last_retry_after = segundos_retry_after(response.headers.get("Retry-After"))
+        if response.status_code == 404 and self.booking_date is not None:
+            # La clase no existe: el id del horario en caché está obsoleto
+            timetable_cache.invalidate(data["selectedUserCenterId"], self.booking_date)
+
+    # Indica si hay que volver a descargar el horario porque no tiene la clase y es una copia antigua de la caché
+    def _horario_desfasado(self, indice, center: int, date: str, time: str, class_name: str) -> bool:
+        # El horario en caché puede ser anterior a la publicación de la clase
+        return indice is not None and (class_name, time) not in indice and self.last_search_status is None \
+            and timetable_cache.expire_if_older(center, date)
+
+
+class VG_API(ClienteVG):
+
+    # Abre conexiones con el gimnasio antes de una ráfaga de reservas
+    @classmethod
+    def warm_up(cls, conexiones: int = 1):
+        http_session.warm_up(cls.BASE_URL, conexiones)
+
+    # Autentica al usuario. Si use_cache es True y hay un token vigente en caché para
+    # el usuario y la contraseña, se reutiliza sin llamar al gimnasio.
+    def authenticate(self, use_cache: bool = True):
+        if use_cache and self._sesion_en_cache():
+            return True
+
+        url = f"{self.BASE_URL}{self.LOGIN_ENDPOINT}"
+
+        self.last_auth_status = None
         try:
+            rate_limiter.adquirir(self.presupuesto_login)
             start_time = datetime.now()
-            response = requests.post(url, json=data, timeout=5)
+            with LATENCIA_GIMNASIO.labels("login").time():
+                response = http_session.get_session().post(url, json=self._datos_login(), timeout=http_session.TIMEOUTS["login"])
+            self.last_auth_status = response.status_code
             response.raise_for_status()
             response_data = response.json()
             end_time = datetime.now()
             print(f"Tiempo de autenticación: {end_time - start_time}")
             # Comprobar que existe el token en la respuesta
-            if all(key in response_data for key in ["token", "user"]):
-                self.token = response_data["token"]
-                self.user_id = response_data["user"]["userId"]
-                self.center_id = response_data["user"]["centerId"]
-            else:
-                print(f"Error en la autenticación: Missing token or user data.")
+            if not self._guardar_sesion(response_data):
                 return False
 
         except KeyError as e:
             print(f"Error: Missing expected key in the response: {e}")
             return False
         except requests.exceptions.Timeout:
+            self.last_auth_status = "timeout"
             print(f"Error en la autenticación: The request timed out.")
             return False
+        except requests.exceptions.ConnectionError as e:
+            self.last_auth_status = "conexion"
+            print(f"Error en la autenticación: {e}")
+            return False
         except requests.exceptions.RequestException as e:
             print(f"Error en la autenticación: {e}")
             return False
@@ -55,14 +165,56 @@ class VG_API:
         print("Autenticación exitosa")
         return True
 
+    # Renueva en segundo plano los tokens en caché que están a punto de expirar.
+    # credenciales(usernames) devuelve {username: contraseña cifrada} de los usuarios que aún
+    # necesitan el token; el resto se descarta de las cachés en lugar de renovarse.
+    @classmethod
+    def refresh_cached_tokens(cls, antelacion: float, credenciales):
+        usernames = token_cache.expiring(antelacion)
+        if not usernames:
+            return
+        cifradas = credenciales(usernames)
+        for username in usernames:
+            if username not in cifradas:
+                token_cache.invalidate(username)
+                credential_cache.invalidate(username)
+                continue
+            print(f"Renovando el token del gimnasio de {username}")
+            if not cls(username, descifrar_contraseña(cifradas[username])).authenticate(use_cache=False):
+                token_cache.invalidate(username)
+
+    # Envía una petición autenticada. Si el gimnasio rechaza el token (401), se vuelve
+    # a autenticar sin caché y se repite la petición una vez.
+    def _post_autorizado(self, url: str, data: dict, endpoint: str):
+        rate_limiter.adquirir(endpoint)
+        with LATENCIA_GIMNASIO.labels(endpoint).time():
+            response = http_session.get_session().post(url=url, headers=self._cabeceras(), json=data, timeout=http_session.TIMEOUTS[endpoint])
+        if response.status_code == 401:
+            print("El gimnasio ha rechazado el token. Reautenticando...")
+            token_cache.invalidate(self.username)
+            if self.authenticate(use_cache=False):
+                rate_limiter.adquirir(endpoint)
+                with LATENCIA_GIMNASIO.labels(endpoint).time():
+                    response = http_session.get_session().post(url=url, headers=self._cabeceras(), json=data, timeout=http_session.TIMEOUTS[endpoint])
+        return response
+
 
     # Crea una reserva y devuelve el id de la reserva creada o None si no se pudo crear
     def create_booking(self, selectedUserCenterId: int, class_date: str, class_time: str, class_name: str):
+        data = self.prepare_booking(selectedUserCenterId, class_date, class_time, class_name)
+        if data is None:
+            return None
+        return self.commit_booking(data)
+
+    # Fase de preparación: resuelve el id de la clase y construye el cuerpo de la petición de reserva.
+    # Devuelve el payload listo para enviar o None si no se encontró la clase.
+    def prepare_booking(self, selectedUserCenterId: int, class_date: str, class_time: str, class_name: str):
 
         # Compruebo que los parametros son correctos
         print(f"Creando reserva para el día {class_date} a las {class_time} en el centro {selectedUserCenterId} para la clase {class_name}")
         # Buscar el id de la clase
         start_time = datetime.now()
+        self.booking_date = class_date
         booking_id = self.find_booking_id(selectedUserCenterId, class_date, class_time, class_name)
         end_time = datetime.now()
         print(f"Tiempo de búsqueda de la clase: {end_time - start_time}")
@@ -70,18 +222,19 @@ class VG_API:
             print(f"Error en la creación de la reserva: No se encontró la clase {class_name} para el día {class_date} a las {class_time}")
             return None
 
-        data = {
-            "selectedUserId": self.user_id,
-            "selectedUserCenterId": selectedUserCenterId,
-            "bookingCenterId": self.center_id,
-            "bookingId": booking_id
-        }
+        return self._datos_reserva(selectedUserCenterId, booking_id)
+
+    # Fase de disparo: únicamente envía la petición de reserva ya preparada.
+    # Devuelve el id de la reserva creada o None si no se pudo crear.
+    def commit_booking(self, data: dict):
         url = f"{self.BASE_URL}{self.CREATE_BOOKING_ENDPOINT}"
-        headers = {"Authorization": f"Bearer {self.token}"}
 
+        self.last_booking_status = None
+        self.last_retry_after = None
         try:
-            start_time
-            response = requests.post(url=url, headers=headers, json=data, timeout=5)
+            start_time = datetime.now()
+            response = self._post_autorizado(url, data, "create")
+            self._registrar_reserva(response, data)
             response.raise_for_status()
             response_data = response.json()
             end_time = datetime.now()
@@ -89,25 +242,22 @@ class VG_API:
             return response_data.get("id")
 
         except requests.exceptions.Timeout:
+            self.last_booking_status = "timeout"
             print(f"Error en la creación de la reserva: The request timed out.")
             return None
+        except requests.exceptions.ConnectionError as e:
+            self.last_booking_status = "conexion"
+            print(f"Error en la creación de la reserva: {e}")
+            return None
         except requests.exceptions.RequestException as e:
             print(f"Error en la creación de la reserva: {e}")
             return None
 
     # Cancela una reserva y devuelve True si se canceló correctamente o False si no se pudo cancelar
     def cancel_booking(self, selected_user_center_id: int, participation_id: int):
-        data = {
-            "selectedUserId": self.user_id,
-            "selectedUserCenterId": selected_user_center_id,
-            "participationCenterId": self.center_id,
-            "participationId": participation_id
-        }
-
         url = f"{self.BASE_URL}{self.CANCEL_BOOKING_ENDPOINT}"
-        headers = {"Authorization": f"Bearer {self.token}"}
         try:
-            response = requests.post(url=url, headers=headers, json=data, timeout=5)
+            response = self._post_autorizado(url, self._datos_cancelacion(selected_user_center_id, participation_id), "cancel")
             response.raise_for_status()
             return True
         except requests.exceptions.Timeout:
@@ -120,48 +270,62 @@ class VG_API:
 
     # Busca las clases disponibles para un centro y un rango de fechas
     def search_booking_participations(self, center: int, date_from: str, date_to: str):
-        data = {
-            "centers": [center],
-            "dateFrom": date_from,
-            "dateTo": date_to
-        }
         url = f"{self.BASE_URL}{self.SEARCH_BOOKING_ENDPOINT}"
-        headers = {"Authorization": f"Bearer {self.token}"}
 
+        self.last_search_status = None
         try:
-            response = requests.post(url=url, headers=headers, json=data, timeout=5)
+            response = self._post_autorizado(url, self._datos_busqueda(center, date_from, date_to), "search")
+            self.last_search_status = response.status_code
             response.raise_for_status()
             response_data = response.json()
             return response_data
         except requests.exceptions.Timeout:
+            self.last_search_status = "timeout"
             print(f"Error en la búsqueda de reservas: The request timed out.")
             return None
+        except requests.exceptions.ConnectionError as e:
+            self.last_search_status = "conexion"
+            print(f"Error en la búsqueda de reservas: {e}")
+            return None
         except requests.exceptions.RequestException as e:
             print(f"Error en la búsqueda de reservas: {e}")
             return None
 
-    # Busca el id de una clase en un centro en una fecha y hora específica
+    # Busca el id de una clase en un centro en una fecha y hora específica.
+    # El horario se comparte entre todas las reservas del mismo centro y día a través de timetable_cache.
     def find_booking_id(self, center:int, date: str, time: str, class_name: str):
-        # Busco las reservas de un usuario en un centro en un rango de fechas
         print(f"Buscando reservas en el centro {center} para el día {date} a las {time} para la clase {class_name}")
-        response = self.search_booking_participations(center, date, date)
-        if response and isinstance(response, list):
-            return next(
-                (elem.get("booking", {}).get("id") for elem in response 
-                if elem.get("booking", {}).get("name") == class_name 
-                and elem.get("booking", {}).get("startTime") == time), None)
-        return None
+        def fetch():
+            respuesta = self.search_booking_participations(center, date, date)
+            return respuesta, self.last_search_status
+
+        # Si el horario lo ha descargado otro hilo, se toma el estado de su búsqueda
+        indice, self.last_search_status = timetable_cache.get_index(center, date, fetch)
+        if self._horario_desfasado(indice, center, date, time, class_name):
+            indice, self.last_search_status = timetable_cache.get_index(center, date, fetch)
+        if indice is None:
+            return None
+        return indice.get((class_name, time))
+
+    # Busca, sin caché, la participación del usuario en una clase. Sirve para saber si una
+    # reserva que no obtuvo respuesta se llegó a crear. Devuelve su id o None.
+    def find_participation(self, center: int, date: str, booking_id: int):
+        return find_participation_id(self.search_booking_participations(center, date, date), booking_id)
+
+
+# Las conexiones con el gimnasio se reutilizan, así que también su resolución DNS
+http_session.cache_dns(urlparse(VG_API.BASE_URL).hostname)
 
 
 # Crear un objeto de la clase VG_API
 # from datetime import datetime, timedelta
 # time1 = datetime.now()
-api = VG_API("diego-995@hotmail.com", "Masiero1-vg")
-api.authenticate()
-res = api.create_booking(selectedUserCenterId=134, class_date="2025-04-06", class_time="10:30", class_name="Virtual Cycling")
+# api = VG_API("usuario@example.com", "contraseña")
+# api.authenticate()
+# res = api.create_booking(selectedUserCenterId=134, class_date="2025-04-06", class_time="10:30", class_name="Virtual Cycling")
 # time2 = datetime.now()
 # print(f"Reserva creada con id: {res}")
 # print(f"Tiempo de ejecución: {time2 - time1}")
 #res = api.cancel_booking(selected_user_center_id=134, participation_id=626548)
-print(res)
+# print(res)
 
@@ -0,0 +1,168 @@
+import httpx
+from datetime import datetime
+from app.gateway import http_session
+from app.gateway.timetable_cache import find_participation_id, timetable_cache
+from app.gateway.token_cache import token_cache
+from app.gateway.rate_limiter import rate_limiter
+from app.gateway.vg_api import ClienteVG
+from app.utils.metricas import LATENCIA_GIMNASIO
+
+
+class VG_API_Async(ClienteVG):
+    """
+    Versión asíncrona de VG_API para el ejecutor de reservas basado en asyncio.
+    Comparte con VG_API (a través de ClienteVG) los endpoints, las peticiones, la lectura
+    de las respuestas, la caché de tokens y la caché de horarios.
+    A diferencia de requests, httpx no envuelve en HTTPError los errores al decodificar el
+    JSON de la respuesta: una página de error en HTML se trata con el ValueError de json.
+    """
+
+    async def authenticate(self, use_cache: bool = True):
+        if use_cache and self._sesion_en_cache():
+            return True
+
+        url = f"{self.BASE_URL}{self.LOGIN_ENDPOINT}"
+
+        self.last_auth_status = None
+        try:
+            await rate_limiter.adquirir_async(self.presupuesto_login)
+            start_time = datetime.now()
+            with LATENCIA_GIMNASIO.labels("login").time():
+                response = await http_session.get_async_client().post(url, json=self._datos_login(), timeout=http_session.async_timeout("login"))
+            self.last_auth_status = response.status_code
+            response.raise_for_status()
+            response_data = response.json()
+            print(f"Tiempo de autenticación: {datetime.now() - start_time}")
+            # Comprobar que existe el token en la respuesta
+            if not self._guardar_sesion(response_data):
+                return False
+
+        except KeyError as e:
+            print(f"Error: Missing expected key in the response: {e}")
+            return False
+        except httpx.TimeoutException:
+            self.last_auth_status = "timeout"
+            print(f"Error en la autenticación: The request timed out.")
+            return False
+        except httpx.TransportError as e:
+            self.last_auth_status = "conexion"
+            print(f"Error en la autenticación: {e}")
+            return False
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Error en la autenticación: {e}")
+            return False
+
+        print("Autenticación exitosa")
+        return True
+
+    # Envía una petición autenticada. Si el gimnasio rechaza el token (401), se vuelve
+    # a autenticar sin caché y se repite la petición una vez.
+    async def _post_autorizado(self, url: str, data: dict, endpoint: str):
+        client = http_session.get_async_client()
+        await rate_limiter.adquirir_async(endpoint)
+        with LATENCIA_GIMNASIO.labels(endpoint).time():
+            response = await client.post(url, headers=self._cabeceras(), json=data, timeout=http_session.async_timeout(endpoint))
+        if response.status_code == 401:
+            print("El gimnasio ha rechazado el token. Reautenticando...")
+            token_cache.invalidate(self.username)
+            if await self.authenticate(use_cache=False):
+                await rate_limiter.adquirir_async(endpoint)
+                with LATENCIA_GIMNASIO.labels(endpoint).time():
+                    response = await client.post(url, headers=self._cabeceras(), json=data, timeout=http_session.async_timeout(endpoint))
+        return response
+
+    # Crea una reserva y devuelve el id de la reserva creada o None si no se pudo crear
+    async def create_booking(self, selectedUserCenterId: int, class_date: str, class_time: str, class_name: str):
+        data = await self.prepare_booking(selectedUserCenterId, class_date, class_time, class_name)
+        if data is None:
+            return None
+        return await self.commit_booking(data)
+
+    # Fase de preparación: resuelve el id de la clase y construye el cuerpo de la petición de reserva.
+    async def prepare_booking(self, selectedUserCenterId: int, class_date: str, class_time: str, class_name: str):
+        self.booking_date = class_date
+        booking_id = await self.find_booking_id(selectedUserCenterId, class_date, class_time, class_name)
+        if not booking_id:
+            print(f"Error en la creación de la reserva: No se encontró la clase {class_name} para el día {class_date} a las {class_time}")
+            return None
+
+        return self._datos_reserva(selectedUserCenterId, booking_id)
+
+    # Fase de disparo: únicamente envía la petición de reserva ya preparada.
+    async def commit_booking(self, data: dict):
+        url = f"{self.BASE_URL}{self.CREATE_BOOKING_ENDPOINT}"
+
+        self.last_booking_status = None
+        self.last_retry_after = None
+        try:
+            start_time = datetime.now()
+            response = await self._post_autorizado(url, data, "create")
+            self._registrar_reserva(response, data)
+            response.raise_for_status()
+            print(f"Tiempo de creación de la reserva: {datetime.now() - start_time}")
+            return response.json().get("id")
+
+        except httpx.TimeoutException:
+            self.last_booking_status = "timeout"
+            print(f"Error en la creación de la reserva: The request timed out.")
+            return None
+        except httpx.TransportError as e:
+            self.last_booking_status = "conexion"
+            print(f"Error en la creación de la reserva: {e}")
+            return None
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Error en la creación de la reserva: {e}")
+            return None
+
+    # Cancela una reserva y devuelve True si se canceló correctamente o False si no se pudo cancelar
+    async def cancel_booking(self, selected_user_center_id: int, participation_id: int):
+        url = f"{self.BASE_URL}{self.CANCEL_BOOKING_ENDPOINT}"
+        try:
+            response = await self._post_autorizado(url, self._datos_cancelacion(selected_user_center_id, participation_id), "cancel")
+            response.raise_for_status()
+            return True
+        except httpx.TimeoutException:
+            print(f"Error en la cancelación de la reserva: The request timed out.")
+            return False
+        except httpx.HTTPError as e:
+            print(f"Error en la cancelación de la reserva: {e}")
+            return False
+
+    # Busca las clases disponibles para un centro y un rango de fechas
+    async def search_booking_participations(self, center: int, date_from: str, date_to: str):
+        url = f"{self.BASE_URL}{self.SEARCH_BOOKING_ENDPOINT}"
+
+        self.last_search_status = None
+        try:
+            response = await self._post_autorizado(url, self._datos_busqueda(center, date_from, date_to), "search")
+            self.last_search_status = response.status_code
+            response.raise_for_status()
+            return response.json()
+        except httpx.TimeoutException:
+            self.last_search_status = "timeout"
+            print(f"Error en la búsqueda de reservas: The request timed out.")
+            return None
+        except httpx.TransportError as e:
+            self.last_search_status = "conexion"
+            print(f"Error en la búsqueda de reservas: {e}")
+            return None
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Error en la búsqueda de reservas: {e}")
+            return None
+
+    # Busca el id de una clase usando la caché de horarios compartida
+    async def find_booking_id(self, center: int, date: str, time: str, class_name: str):
+        async def fetch():
+            respuesta = await self.search_booking_participations(center, date, date)
+            return respuesta, self.last_search_status
+
+        indice, self.last_search_status = await timetable_cache.get_index_async(center, date, fetch)
+        if self._horario_desfasado(indice, center, date, time, class_name):
+            indice, self.last_search_status = await timetable_cache.get_index_async(center, date, fetch)
+        if indice is None:
+            return None
+        return indice.get((class_name, time))
+
+    # Busca, sin caché, la participación del usuario en una clase (ver VG_API.find_participation)
+    async def find_participation(self, center: int, date: str, booking_id: int):
+        return find_participation_id(await self.search_booking_participations(center, date, date), booking_id)
@@ -1,7 +1,11 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import router
 from app.database import init_db
+from app.reconciliacion import reconciliar_reservas, programar_reconciliacion
+from app.tasks import iniciar_scheduler, MODO_SCHEDULER
+from app.utils.metricas import PETICIONES_HTTP, exportar
 
 app = FastAPI()
 
@@ -21,12 +25,40 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    # Se agrupa por la plantilla de la ruta (/api/v1/reservas/{id}) y no por la URL, para no crear una serie por id
+    inicio = time.perf_counter()
+    estado = 500
+    try:
+        response = await call_next(request)
+        estado = response.status_code
+        return response
+    finally:
+        ruta = request.scope.get("route")
+        if ruta is not None and ruta.path != "/metrics":
+            PETICIONES_HTTP.labels(request.method, ruta.path, str(estado)).observe(time.perf_counter() - inicio)
+
+
 init_db() # Inicialización de la base de datos
 
+# En modo "embebido" este proceso ejecuta las reservas. En modo "api" las ejecuta el worker (python -m app.worker)
+iniciar_scheduler(ejecutar=MODO_SCHEDULER == "embebido")
+
+if MODO_SCHEDULER == "embebido":
+    # Comprueba que cada reserva tiene su tarea programada y elimina las tareas huérfanas
+    reconciliar_reservas()
+    programar_reconciliacion()
+
 
 # Registrar las rutas
 app.include_router(router, prefix="/api/v1", tags=["Reservas"])
 
+@app.get("/metrics", include_in_schema=False)
+def metricas():
+    contenido, tipo = exportar()
+    return Response(content=contenido, media_type=tipo)
+
 @app.get("/api/v1")
 def read_root():
     return {"message": "¡Bienvenido a la API de reservas!"}
@@ -0,0 +1,106 @@
+"""Esquema inicial: usuarios, reservas, logs, logs_historico y correos_pendientes
+
+Las bases de datos anteriores a las migraciones se crearon con create_all, así que
+cada tabla e índice solo se crea si no existe.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# En modo offline (alembic upgrade --sql) no hay base de datos que inspeccionar: se genera todo
+def _offline() -> bool:
+    return op.get_context().as_sql
+
+
+def _existe_tabla(nombre: str) -> bool:
+    if _offline():
+        return False
+    return sa.inspect(op.get_bind()).has_table(nombre)
+
+
+def _crear_indice(nombre: str, tabla: str, columnas: list):
+    if _offline():
+        op.create_index(nombre, tabla, columnas)
+        return
+    indices = {indice["name"] for indice in sa.inspect(op.get_bind()).get_indexes(tabla)}
+    if nombre not in indices:
+        op.create_index(nombre, tabla, columnas)
+
+
+def upgrade():
+    if not _existe_tabla("usuarios"):
+        op.create_table(
+            "usuarios",
+            sa.Column("id_usuario", sa.String(), primary_key=True),
+            sa.Column("contraseña", sa.String(), nullable=False),
+        )
+
+    if not _existe_tabla("reservas"):
+        op.create_table(
+            "reservas",
+            sa.Column("id_reserva", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("dia_semana", sa.String(), nullable=False),
+            sa.Column("hora", sa.String(), nullable=False),
+            sa.Column("clase", sa.String(), nullable=False),
+            sa.Column("centro", sa.String(), nullable=False),
+            sa.Column("fecha_reserva", sa.DateTime(), nullable=True),
+            sa.Column("reserva_activa", sa.Boolean(), nullable=True),
+            sa.Column("id_usuario", sa.String(), sa.ForeignKey("usuarios.id_usuario", ondelete="CASCADE"), nullable=False),
+            sa.UniqueConstraint("dia_semana", "hora", "clase", "id_usuario", name="uq_reserva_unica"),
+        )
+
+    if not _existe_tabla("logs"):
+        op.create_table(
+            "logs",
+            sa.Column("id_log", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("mensaje", sa.Text(), nullable=False),
+            sa.Column("fecha_creacion", sa.DateTime(), nullable=True),
+            sa.Column("id_usuario", sa.String(), sa.ForeignKey("usuarios.id_usuario", ondelete="SET NULL"), nullable=True),
+            sa.Column("id_reserva", sa.Integer(), sa.ForeignKey("reservas.id_reserva", ondelete="SET NULL"), nullable=True),
+        )
+    _crear_indice("ix_logs_usuario_id", "logs", ["id_usuario", "id_log"])
+    _crear_indice("ix_logs_reserva_id", "logs", ["id_reserva", "id_log"])
+    _crear_indice("ix_logs_fecha_creacion", "logs", ["fecha_creacion"])
+
+    if not _existe_tabla("logs_historico"):
+        op.create_table(
+            "logs_historico",
+            sa.Column("id_log", sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column("mensaje", sa.Text(), nullable=False),
+            sa.Column("fecha_creacion", sa.DateTime(), nullable=True),
+            sa.Column("id_usuario", sa.String(), nullable=True),
+            sa.Column("id_reserva", sa.Integer(), nullable=True),
+            sa.Column("fecha_archivado", sa.DateTime(), nullable=True),
+        )
+
+    if not _existe_tabla("correos_pendientes"):
+        op.create_table(
+            "correos_pendientes",
+            sa.Column("id_correo", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("destinatario", sa.String(), nullable=False),
+            sa.Column("asunto", sa.String(), nullable=False),
+            sa.Column("cuerpo", sa.Text(), nullable=False),
+            sa.Column("intentos", sa.Integer(), nullable=False),
+            sa.Column("proximo_intento", sa.DateTime(), nullable=False),
+            sa.Column("fecha_envio", sa.DateTime(), nullable=True),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("fecha_creacion", sa.DateTime(), nullable=True),
+        )
+    _crear_indice("ix_correos_pendientes_envio", "correos_pendientes", ["fecha_envio", "proximo_intento"])
+
+
+def downgrade():
+    op.drop_table("correos_pendientes")
+    op.drop_table("logs_historico")
+    op.drop_table("logs")
+    op.drop_table("reservas")
+    op.drop_table("usuarios")
@@ -0,0 +1,31 @@
+"""Añade reservas.id_reserva_gimnasio
+
+confirmar_reserva guarda el id de la reserva en el gimnasio, pero la columna no existía.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def _columnas(tabla: str) -> set:
+    if op.get_context().as_sql:
+        return set()
+    return {columna["name"] for columna in sa.inspect(op.get_bind()).get_columns(tabla)}
+
+
+def upgrade():
+    if "id_reserva_gimnasio" not in _columnas("reservas"):
+        op.add_column("reservas", sa.Column("id_reserva_gimnasio", sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("reservas") as batch_op:
+        batch_op.drop_column("id_reserva_gimnasio")
@@ -0,0 +1,46 @@
+"""Versión de las reservas de cada usuario e índice de reservas por usuario
+
+usuarios.version_reservas y usuarios.reservas_modificadas sirven para el ETag y el
+Last-Modified de GET /usuario/reservas.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def _columnas(tabla: str) -> set:
+    if op.get_context().as_sql:
+        return set()
+    return {columna["name"] for columna in sa.inspect(op.get_bind()).get_columns(tabla)}
+
+
+def _indices(tabla: str) -> set:
+    if op.get_context().as_sql:
+        return set()
+    return {indice["name"] for indice in sa.inspect(op.get_bind()).get_indexes(tabla)}
+
+
+def upgrade():
+    columnas = _columnas("usuarios")
+    if "version_reservas" not in columnas:
+        op.add_column("usuarios", sa.Column("version_reservas", sa.Integer(), nullable=False, server_default="0"))
+    if "reservas_modificadas" not in columnas:
+        op.add_column("usuarios", sa.Column("reservas_modificadas", sa.DateTime(), nullable=True))
+
+    if "ix_reservas_usuario" not in _indices("reservas"):
+        op.create_index("ix_reservas_usuario", "reservas", ["id_usuario", "fecha_reserva"])
+
+
+def downgrade():
+    op.drop_index("ix_reservas_usuario", table_name="reservas")
+    with op.batch_alter_table("usuarios") as batch_op:
+        batch_op.drop_column("reservas_modificadas")
+        batch_op.drop_column("version_reservas")
@@ -0,0 +1,58 @@
+"""Tabla intentos_reserva con los tiempos y el resultado de cada ejecución de una reserva
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def _tablas() -> set:
+    if op.get_context().as_sql:
+        return set()
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade():
+    if "intentos_reserva" in _tablas():
+        return
+
+    op.create_table(
+        "intentos_reserva",
+        sa.Column("id_intento", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("id_reserva", sa.Integer(), sa.ForeignKey("reservas.id_reserva", ondelete="SET NULL"), nullable=True),
+        sa.Column("id_usuario", sa.String(), sa.ForeignKey("usuarios.id_usuario", ondelete="SET NULL"), nullable=True),
+        sa.Column("centro", sa.String(), nullable=False),
+        sa.Column("clase", sa.String(), nullable=False),
+        sa.Column("fecha_clase", sa.DateTime(), nullable=False),
+        sa.Column("backend", sa.String(), nullable=False),
+        sa.Column("programada_para", sa.DateTime(), nullable=True),
+        sa.Column("inicio", sa.DateTime(), nullable=False),
+        sa.Column("disparo", sa.DateTime(), nullable=True),
+        sa.Column("ms_descifrado", sa.Float(), nullable=True),
+        sa.Column("ms_autenticacion", sa.Float(), nullable=True),
+        sa.Column("ms_busqueda", sa.Float(), nullable=True),
+        sa.Column("ms_espera", sa.Float(), nullable=True),
+        sa.Column("ms_creacion", sa.Float(), nullable=True),
+        sa.Column("ms_selenium", sa.Float(), nullable=True),
+        sa.Column("ms_hasta_reserva", sa.Float(), nullable=True),
+        sa.Column("estado_autenticacion", sa.String(), nullable=True),
+        sa.Column("estado_reserva", sa.String(), nullable=True),
+        sa.Column("intentos", sa.Integer(), nullable=True),
+        sa.Column("id_reserva_gimnasio", sa.Integer(), nullable=True),
+        sa.Column("resultado", sa.String(), nullable=False),
+        sa.Column("fecha_creacion", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_intentos_reserva_programada", "intentos_reserva", ["programada_para"])
+    op.create_index("ix_intentos_reserva_inicio", "intentos_reserva", ["inicio"])
+    op.create_index("ix_intentos_reserva_reserva", "intentos_reserva", ["id_reserva"])
+
+
+def downgrade():
+    op.drop_table("intentos_reserva")
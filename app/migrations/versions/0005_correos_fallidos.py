@@ -0,0 +1,47 @@
+"""Añade correos_pendientes.fecha_fallo
+
+Los correos que agotan OUTBOX_MAX_INTENTOS se marcan como fallidos en lugar de quedar
+pendientes para siempre. Los que ya los habían agotado se marcan al migrar.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+import os
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def _columnas(tabla: str) -> set:
+    if op.get_context().as_sql:
+        return set()
+    return {columna["name"] for columna in sa.inspect(op.get_bind()).get_columns(tabla)}
+
+
+def upgrade():
+    if "fecha_fallo" in _columnas("correos_pendientes"):
+        return
+
+    op.add_column("correos_pendientes", sa.Column("fecha_fallo", sa.DateTime(), nullable=True))
+    correos = sa.table(
+        "correos_pendientes",
+        sa.column("fecha_envio", sa.DateTime()),
+        sa.column("fecha_fallo", sa.DateTime()),
+        sa.column("intentos", sa.Integer()),
+        sa.column("proximo_intento", sa.DateTime()),
+    )
+    op.execute(
+        correos.update()
+        .where(correos.c.fecha_envio.is_(None), correos.c.intentos >= int(os.getenv("OUTBOX_MAX_INTENTOS", "5")))
+        .values(fecha_fallo=correos.c.proximo_intento)
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("correos_pendientes") as batch_op:
+        batch_op.drop_column("fecha_fallo")
@@ -0,0 +1,158 @@
+import os
+import pickle
+import time
+from datetime import datetime
+from apscheduler.job import Job
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.util import datetime_to_utc_timestamp
+from app.database import Reserva, SessionLocal
+from app.tasks import (
+    AGRUPAR_EJECUCIONES, MARGEN_MISFIRE, MAX_INSTANCIAS,
+    campos_disparador, dia_programacion, ejecutar_reserva, jobstores, scheduler,
+)
+
+# Cada cuántas horas se repite la reconciliación mientras la aplicación está en marcha
+RECONCILIACION_HORAS = float(os.getenv("RECONCILIACION_HORAS", "24"))
+
+
+def _trabajo_reserva(reserva, ahora: datetime) -> Job:
+    """
+    Construye la tarea del scheduler que corresponde a una reserva, igual que programar_reserva.
+    """
+    trigger = CronTrigger(**campos_disparador(dia_programacion(reserva.dia_semana), reserva.hora), timezone=scheduler.timezone)
+    return Job(
+        scheduler,
+        id=str(reserva.id_reserva),
+        func=ejecutar_reserva,
+        trigger=trigger,
+        executor='default',
+        args=(reserva.id_reserva, reserva.hora, reserva.centro, reserva.clase),
+        kwargs={},
+        name=ejecutar_reserva.__name__,
+        misfire_grace_time=MARGEN_MISFIRE,
+        coalesce=AGRUPAR_EJECUCIONES,
+        max_instances=MAX_INSTANCIAS,
+        next_run_time=trigger.get_next_fire_time(None, ahora),
+    )
+
+
+def _campos_disparador(trigger) -> tuple:
+    """
+    Campos que definen cuándo se dispara una tarea, para comparar disparadores sin depender
+    de su representación en texto.
+    """
+    if not isinstance(trigger, CronTrigger):
+        return (type(trigger).__name__, str(trigger))
+    return (
+        tuple((campo.name, str(campo)) for campo in trigger.fields),
+        str(trigger.timezone),
+        trigger.start_date,
+        trigger.end_date,
+        trigger.jitter,
+    )
+
+
+def _aplicar_cambios(eliminar: list, añadir: list):
+    """
+    Aplica todos los cambios en el jobstore en una única transacción.
+    Si el jobstore no es SQLAlchemyJobStore se recurre a la API del scheduler.
+    """
+    store = jobstores['default']
+    if not isinstance(store, SQLAlchemyJobStore):
+        for id_job in eliminar:
+            scheduler.remove_job(id_job, jobstore='default')
+        for job in añadir:
+            scheduler.add_job(job.func, job.trigger, args=job.args, id=job.id, jobstore='default', replace_existing=True)
+        return
+
+    with store.engine.begin() as connection:
+        if eliminar:
+            connection.execute(store.jobs_t.delete().where(store.jobs_t.c.id.in_(eliminar)))
+        if añadir:
+            connection.execute(store.jobs_t.insert(), [
+                {
+                    "id": job.id,
+                    "next_run_time": datetime_to_utc_timestamp(job.next_run_time),
+                    "job_state": pickle.dumps(job.__getstate__(), store.pickle_protocol),
+                }
+                for job in añadir
+            ])
+
+    # El scheduler debe recalcular cuándo despertar con las nuevas tareas
+    if scheduler.running:
+        scheduler.wakeup()
+
+
+def reconciliar_reservas(aplicar: bool = True) -> dict:
+    """
+    Compara las reservas de la base de datos con las tareas del scheduler y corrige las diferencias:
+    - Reservas sin tarea: se programa su tarea.
+    - Tareas sin reserva (huérfanas): se eliminan.
+    - Tareas con un disparador o argumentos que no corresponden a su reserva: se reprograman.
+
+    Todos los cambios se aplican en bloque. Si aplicar es False solo se calcula el informe.
+    Returns dict con el informe de la reconciliación.
+    """
+    inicio = time.perf_counter()
+
+    with SessionLocal() as db:
+        reservas = db.query(Reserva.id_reserva, Reserva.dia_semana, Reserva.hora, Reserva.centro, Reserva.clase).all()
+
+    ahora = datetime.now(scheduler.timezone)
+    esperados = {}
+    invalidas = []
+    for reserva in reservas:
+        try:
+            esperados[str(reserva.id_reserva)] = _trabajo_reserva(reserva, ahora)
+        except ValueError as e:
+            # Un día u hora inválidos en la base de datos no deben impedir arrancar el scheduler.
+            # Su tarea, si existe, se conserva.
+            print(f"Reconciliación: reserva {reserva.id_reserva} omitida por datos inválidos ({reserva.dia_semana} {reserva.hora}): {e}")
+            invalidas.append(str(reserva.id_reserva))
+
+    # Las tareas de reservas son las que tienen como id el id numérico de la reserva
+    actuales = {job.id: job for job in scheduler.get_jobs(jobstore='default') if job.id.isdigit()}
+
+    faltan = [esperados[id_job] for id_job in esperados.keys() - actuales.keys()]
+    huerfanas = sorted(actuales.keys() - esperados.keys() - set(invalidas))
+    desviadas = [
+        esperados[id_job]
+        for id_job in esperados.keys() & actuales.keys()
+        if _campos_disparador(actuales[id_job].trigger) != _campos_disparador(esperados[id_job].trigger)
+        or tuple(actuales[id_job].args) != esperados[id_job].args
+        or actuales[id_job].func_ref != esperados[id_job].func_ref
+    ]
+
+    if aplicar and (faltan or huerfanas or desviadas):
+        _aplicar_cambios(
+            eliminar=huerfanas + [job.id for job in desviadas],
+            añadir=faltan + desviadas,
+        )
+
+    informe = {
+        "reservas": len(esperados),
+        "tareas": len(actuales),
+        "añadidas": len(faltan),
+        "eliminadas": len(huerfanas),
+        "corregidas": len(desviadas),
+        "invalidas": len(invalidas),
+        "aplicado": aplicar,
+        "duracion_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+    print(f"Reconciliación de reservas: {informe}")
+    return informe
+
+
+def programar_reconciliacion():
+    """
+    Programa la reconciliación periódica en el jobstore en memoria.
+    """
+    scheduler.add_job(
+        reconciliar_reservas,
+        'interval',
+        hours = RECONCILIACION_HORAS,
+        id = "reconciliar_reservas",
+        jobstore = 'memoria',
+        replace_existing = True,
+    )
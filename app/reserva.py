@@ -1,3 +1,4 @@
+import calendar
 from pydantic import BaseModel, Field, field_validator
 from fastapi import HTTPException, status
 from typing import Optional
@@ -11,6 +12,10 @@ CENTROS = {
 CLASES = ["Body Pump", "Cycling", "Body Combat", "GAP", "Virtual Cycling", "Zumba", "Yoga", "Body Balance", "Pilates", "ABS"]
 
 
+# Días de la semana en el formato en que se guardan ("monday", "tuesday",...)
+DIAS_SEMANA = [dia.lower() for dia in calendar.day_name]
+
+
 class CreateReserva(BaseModel):
     dia_semana: str
     hora: str = Field(..., description="Hora en formato HH:MM")
@@ -18,6 +23,17 @@ class CreateReserva(BaseModel):
     clase: str
    
 
+    # Validar el día de la semana, que se guarda en minúsculas
+    @field_validator("dia_semana")
+    @classmethod
+    def validar_dia_semana(cls, value):
+        if value.lower() not in DIAS_SEMANA:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Día de la semana desconocido: {value}. Días válidos: {DIAS_SEMANA}"
+            )
+        return value.lower()
+
     # Validar que la hora tenga el formato HH:MM
     @field_validator("hora")
     @classmethod
@@ -0,0 +1,118 @@
+"""
+Rotación de la clave Fernet de las contraseñas guardadas.
+
+1. Añadir la clave nueva al principio de FERNET_KEYS, manteniendo las anteriores
+   (FERNET_KEYS=nueva,antigua) y reiniciar la API y el worker. Desde ese momento se
+   cifra con la clave nueva y se siguen descifrando las contraseñas antiguas.
+2. Ejecutar este comando para volver a cifrar todas las contraseñas con la clave nueva.
+3. Quitar la clave antigua de FERNET_KEYS.
+
+El servicio puede seguir en marcha durante la rotación. Cada lote se guarda en su propia
+transacción y el progreso se anota en un fichero, por lo que si se interrumpe basta con
+volver a lanzarlo para continuar donde se quedó.
+
+Uso:
+    python -m app.rotar_claves [--lote 500] [--progreso rotacion_claves.progreso] [--desde-cero]
+"""
+import argparse
+import os
+import time
+from sqlalchemy import select, update
+from app.database import SessionLocal, Usuario
+from app.utils.fernet_encryption import cifrada_con_clave_principal, rotar_contraseña
+
+
+def _leer_progreso(fichero: str):
+    if not os.path.exists(fichero):
+        return None
+    with open(fichero, encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def _guardar_progreso(fichero: str, ultimo_id: str):
+    temporal = f"{fichero}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(ultimo_id)
+    os.replace(temporal, fichero)
+
+
+def rotar_claves(lote: int, fichero_progreso: str, desde: str = None) -> dict:
+    """
+    Recorre los usuarios por id_usuario en lotes de `lote` y vuelve a cifrar con la clave
+    principal las contraseñas que aún no lo están.
+    Returns dict con el resumen de la rotación.
+    """
+    inicio = time.perf_counter()
+    revisados = rotados = conflictos = 0
+    ultimo_id = desde
+
+    while True:
+        inicio_lote = time.perf_counter()
+        with SessionLocal() as db:
+            consulta = select(Usuario.id_usuario, Usuario.contraseña).order_by(Usuario.id_usuario).limit(lote)
+            if ultimo_id is not None:
+                consulta = consulta.where(Usuario.id_usuario > ultimo_id)
+            filas = db.execute(consulta).all()
+            if not filas:
+                break
+
+            rotados_lote = 0
+            for id_usuario, contraseña in filas:
+                if cifrada_con_clave_principal(contraseña):
+                    continue
+                # Solo se actualiza si la contraseña no ha cambiado desde que se leyó,
+                # para no pisar un cambio de contraseña hecho desde la API durante la rotación
+                resultado = db.execute(
+                    update(Usuario)
+                    .where(Usuario.id_usuario == id_usuario, Usuario.contraseña == contraseña)
+                    .values(contraseña=rotar_contraseña(contraseña))
+                    .execution_options(synchronize_session=False)
+                )
+                if resultado.rowcount:
+                    rotados_lote += 1
+                else:
+                    conflictos += 1
+            db.commit()
+
+        revisados += len(filas)
+        rotados += rotados_lote
+        ultimo_id = filas[-1].id_usuario
+        _guardar_progreso(fichero_progreso, ultimo_id)
+
+        duracion_lote = time.perf_counter() - inicio_lote
+        print(
+            f"Lote de {len(filas)} usuarios ({rotados_lote} rotados) en {duracion_lote * 1000:.0f} ms, "
+            f"{len(filas) / duracion_lote:.0f} usuarios/s. Total revisados: {revisados}"
+        )
+
+    duracion = time.perf_counter() - inicio
+    return {
+        "revisados": revisados,
+        "rotados": rotados,
+        "conflictos": conflictos,
+        "duracion_s": round(duracion, 2),
+        "usuarios_por_segundo": round(revisados / duracion, 1) if duracion else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vuelve a cifrar las contraseñas con la clave principal de FERNET_KEYS")
+    parser.add_argument("--lote", type=int, default=500, help="Usuarios por transacción")
+    parser.add_argument("--progreso", default="rotacion_claves.progreso", help="Fichero donde se guarda el último usuario procesado")
+    parser.add_argument("--desde-cero", action="store_true", help="Ignora el progreso guardado y empieza por el primer usuario")
+    args = parser.parse_args()
+
+    desde = None if args.desde_cero else _leer_progreso(args.progreso)
+    if desde is not None:
+        print(f"Continuando la rotación después del usuario {desde}")
+
+    resumen = rotar_claves(args.lote, args.progreso, desde)
+    print(f"Rotación terminada: {resumen}")
+
+    # Terminada la rotación completa, el progreso ya no sirve
+    if os.path.exists(args.progreso):
+        os.remove(args.progreso)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,31 @@
 
+import asyncio
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
 from app.reserva import CreateReserva, UpdateEstadoReserva
 from app.usuario import CreateUsuario
 from sqlalchemy.orm import Session
 from app.database import Reserva, Usuario, get_db
-from app.tasks import programar_reserva, eliminar_reserva_programada
+from app.tasks import programar_reserva, eliminar_reserva_programada, loop_reservas
 from app.db_utils import *
 from app.gateway.vg_selenium import checkLogin
 from app.utils.jwt_auth import create_token, verify_token, get_current_user, oauth2_scheme
 from typing import Optional
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi import Cookie
 from fastapi import Form
 from app.gateway.vg_api import VG_API
+from app.gateway.vg_api_async import VG_API_Async
+from app.gateway.login_cache import login_cache
+from fastapi.concurrency import run_in_threadpool
 
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app.utils.fernet_encryption import cifrar_contraseña, descifrar_contraseña
+from app.utils.exportacion import TIPOS_EXPORTACION, exportar
 
 router = APIRouter()
 
@@ -43,8 +51,37 @@ def refresh_token(refresh_token: str = Cookie(None)):
         raise HTTPException(status_code=401, detail="Refresh token inválido o expirado")
 
 
+async def _autenticar_gimnasio(username: str, password: str) -> bool:
+    # El cliente HTTP asíncrono pertenece al bucle de eventos de reservas, así que la
+    # autenticación se ejecuta allí y aquí solo se espera su resultado. Su presupuesto de logins
+    # es aparte, para que los usuarios no retrasen los logins de las reservas ni al revés.
+    futuro = asyncio.run_coroutine_threadsafe(VG_API_Async(username, password, interactivo=True).authenticate(), loop_reservas())
+    return await asyncio.wrap_future(futuro)
+
+
+async def _actualizar_contraseña(db: Session, usuario_bd: Usuario, password: str) -> bool:
+    """
+    Comprueba la nueva contraseña con vivaGym y, si es correcta, la guarda cifrada.
+    Returns False si vivaGym no acepta la contraseña.
+    """
+    if not await _autenticar_gimnasio(usuario_bd.id_usuario, password):
+        return False
+
+    # Si la contraseña ha cambiado, la actualizo en la base de datos
+    # Se guarda la contraseña cifrada en la base de datos
+    contraseña_cifrada = await run_in_threadpool(cifrar_contraseña, password)
+    try:
+        await run_in_threadpool(actualizar_contraseña_usuario, db, usuario_bd, contraseña_cifrada)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error inesperado al intentar actualizar la contraseña del usuario: {str(e)}"
+        )
+    return True
+
+
 @router.post("/login/")
-def login_usuario(
+async def login_usuario(
     #usuario: CreateUsuario,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
@@ -52,68 +89,67 @@ def login_usuario(
     """
     Intenta autenticar con vivaGym.
     Crea el usuario en la base de datos si no existe.
+    Un login correcto se recuerda durante LOGIN_RECUERDO_SEGUNDOS: los siguientes logins
+    con la misma contraseña no consultan la base de datos ni el gimnasio.
     """
     keep_session = "keep_session" in form_data.scopes
  
     # Crea un objeto usuario con los datos del formulario
     usuario = CreateUsuario(username=form_data.username, password=form_data.password)
 
-    # Comprueba si el usuario ya existe en la base de datos
-    usuario_bd = db.get(Usuario, usuario.username)
+    if not login_cache.reciente(usuario.username, usuario.password):
+        # Comprueba si el usuario ya existe en la base de datos
+        usuario_bd = await run_in_threadpool(db.get, Usuario, usuario.username)
+
+        if usuario_bd:
+            contraseña_descifrada = await run_in_threadpool(descifrar_contraseña, usuario_bd.contraseña)
+            # Comprueba que la contraseña no haya cambiado. Si ha cambiado, actualizo la base de datos.
+            if usuario.password != contraseña_descifrada:
+                # Comprueba la conexión con vivaGym antes de actualizar la contraseña.
+                # Los logins simultáneos del mismo usuario comparten una única verificación y actualización.
+                vivagym_auth = await login_cache.verificar(
+                    usuario.username,
+                    usuario.password,
+                    lambda: _actualizar_contraseña(db, usuario_bd, usuario.password)
+                )
+                if not vivagym_auth:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="No se ha conseguido autenticar el usuario."
+                    )
+                
+            # Si la contraseña no ha cambiado, no se hace nada
+                
+        else: # Si no existe el usuario en la BBDD, se lanza el error correspondiente.
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No se ha conseguido autenticar el usuario."
+            )
 
-    if usuario_bd:
-        contraseña_descifrada = descifrar_contraseña(usuario_bd.contraseña)
-        # Comprueba que la contraseña no haya cambiado. Si ha cambiado, actualizo la base de datos.
-        if usuario.password != contraseña_descifrada:
-            vg_api = VG_API(usuario.username, usuario.password)
-            # Comprueba la conexión con vivaGym antes de actualizar la contraseña
-            vivagym_auth = vg_api.authenticate()
+            # El login de nuevos usuarios queda deshabilitado por el momento
+            """ vivagym_auth = checkLogin(usuario)
             if not vivagym_auth:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="No se ha conseguido autenticar el usuario."
                 )
-            # Si la contraseña ha cambiado, la actualizo en la base de datos
-            # Se guarda la contraseña cifrada en la base de datos
+                 
             contraseña_cifrada = cifrar_contraseña(usuario.password)
+            nuevo_usuario = Usuario(
+                id_usuario=usuario.username,
+                contraseña=contraseña_cifrada
+            )
+
             try:
-                actualizar_contraseña_usuario(db, usuario_bd, contraseña_cifrada)
+                guardar_en_db(db, nuevo_usuario)
+
             except Exception as e:
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Error inesperado al intentar actualizar la contraseña del usuario: {str(e)}"
-                )
-            
-        # Si la contraseña no ha cambiado, no se hace nada
-            
-    else: # Si no existe el usuario en la BBDD, se lanza el error correspondiente.
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="No se ha conseguido autenticar el usuario."
-        )
+                    detail=f"Error inesperado al guardar los datos del usuario en la base de datos: {str(e)}"
+                ) """
 
-        # El login de nuevos usuarios queda deshabilitado por el momento
-        """ vivagym_auth = checkLogin(usuario)
-        if not vivagym_auth:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No se ha conseguido autenticar el usuario."
-            )
-             
-        contraseña_cifrada = cifrar_contraseña(usuario.password)
-        nuevo_usuario = Usuario(
-            id_usuario=usuario.username,
-            contraseña=contraseña_cifrada
-        )
-
-        try:
-            guardar_en_db(db, nuevo_usuario)
-
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Error inesperado al guardar los datos del usuario en la base de datos: {str(e)}"
-            ) """
+        login_cache.recordar(usuario.username, usuario.password)
 
     # Generar tokens JWT para el usuario
     
@@ -287,50 +323,121 @@ def borrar_reserva_usuario(
 
 @router.get("/usuario/reservas")
 def listar_reservas_usuario(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_current_user) # Devuelve el usuario logueado
 ):
     """
-    Obtiene todas las reservas activas asociadas al usuario logueado.
+    Obtiene todas las reservas asociadas al usuario logueado.
+    La respuesta lleva un ETag; si el cliente lo envía en If-None-Match y no ha cambiado
+    nada, se responde 304 sin volver a consultar las reservas.
     """
-    # Recuperar las reservas activas del usuario
-    #reservas = [reserva for reserva in current_user.reservas if reserva.reserva_activa == 1]
-
-    usuario = db.get(Usuario, current_user.id_usuario)
-    if not usuario:
+    ahora = datetime.now()
+    estado = estado_reservas_usuario(db, current_user.id_usuario, ahora)
+    if estado is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-    reservas = usuario.reservas
-   
+    version, modificadas, confirmadas = estado
+    headers = {"ETag": f'"{version}-{confirmadas}"', "Cache-Control": "private, no-cache"}
+    if modificadas:
+        headers["Last-Modified"] = format_datetime(modificadas.astimezone(timezone.utc), usegmt=True)
+
+    if headers["ETag"] in [etag.strip() for etag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    reservas = listar_reservas_de_usuario(db, current_user.id_usuario, ahora)
+
     if not reservas:
-        return {
+        contenido = {
             "message": "No se encontraron reservas para el usuario",
             "reservas": []
         }
-
-    reservas_formateadas = [
-        {
-            "id_reserva": reserva.id_reserva,
-            "dia_semana": reserva.dia_semana,
-            "hora": reserva.hora,
-            "centro": reserva.centro,
-            "clase": reserva.clase,
-            "activa": reserva.reserva_activa,
-            "fecha_reserva": reserva.fecha_reserva,
-            "confirmada": reserva_confirmada(reserva)
+    else:
+        contenido = {
+            "message": "Reservas encontradas",
+            "reservas": reservas
         }
-        for reserva in reservas
-    ]
+
+    return JSONResponse(jsonable_encoder(contenido), headers=headers)
+
+
+@router.get("/usuario/logs")
+def listar_logs_usuario(
+    id_reserva: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    cursor: Optional[int] = None,
+    limite: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Obtiene los logs del usuario logueado, del más reciente al más antiguo.
+    Se puede filtrar por reserva y por rango de fechas [desde, hasta).
+    Para obtener la página siguiente se pasa como cursor el valor de siguiente_cursor.
+    """
+    logs, siguiente_cursor = listar_logs(db, current_user.id_usuario, id_reserva, desde, hasta, cursor, limite)
 
     return {
-        "message": "Reservas encontradas",
-        "reservas": reservas_formateadas
+        "logs": logs,
+        "siguiente_cursor": siguiente_cursor
+    }
+
+
+@router.get("/reservas/estadisticas")
+def estadisticas_reservas(
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    centro: Optional[str] = None,
+    backend: Optional[str] = Query(None, pattern="^(api|selenium)$"),
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Percentiles p50/p95 del tiempo desde la apertura hasta la reserva por centro y clase,
+    con el desglose por fases, de las reservas con apertura en [desde, hasta).
+    Por defecto, los últimos 7 días. Requiere un usuario autenticado.
+    """
+    hasta = hasta or datetime.now()
+    desde = desde or hasta - timedelta(days=7)
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "clases": estadisticas_intentos(db, desde, hasta, centro, backend)
     }
 
 
 @router.get("/reservas/")
-def listar_reservas(db: Session = Depends(get_db)):
-    reservas = db.query(Reserva).all()
-    return reservas
+def listar_reservas(
+    centro: Optional[str] = None,
+    dia_semana: Optional[str] = None,
+    activa: Optional[bool] = None,
+    campos: Optional[str] = Query(None, description="Columnas separadas por comas. Por defecto todas"),
+    cursor: Optional[int] = None,
+    limite: int = Query(100, ge=1, le=1000),
+    formato: str = Query("json", pattern="^(json|ndjson|csv)$"),
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Lista las reservas ordenadas por id_reserva. Requiere un usuario autenticado.
+    - json: una página de `limite` reservas; la siguiente se pide con cursor=siguiente_cursor.
+    - ndjson / csv: exporta en streaming todas las reservas (desde el cursor, si se indica).
+    """
+    lista_campos = [campo.strip() for campo in campos.split(",") if campo.strip()] if campos else None
+    consulta = consulta_reservas(lista_campos, centro, dia_semana, activa, cursor)
+
+    if formato in TIPOS_EXPORTACION:
+        return StreamingResponse(
+            exportar(consulta, formato),
+            media_type=TIPOS_EXPORTACION[formato],
+            headers={"Content-Disposition": f"attachment; filename=reservas.{formato}"}
+        )
+
+    reservas, siguiente_cursor = listar_reservas_pagina(db, consulta, limite)
+    return {
+        "reservas": reservas,
+        "siguiente_cursor": siguiente_cursor
+    }
 
 
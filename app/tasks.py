@@ -1,21 +1,97 @@
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
-from concurrent.futures import ProcessPoolExecutor
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
 from app.db_utils import *
-from app.database import get_db
-from app.gateway.vg_selenium import makeReservation
+from app.database import JOBSTORE_URL, SessionLocal, crear_engine
+from app.gateway.vg_selenium import reservar_web
+from app.gateway.chrome_pool import chrome_pool
+from app.gateway.circuit_breaker import circuito_api, circuito_selenium
+from app.gateway.rate_limiter import PRESUPUESTOS, RAFAGA_GLOBAL, RATE_GLOBAL, rate_limiter
+import asyncio
 import calendar
-from app.utils.fernet_encryption import descifrar_contraseña
+import threading
 import time
 from app.gateway.vg_api import VG_API
-from app.gateway.correo import send_email
+from app.gateway import http_session
+from app.gateway.retry_policy import ESTADOS_SIN_RESPUESTA, RetryPolicy
+from app.gateway.vg_api_async import VG_API_Async
+from app.gateway.token_cache import credential_cache
+from app.gateway.correo import send_email, iniciar_outbox
+from app.utils.metricas import instrumentar_scheduler, registrar_reserva
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# Segundos de antelación con los que se prepara una reserva programada antes de su apertura
+ANTELACION_PREPARACION = int(os.getenv("RESERVA_ANTELACION_SEGUNDOS", "30"))
+
+# Segundos antes de la apertura en los que se refrescan las conexiones con el gimnasio (0 lo desactiva)
+PRECALENTAMIENTO_SEGUNDOS = float(os.getenv("VG_WARMUP_SEGUNDOS", "2"))
+
+# Cada cuántos minutos se renuevan los tokens del gimnasio que van a expirar en la próxima hora
+REFRESCO_TOKENS_MINUTOS = int(os.getenv("VG_TOKEN_REFRESH_MINUTOS", "10"))
+
+# Los logs con más de LOG_RETENCION_DIAS días se mueven a logs_historico, en lotes de LOG_RETENCION_LOTE filas
+LOG_RETENCION_DIAS = int(os.getenv("LOG_RETENCION_DIAS", "90"))
+LOG_RETENCION_LOTE = int(os.getenv("LOG_RETENCION_LOTE", "5000"))
+
+# Modo de ejecución de las reservas programadas: "threads" (hilos del scheduler) o "async" (bucle de eventos)
+MODO_EJECUCION = os.getenv("RESERVA_MODO", "threads").lower()
+# Máximo de peticiones simultáneas al gimnasio en el modo async
+CONCURRENCIA_ASYNC = int(os.getenv("RESERVA_ASYNC_CONCURRENCIA", "100"))
+
+# Modo del scheduler en el proceso de la API:
+# - "embebido": la API ejecuta las reservas (un único proceso).
+# - "api": la API solo guarda las tareas en el jobstore y las ejecuta el worker (python -m app.worker).
+MODO_SCHEDULER = os.getenv("SCHEDULER_MODO", "embebido").lower()
+# Cada cuántos segundos revisa el worker el jobstore en busca de tareas nuevas
+SONDEO_SEGUNDOS = float(os.getenv("WORKER_SONDEO_SEGUNDOS", "5"))
+
+# Segundos antes del precalentamiento en los que arranca la tarea de disparo, por si el scheduler despierta tarde
+MARGEN_DISPARO_SEGUNDOS = 1
+
+# Ejecutores del scheduler: un pool de hilos para las reservas por API (limitadas por E/S)
+# y otro independiente para las reservas por Selenium. Este último usa hilos para compartir
+# el pool de navegadores ya arrancados (chrome_pool); el número de navegadores abiertos a la vez
+# lo limita CHROME_POOL_MAXIMO.
+HILOS_RESERVAS = int(os.getenv("SCHEDULER_HILOS", "50"))
+HILOS_SELENIUM = int(os.getenv("SCHEDULER_HILOS_SELENIUM", os.getenv("SCHEDULER_PROCESOS_SELENIUM", "2")))
+
+# Valores por defecto de las tareas
+MAX_INSTANCIAS = int(os.getenv("SCHEDULER_MAX_INSTANCIAS", "1"))
+AGRUPAR_EJECUCIONES = os.getenv("SCHEDULER_COALESCE", "true").lower() == "true"
+MARGEN_MISFIRE = int(os.getenv("SCHEDULER_MISFIRE_SEGUNDOS", "60"))
+
+# Si la API del gimnasio no está disponible, la reserva se intenta por Selenium
+FALLBACK_SELENIUM = os.getenv("RESERVA_FALLBACK_SELENIUM", "true").lower() == "true"
+
+# Reintentos del disparo de la reserva tras la apertura (ver RESERVA_REINTENTO_* en retry_policy)
+POLITICA_REINTENTOS = RetryPolicy.from_env()
 
 jobstores = {
-    'default': SQLAlchemyJobStore(url='sqlite:///tasks.db')
+    'default': SQLAlchemyJobStore(engine=crear_engine(JOBSTORE_URL)),
+    # Tareas internas que se registran en cada arranque y no deben persistirse
+    'memoria': MemoryJobStore(),
 }
 
-scheduler = BackgroundScheduler(jobstores=jobstores)
+executors = {
+    'default': ThreadPoolExecutor(HILOS_RESERVAS),
+    'selenium': ThreadPoolExecutor(HILOS_SELENIUM),
+}
+
+job_defaults = {
+    'coalesce': AGRUPAR_EJECUCIONES,
+    'max_instances': MAX_INSTANCIAS,
+    'misfire_grace_time': MARGEN_MISFIRE,
+}
+
+scheduler = BackgroundScheduler(jobstores=jobstores, executors=executors, job_defaults=job_defaults)
+
+# Indica si este proceso ejecuta las tareas del scheduler (ver iniciar_scheduler)
+_ejecuta_tareas = True
 
 # Programar tarea de keep-alive para evitar que la aplicación se duerma
 @scheduler.scheduled_job('cron', hour=5, minute=0, id="keep_alive")
@@ -23,73 +99,504 @@ def keep_alive():
     print(f"[{datetime.now()}] Keep-alive ejecutado")
 
 
+# Renovación proactiva de los tokens del gimnasio para que las reservas no tengan que autenticarse.
+# Solo se renuevan los de usuarios con alguna reserva activa; los demás se descartan.
+@scheduler.scheduled_job('interval', minutes=REFRESCO_TOKENS_MINUTOS, id="refrescar_tokens", jobstore='memoria')
+def refrescar_tokens_gimnasio():
+    VG_API.refresh_cached_tokens(antelacion=3600, credenciales=_contraseñas_con_reservas_activas)
+
+
+def _contraseñas_con_reservas_activas(usernames: list) -> dict:
+    with SessionLocal() as db:
+        return contraseñas_con_reservas_activas(db, usernames)
+
+
+# Retención de logs: cada noche se archivan los logs antiguos para que la tabla logs no crezca sin límite
+@scheduler.scheduled_job('cron', hour=4, minute=0, id="archivar_logs", jobstore='memoria')
+def archivar_logs_antiguos():
+    limite = datetime.now() - timedelta(days=LOG_RETENCION_DIAS)
+    inicio = time.perf_counter()
+    with SessionLocal() as db:
+        archivados = archivar_logs(db, limite, LOG_RETENCION_LOTE)
+    print(f"[{datetime.now()}] Logs archivados: {archivados} anteriores a {limite:%Y-%m-%d} en {_ms_desde(inicio)} ms")
+
+
 def ejecutar_reserva(id_reserva, hora, centro, clase, fecha_reserva=None, programada=True):
-    # Obtener la sesión de la base de datos
-    db = next(get_db())
-    
+    """
+    Ejecuta una reserva en dos fases:
+    - Preparación: descifrado, autenticación, búsqueda de la clase y construcción de la petición.
+      En las reservas programadas se lanza ANTELACION_PREPARACION segundos antes de la apertura.
+    - Disparo: a la hora de apertura solo se envía la petición de creación de la reserva.
+      En las reservas programadas es una tarea aparte (ver lanzar_disparo).
 
-    # Obtengo la fecha en la que se realiza la reserva
-    if fecha_reserva is None:
-        # Si no se proporciona una fecha de reserva, se utiliza la fecha actual
-        fecha_reserva = datetime.now()
-
-    # Obtener el email del usuario que realizó la reserva
-    usuarioReserva = obtener_usuario_por_reserva(db, id_reserva)
-    email_usuario = usuarioReserva.id_usuario
-
-    if programada: # La reserva es programada (por defecto con un día de antelación), se añade es día a la fecha de reserva
-        print("La reserva es programada")
-        fecha_clase = fecha_reserva + timedelta(days=1) # Día siguiente al día de la reserva
-    else: # La reserva es inmediata
-        print("La reserva es inmediata")
-        fecha_clase = fecha_reserva
-    
-    # Si la reserva automática está activa, se procede a realizar la reserva
-    if reserva_activa(db, id_reserva):
+    Los tiempos de cada fase se registran en los logs de la reserva.
+    Con RESERVA_MODO=async las reservas programadas se delegan en el bucle de eventos de reservas.
 
-        insertar_log(db, id_usuario=email_usuario, id_reserva=id_reserva, mensaje=f"Ejecutando reserva en centro {centro}: para el día {fecha_clase.date()}, {clase} a las {hora}")
+    Si la API del gimnasio falla por no estar disponible, o su circuito está abierto,
+    la reserva se hace por Selenium (ver reservar_por_selenium).
+    """
+    if programada and MODO_EJECUCION == "async":
+        despachar_reserva_async(id_reserva, hora, centro, clase, fecha_reserva)
+        return
+
+    tiempos = {}
+    contexto = iniciar_reserva(id_reserva, hora, centro, clase, fecha_reserva, programada)
+    if contexto is None:
+        return
+    apertura = contexto["apertura"] if programada else None
+
+    # Con el circuito de la API abierto no se espera a un timeout: se pasa directamente a Selenium
+    if not circuito_api.permite():
+        registrar_log(contexto, "La API del gimnasio no está disponible (circuito abierto). Se reserva por Selenium.")
+        reservar_por_selenium(contexto, apertura, tiempos)
+        return
+
+    # Fase de preparación
+    preparada = preparar_reserva(contexto, tiempos)
+    if preparada is None:
+        registrar_intento(contexto, "api", contexto["resultado_preparacion"], tiempos)
+        if circuito_api.registrar(contexto.get("estado_api")):
+            reservar_por_selenium(contexto, apertura, tiempos)
+        return
+
+    # Fase de disparo. Las reservas inmediatas se disparan sin esperar; las programadas se disparan
+    # en una tarea propia poco antes de la apertura para no ocupar un hilo mientras tanto.
+    if apertura is not None and scheduler.running and _ejecuta_tareas:
+        lanzar_disparo(contexto, preparada, apertura, tiempos)
+        return
+    completar_reserva(contexto, preparada, apertura, tiempos)
+
+
+def completar_reserva(contexto, preparada, apertura, tiempos):
+    """
+    Dispara la reserva preparada, registra su resultado y, si la API del gimnasio no está
+    disponible, la pasa a Selenium.
+    """
+    participation_id, intentos = disparar_reserva(preparada, apertura, tiempos)
+    contexto["disparo"] = preparada["disparo"]
+    contexto["estado_reserva"] = preparada["vg_api"].last_booking_status
+    if participation_id is None and preparada["vg_api"].last_booking_status in ESTADOS_SIN_RESPUESTA:
+        # Antes de pasar a Selenium: la reserva sin respuesta pudo crearse y no debe duplicarse
+        participation_id = preparada["vg_api"].find_participation(contexto["centro"], preparada["fecha"], preparada["payload"]["bookingId"])
+    fallo_api = circuito_api.registrar(None if participation_id is not None else preparada["vg_api"].last_booking_status)
+    finalizar_reserva(contexto, participation_id, tiempos, intentos)
+    if fallo_api:
+        reservar_por_selenium(contexto, None, tiempos)
+
+
+def iniciar_reserva(id_reserva, hora, centro, clase, fecha_reserva=None, programada=True):
+    """
+    Carga de la base de datos los datos necesarios para ejecutar la reserva y calcula
+    la apertura y la fecha de la clase.
+    Returns dict con el contexto de la reserva o None si la reserva está inactiva.
+    """
+    inicio = datetime.now()
+    with SessionLocal() as db:
+        # Obtengo el instante de apertura de la reserva
+        if fecha_reserva is None:
+            # Si no se proporciona una fecha de reserva, se toma la apertura más cercana a la hora actual
+            apertura = instante_apertura(datetime.now(), hora)
+        else:
+            apertura = fecha_reserva.replace(hour=int(hora[:2]), minute=int(hora[3:]), second=0, microsecond=0)
 
-        # Ajusto la hora de la reserva
-        fecha_clase = fecha_clase.replace(hour=int(hora[:2]), minute=int(hora[3:]), second=0)
-    
-        # Obtengo la contraseña del usuario y las descifro
-        contraseña_usuario = descifrar_contraseña(usuarioReserva.contraseña)
-        vg_api = VG_API(email_usuario, contraseña_usuario)
+        # Obtener el email del usuario que realizó la reserva
+        usuarioReserva = obtener_usuario_por_reserva(db, id_reserva)
+        email_usuario = usuarioReserva.id_usuario
 
-        # Doy el formato requerido a la hora de la reserva. 
+        if programada: # La reserva es programada (por defecto con un día de antelación), se añade es día a la fecha de reserva
+            print("La reserva es programada")
+            fecha_clase = apertura + timedelta(days=1) # Día siguiente al día de la reserva
+        else: # La reserva es inmediata
+            print("La reserva es inmediata")
+            fecha_clase = apertura
+
+        # Si la reserva automática no está activa, no se ejecuta
+        if not reserva_activa(db, id_reserva):
+            insertar_log(db, id_usuario=email_usuario, id_reserva=id_reserva, mensaje=f"Reserva en centro {centro}: prevista para el día {fecha_clase.date()}, para la clase {clase} a las {hora} no ejecutada por estar inactiva.")
+            return None
+
+        insertar_log(db, id_usuario=email_usuario, id_reserva=id_reserva, mensaje=f"Ejecutando reserva en centro {centro}: para el día {fecha_clase.date()}, {clase} a las {hora}")
+
+        # Doy el formato requerido a la hora de la reserva.
         horas, minutos = hora.split(":")
-        booking_hour = f"{horas}:{minutos}"
 
-        # Autentico al usuario con el gimnasio
-        if not vg_api.authenticate():
-            insertar_log(db, id_usuario=email_usuario, id_reserva=id_reserva, mensaje=f"Error al autenticar al usuario {email_usuario}.")
-            return
+        return {
+            "id_reserva": id_reserva,
+            "centro": centro,
+            "clase": clase,
+            "email": email_usuario,
+            "contraseña_cifrada": usuarioReserva.contraseña,
+            "apertura": apertura,
+            "programada_para": apertura if programada else None,
+            "inicio": inicio,
+            "fecha_clase": fecha_clase.replace(hour=int(horas), minute=int(minutos), second=0, microsecond=0),
+            "booking_hour": f"{horas}:{minutos}",
+        }
+
+
+def preparar_reserva(contexto, tiempos):
+    """
+    Fase de preparación de la reserva: deja autenticado al usuario y construida la petición
+    de reserva para que en el disparo solo quede enviarla.
+    Returns dict con la reserva preparada o None si no se pudo preparar. En ese caso
+    deja en contexto["resultado_preparacion"] el motivo y en contexto["estado_api"] el
+    estado de la petición al gimnasio que falló, si la hubo.
+    """
+    # Obtengo la contraseña del usuario y las descifro
+    inicio = time.perf_counter()
+    contraseña_usuario = credential_cache.get(contexto["email"], contexto["contraseña_cifrada"])
+    tiempos["descifrado"] = _ms_desde(inicio)
+    vg_api = VG_API(contexto["email"], contraseña_usuario)
+
+    # Autentico al usuario con el gimnasio (reutiliza el token en caché si sigue vigente)
+    inicio = time.perf_counter()
+    autenticado = vg_api.authenticate()
+    tiempos["autenticacion"] = _ms_desde(inicio)
+    contexto["estado_autenticacion"] = vg_api.last_auth_status
+    if not autenticado:
+        contexto["estado_api"] = vg_api.last_auth_status
+        contexto["resultado_preparacion"] = "error_autenticacion"
+        registrar_log(contexto, f"Error al autenticar al usuario {contexto['email']}.")
+        return None
+
+    # Busco la clase en el horario del centro y construyo la petición de reserva
+    inicio = time.perf_counter()
+    payload = vg_api.prepare_booking(contexto["centro"], str(contexto["fecha_clase"].date()), contexto["booking_hour"], contexto["clase"])
+    tiempos["busqueda"] = _ms_desde(inicio)
+    if payload is None:
+        registrar_log(contexto, clasificar_busqueda_fallida(contexto, vg_api.last_search_status))
+        return None
+
+    return {"vg_api": vg_api, "payload": payload, "fecha": str(contexto["fecha_clase"].date()), "preparada_en": time.perf_counter()}
+
+
+def clasificar_busqueda_fallida(contexto, estado_busqueda) -> str:
+    """
+    Distingue por qué no se ha encontrado la clase. Si la búsqueda del horario falló
+    (timeout, conexión o código distinto de 200) es un error de la API: se anota su estado
+    en contexto["estado_api"] para el circuito. Si el horario se obtuvo, la clase no existe.
+    Deja el motivo en contexto["resultado_preparacion"].
+    Returns el mensaje para el log de la reserva.
+    """
+    descripcion = f"la clase {contexto['clase']} del día {contexto['fecha_clase'].date()} a las {contexto['booking_hour']}"
+    if estado_busqueda is not None and estado_busqueda != 200:
+        contexto["estado_api"] = estado_busqueda
+        contexto["resultado_preparacion"] = "error"
+        return f"Error al crear la reserva en centro {contexto['centro']}: no se pudo buscar {descripcion} (estado {estado_busqueda})."
+    contexto["resultado_preparacion"] = "clase_no_encontrada"
+    return f"Error al crear la reserva en centro {contexto['centro']}: no se encontró {descripcion}."
+
+
+def disparar_reserva(preparada, apertura, tiempos):
+    """
+    Fase de disparo: espera hasta la apertura (si se indica) y envía únicamente la petición de reserva.
+    Anota en preparada["disparo"] el instante en que se envía.
+    Returns (id de la reserva en el gimnasio o None si no se pudo crear, número de intentos).
+    """
+    if apertura is not None:
+        # La espera cuenta desde el fin de la preparación, aunque el disparo sea otra tarea
+        inicio = preparada["preparada_en"]
+        # Refresco las conexiones keep-alive justo antes de la apertura
+        if PRECALENTAMIENTO_SEGUNDOS > 0:
+            esperar_hasta(apertura - timedelta(seconds=PRECALENTAMIENTO_SEGUNDOS))
+            VG_API.warm_up()
+        esperar_hasta(apertura)
+        tiempos["espera"] = _ms_desde(inicio)
+
+    # participation_id es el id de la reserva en el sistema del gimnasio, útil para futuras cancelaciones.
+    # Si el gimnasio aún no ha abierto la clase o hay un error transitorio, se reintenta según POLITICA_REINTENTOS.
+    preparada["disparo"] = datetime.now()
+    inicio = time.perf_counter()
+    participation_id, intentos = POLITICA_REINTENTOS.run(preparada["vg_api"], preparada["payload"], apertura, preparada["fecha"])
+    tiempos["creacion"] = _ms_desde(inicio)
+
+    if apertura is not None:
+        # Tiempo desde la apertura hasta la respuesta del gimnasio
+        tiempos["hasta_reserva"] = round((datetime.now() - apertura).total_seconds() * 1000, 1)
+
+    return participation_id, intentos
+
+
+def finalizar_reserva(contexto, participation_id, tiempos, intentos=1):
+    """
+    Registra el resultado de la reserva. Si se ha creado, la confirma en la base de datos
+    y envía el correo de confirmación al usuario.
+    """
+    print(f"participation_id: {participation_id}")
+    resumen = ", ".join(f"{fase}={ms} ms" for fase, ms in tiempos.items())
+    print(f"Tiempos de la reserva {contexto['id_reserva']}: {resumen}")
 
-        # Intento realizar la reserva
-        # participation_id es el id de la reserva en el sistema del gimnasio, útil para futuras cancelaciones.
-        participation_id = vg_api.create_booking(centro, str(fecha_clase.date()), booking_hour, clase)
+    centro, clase, booking_hour = contexto["centro"], contexto["clase"], contexto["booking_hour"]
+    fecha_clase = contexto["fecha_clase"]
 
-        print(f"participation_id: {participation_id}")
+    with SessionLocal() as db:
+        insertar_log(db, id_usuario=contexto["email"], id_reserva=contexto["id_reserva"], mensaje=f"Tiempos de la reserva: {resumen}")
+        registrar_intento(
+            contexto, "api", "exito" if participation_id is not None else "error", tiempos, db,
+            intentos=intentos, id_reserva_gimnasio=int(participation_id) if participation_id is not None else None,
+        )
 
         if participation_id is None:
-            insertar_log(db, id_usuario=email_usuario, id_reserva=id_reserva, mensaje=f"Error al crear la reserva en centro {centro}: para el día {fecha_clase.date()}, {clase} a las {booking_hour}.")
+            insertar_log(db, id_usuario=contexto["email"], id_reserva=contexto["id_reserva"], mensaje=f"Error al crear la reserva en centro {centro}: para el día {fecha_clase.date()}, {clase} a las {booking_hour} tras {intentos} intento(s).")
             return
-        
-        insertar_log(db, id_usuario=email_usuario, id_reserva=id_reserva, mensaje=f"Reserva en centro {centro}: para el día {fecha_clase.date()}, {clase} a las {booking_hour} realizada con éxito.")
+
+        insertar_log(db, id_usuario=contexto["email"], id_reserva=contexto["id_reserva"], mensaje=f"Reserva en centro {centro}: para el día {fecha_clase.date()}, {clase} a las {booking_hour} realizada con éxito en el intento {intentos}.")
 
         # La reserva se ha creado correctamente, actualizo la base de datos con la fecha de reserva
         id_reserva_gimnasio = int(participation_id)
-        confirmar_reserva(db, id_reserva, fecha_clase, id_reserva_gimnasio)
+        confirmar_reserva(db, contexto["id_reserva"], fecha_clase, id_reserva_gimnasio)
 
-        # La reserva se crea correctamente, envío un correo de confirmación al usuario.
-        send_email(email_usuario, centro, fecha_clase.date(), clase, booking_hour)
+    # La reserva se crea correctamente, envío un correo de confirmación al usuario.
+    send_email(contexto["email"], centro, fecha_clase.date(), clase, booking_hour)
 
-        
-    else:
-        # Reserva cancelada
-        insertar_log(db, id_usuario=email_usuario, id_reserva=id_reserva, mensaje=f"Reserva en centro {centro}: prevista para el día {fecha_clase.date()}, para la clase {clase} a las {hora} no ejecutada por estar inactiva.")
-        #print(f"Reserva en centro {centro}: para el día {fecha_reserva.date()}, {clase} a las {hora} no ejecutada por estar inactiva.")
 
+def reservar_por_selenium(contexto, apertura, tiempos):
+    """
+    Reserva alternativa a través de la web del gimnasio con Selenium, para cuando la API
+    no está disponible. No bloquea el hilo de la reserva por API: la reserva se encola en el
+    ejecutor 'selenium' (ver lanzar_reserva_selenium) para la apertura, si se indica.
+    Returns True si la reserva se ha encolado.
+    """
+    if not FALLBACK_SELENIUM:
+        registrar_log(contexto, "La API del gimnasio no está disponible y la reserva por Selenium está desactivada. Reserva no realizada.")
+        return False
+
+    if not circuito_selenium.permite():
+        registrar_log(contexto, "Tampoco está disponible la reserva por Selenium (circuito abierto). Reserva no realizada.")
+        return False
+
+    lanzar_reserva_selenium(contexto, apertura, tiempos)
+    return True
+
+
+def ejecutar_reserva_selenium(contexto, apertura, tiempos):
+    """
+    Tarea del ejecutor 'selenium' que hace la reserva por la web. reservar_web envía el correo
+    de confirmación; aquí solo se registra el resultado y se confirma la reserva.
+    Al circuito de Selenium solo cuentan los fallos de la web o del navegador, no una clase
+    llena o inexistente ni la espera por un navegador libre.
+    Returns True si la reserva se ha realizado.
+    """
+    contraseña_usuario = credential_cache.get(contexto["email"], contexto["contraseña_cifrada"])
+    if apertura is not None:
+        esperar_hasta(apertura)
+
+    disparo = datetime.now()
+    inicio = time.perf_counter()
+    estado = reservar_web(contexto["email"], contraseña_usuario, str(contexto["fecha_clase"].date()), contexto["centro"], contexto["clase"], contexto["booking_hour"])
+    tiempos["selenium"] = _ms_desde(inicio)
+    realizada = estado == "exito"
+    hasta_reserva = round((datetime.now() - apertura).total_seconds() * 1000, 1) if apertura is not None else None
+    registrar_intento(
+        contexto, "selenium", RESULTADOS_SELENIUM.get(estado, "error"), tiempos,
+        disparo=disparo, estado_autenticacion=None, estado_reserva=estado, ms_hasta_reserva=hasta_reserva,
+    )
+    circuito_selenium.registrar(estado)
+
+    centro, clase, booking_hour = contexto["centro"], contexto["clase"], contexto["booking_hour"]
+    fecha_clase = contexto["fecha_clase"]
+    with SessionLocal() as db:
+        if not realizada:
+            insertar_log(db, id_usuario=contexto["email"], id_reserva=contexto["id_reserva"], mensaje=f"Error al crear la reserva por Selenium en centro {centro}: para el día {fecha_clase.date()}, {clase} a las {booking_hour} ({estado}, {tiempos['selenium']} ms).")
+            return False
+
+        insertar_log(db, id_usuario=contexto["email"], id_reserva=contexto["id_reserva"], mensaje=f"Reserva por Selenium en centro {centro}: para el día {fecha_clase.date()}, {clase} a las {booking_hour} realizada con éxito ({tiempos['selenium']} ms).")
+        # Selenium no devuelve el id de la reserva en el gimnasio
+        confirmar_reserva(db, contexto["id_reserva"], fecha_clase, None)
+    return True
+
+
+# Resultado en intentos_reserva de cada estado de reservar_web; el resto son "error"
+RESULTADOS_SELENIUM = {
+    "exito": "exito",
+    "clase_no_encontrada": "clase_no_encontrada",
+    "sin_plaza": "sin_plaza",
+    "sin_navegador": "sin_navegador",
+}
+
+# Fases de `tiempos` que se guardan en intentos_reserva según el backend
+FASES_INTENTO_API = ("descifrado", "autenticacion", "busqueda", "espera", "creacion", "hasta_reserva")
+FASES_INTENTO_SELENIUM = ("selenium",)
+
+
+def registrar_intento(contexto, backend, resultado, tiempos, db=None, **campos):
+    """
+    Guarda en intentos_reserva la ejecución de la reserva por un backend y la cuenta en las métricas.
+    campos completa o sustituye los datos que se toman del contexto (disparo, intentos, estados...).
+    """
+    fases = FASES_INTENTO_API if backend == "api" else FASES_INTENTO_SELENIUM
+    datos = {
+        "id_reserva": contexto["id_reserva"],
+        "id_usuario": contexto["email"],
+        "centro": str(contexto["centro"]),
+        "clase": contexto["clase"],
+        "fecha_clase": contexto["fecha_clase"],
+        "backend": backend,
+        "programada_para": contexto["programada_para"],
+        "inicio": contexto["inicio"],
+        "disparo": contexto.get("disparo"),
+        "estado_autenticacion": contexto.get("estado_autenticacion"),
+        "estado_reserva": contexto.get("estado_reserva"),
+        "resultado": resultado,
+        **{f"ms_{fase}": tiempos.get(fase) for fase in fases},
+        **campos,
+    }
+    # Los estados pueden ser códigos HTTP o "timeout"/"conexion"
+    for estado in ("estado_autenticacion", "estado_reserva"):
+        if datos[estado] is not None:
+            datos[estado] = str(datos[estado])
+
+    registrar_reserva(datos["centro"], backend, resultado == "exito", datos.get("ms_hasta_reserva"))
+    if db is not None:
+        insertar_intento_reserva(db, **datos)
+        return
+    with SessionLocal() as db:
+        insertar_intento_reserva(db, **datos)
+
+
+def registrar_log(contexto, mensaje):
+    with SessionLocal() as db:
+        insertar_log(db, id_usuario=contexto["email"], id_reserva=contexto["id_reserva"], mensaje=mensaje)
+
+
+# Ejecución asíncrona de reservas.
+# Un único bucle de eventos en un hilo propio atiende todas las reservas programadas, de modo
+# que cientos de reservas que abren en el mismo segundo se disparan a la vez en lugar de
+# esperar a que quede libre un hilo del scheduler.
+_loop_reservas = None
+_loop_lock = threading.Lock()
+_semaforo_reservas = None
+
+
+def loop_reservas() -> asyncio.AbstractEventLoop:
+    global _loop_reservas, _semaforo_reservas
+    with _loop_lock:
+        if _loop_reservas is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="reservas-async", daemon=True).start()
+            _semaforo_reservas = asyncio.Semaphore(CONCURRENCIA_ASYNC)
+            _loop_reservas = loop
+    return _loop_reservas
+
+
+def despachar_reserva_async(id_reserva, hora, centro, clase, fecha_reserva=None):
+    """
+    Encola la reserva en el bucle de eventos de reservas y libera inmediatamente el hilo del scheduler.
+    """
+    futuro = asyncio.run_coroutine_threadsafe(ejecutar_reserva_async(id_reserva, hora, centro, clase, fecha_reserva), loop_reservas())
+
+    def _comprobar(f):
+        if f.exception():
+            print(f"Error en la reserva asíncrona {id_reserva}: {f.exception()}")
+
+    futuro.add_done_callback(_comprobar)
+    return futuro
+
+
+async def ejecutar_reserva_async(id_reserva, hora, centro, clase, fecha_reserva=None, programada=True):
+    """
+    Equivalente asíncrono de ejecutar_reserva. Las fases de red usan VG_API_Async y se limitan a
+    CONCURRENCIA_ASYNC peticiones simultáneas. El acceso a la base de datos se hace en hilos.
+    """
+    tiempos = {}
+    contexto = await asyncio.to_thread(iniciar_reserva, id_reserva, hora, centro, clase, fecha_reserva, programada)
+    if contexto is None:
+        return
+
+    apertura = contexto["apertura"] if programada else None
+
+    if not circuito_api.permite():
+        await asyncio.to_thread(registrar_log, contexto, "La API del gimnasio no está disponible (circuito abierto). Se reserva por Selenium.")
+        await asyncio.to_thread(reservar_por_selenium, contexto, apertura, tiempos)
+        return
+
+    # Fase de preparación
+    inicio = time.perf_counter()
+    contraseña_usuario = credential_cache.get(contexto["email"], contexto["contraseña_cifrada"])
+    tiempos["descifrado"] = _ms_desde(inicio)
+    vg_api = VG_API_Async(contexto["email"], contraseña_usuario)
+
+    async with _semaforo_reservas:
+        inicio = time.perf_counter()
+        autenticado = await vg_api.authenticate()
+        tiempos["autenticacion"] = _ms_desde(inicio)
+        contexto["estado_autenticacion"] = vg_api.last_auth_status
+        if not autenticado:
+            await asyncio.to_thread(registrar_log, contexto, f"Error al autenticar al usuario {contexto['email']}.")
+            await asyncio.to_thread(registrar_intento, contexto, "api", "error_autenticacion", tiempos)
+            if circuito_api.registrar(vg_api.last_auth_status):
+                await asyncio.to_thread(reservar_por_selenium, contexto, apertura, tiempos)
+            return
+
+        inicio = time.perf_counter()
+        payload = await vg_api.prepare_booking(contexto["centro"], str(contexto["fecha_clase"].date()), contexto["booking_hour"], contexto["clase"])
+        tiempos["busqueda"] = _ms_desde(inicio)
+        if payload is None:
+            mensaje = clasificar_busqueda_fallida(contexto, vg_api.last_search_status)
+            await asyncio.to_thread(registrar_log, contexto, mensaje)
+            await asyncio.to_thread(registrar_intento, contexto, "api", contexto["resultado_preparacion"], tiempos)
+            if circuito_api.registrar(contexto.get("estado_api")):
+                await asyncio.to_thread(reservar_por_selenium, contexto, apertura, tiempos)
+            return
+
+    # Fase de disparo. La espera hasta la apertura no ocupa plaza en el semáforo.
+    if apertura is not None:
+        inicio = time.perf_counter()
+        await esperar_hasta_async(apertura)
+        tiempos["espera"] = _ms_desde(inicio)
+
+    async with _semaforo_reservas:
+        contexto["disparo"] = datetime.now()
+        inicio = time.perf_counter()
+        participation_id, intentos = await POLITICA_REINTENTOS.run_async(vg_api, payload, apertura, str(contexto["fecha_clase"].date()))
+        tiempos["creacion"] = _ms_desde(inicio)
+    contexto["estado_reserva"] = vg_api.last_booking_status
+    if participation_id is None and vg_api.last_booking_status in ESTADOS_SIN_RESPUESTA:
+        # Antes de pasar a Selenium: la reserva sin respuesta pudo crearse y no debe duplicarse
+        participation_id = await vg_api.find_participation(contexto["centro"], str(contexto["fecha_clase"].date()), payload["bookingId"])
+
+    if apertura is not None:
+        tiempos["hasta_reserva"] = round((datetime.now() - apertura).total_seconds() * 1000, 1)
+
+    fallo_api = circuito_api.registrar(None if participation_id is not None else vg_api.last_booking_status)
+    await asyncio.to_thread(finalizar_reserva, contexto, participation_id, tiempos, intentos)
+    if fallo_api:
+        await asyncio.to_thread(reservar_por_selenium, contexto, None, tiempos)
+
+
+async def esperar_hasta_async(instante: datetime):
+    while True:
+        restante = (instante - datetime.now()).total_seconds()
+        if restante <= 0:
+            return
+        await asyncio.sleep(restante - 0.02 if restante > 0.05 else 0.001)
+
+
+def _ms_desde(inicio: float) -> float:
+    return round((time.perf_counter() - inicio) * 1000, 1)
+
+
+def esperar_hasta(instante: datetime):
+    """
+    Bloquea hasta el instante indicado. Duerme de forma gruesa y afina en los últimos milisegundos
+    para no disparar antes de tiempo.
+    """
+    while True:
+        restante = (instante - datetime.now()).total_seconds()
+        if restante <= 0:
+            return
+        time.sleep(restante - 0.02 if restante > 0.05 else 0.001)
+
+
+def instante_apertura(ahora: datetime, hora_reserva: str) -> datetime:
+    """
+    Devuelve la ocurrencia de hora_reserva ("HH:MM") más cercana a ahora (ayer, hoy o mañana).
+    Como la tarea se lanza con antelación o con algo de retraso, esto permite saber
+    qué apertura le corresponde incluso cerca de la medianoche.
+    """
+    hoy = ahora.replace(hour=int(hora_reserva[:2]), minute=int(hora_reserva[3:]), second=0, microsecond=0)
+    candidatos = [hoy + timedelta(days=dias) for dias in (-1, 0, 1)]
+    return min(candidatos, key=lambda candidato: abs(candidato - ahora))
 
 
 def proxima_fecha_reserva(fecha_actual:datetime, dia_reserva:int, hora_reserva:str) -> datetime:
@@ -112,18 +619,46 @@ def proxima_fecha_reserva(fecha_actual:datetime, dia_reserva:int, hora_reserva:s
 
     return proxima_fecha
 
+def dia_programacion(dia_semana: str) -> int:
+    """
+    Índice (0=Lunes, 6=Domingo) del día en el que se lanza una reserva programada,
+    que es el día anterior al de la clase.
+    """
+    return (list(calendar.day_name).index(dia_semana.capitalize()) - 1) % 7
+
+
+def campos_disparador(dia_idx: int, hora_reserva: str) -> dict:
+    """
+    Calcula los campos del disparador cron de una reserva: la hora de apertura menos
+    ANTELACION_PREPARACION segundos, ajustando el día de la semana si se cruza la medianoche.
+    """
+    # 2024-01-01 fue lunes, por lo que sirve de referencia para el día de la semana
+    apertura = datetime(2024, 1, 1 + dia_idx, int(hora_reserva[:2]), int(hora_reserva[3:]))
+    lanzamiento = apertura - timedelta(seconds=ANTELACION_PREPARACION)
+    return {
+        "day_of_week": lanzamiento.weekday(),
+        "hour": lanzamiento.hour,
+        "minute": lanzamiento.minute,
+        "second": lanzamiento.second,
+    }
+
 def eliminar_reserva_programada(id_reserva):
-    try:
-        # Intentar remover la tarea programada del scheduler
-        job = scheduler.get_job(id_reserva)
-        if job:
-            scheduler.remove_job(id_reserva)
-            print(f"Reserva ID {id_reserva} cancelada exitosamente.")
-        else:
-            print(f"No se encontró tarea programada con ID {id_reserva}. No es necesario cancelar ninguna tarea.")
-    except Exception as e:
-        # Si ocurre cualquier otro error, se maneja y no interrumpe el flujo
-        print(f"Error al cancelar la reserva ID {id_reserva}: {e}")
+    """
+    Elimina del scheduler la tarea semanal de la reserva y, si la hay, su ejecución inmediata
+    pendiente, que programar_reserva crea aparte cuando este proceso no ejecuta las tareas.
+    """
+    for id_job in (str(id_reserva), f"{id_reserva}_inmediata"):
+        try:
+            # Intentar remover la tarea programada del scheduler
+            job = scheduler.get_job(id_job)
+            if job:
+                scheduler.remove_job(id_job)
+                print(f"Tarea {id_job} de la reserva ID {id_reserva} cancelada exitosamente.")
+            else:
+                print(f"No se encontró tarea programada con ID {id_job}. No es necesario cancelar ninguna tarea.")
+        except Exception as e:
+            # Si ocurre cualquier otro error, se maneja y no interrumpe el flujo
+            print(f"Error al cancelar la tarea {id_job} de la reserva ID {id_reserva}: {e}")
  
 
 # Función para programar la tarea
@@ -153,30 +688,163 @@ def programar_reserva(id_reserva, dia_semana, hora, centro, clase):
     if dentro_de_24_horas:
         # Reserva inmediata
         print("Intento ejecutar reserva inmediata...")
-        ejecutar_reserva(id_reserva, hora, centro, clase, fecha_reserva=proxima_fecha, programada=False)
+        if _ejecuta_tareas:
+            ejecutar_reserva(id_reserva, hora, centro, clase, fecha_reserva=proxima_fecha, programada=False)
+        else:
+            # Este proceso no ejecuta tareas: se delega en el worker a través del jobstore
+            scheduler.add_job(
+                ejecutar_reserva,
+                'date',
+                args = [id_reserva, hora, centro, clase],
+                kwargs = {"fecha_reserva": proxima_fecha, "programada": False},
+                id = f"{id_reserva}_inmediata",
+                replace_existing = True,
+            )
 
     # Para reservas programadas, la reserva debe hacerse con un día de antelación
-    dia_idx = (dia_idx - 1) % 7
+    dia_idx = dia_programacion(dia_semana)
     proxima_fecha = proxima_fecha_reserva(fecha_actual=ahora, dia_reserva=dia_idx, hora_reserva=hora)
 
     # El id de la tarea va a coincidir con el id de la reserva en la base de datos
     id_job = str(id_reserva)
     print("Se ha programado una reserva con id", id_job)
 
-    # Programo la reserva
+    # Programo la reserva. La tarea arranca ANTELACION_PREPARACION segundos antes para preparar la reserva
+    # y dispararla justo a la hora de apertura.
     print("Fecha próxima reserva:", proxima_fecha)
     scheduler.add_job(
         ejecutar_reserva,
         'cron',
-        day_of_week = dia_idx,
-        hour = hora.split(":")[0],
-        minute = hora.split(":")[1],
-        #second = 1,  # Añado 1 segundo de margen para evitar problemas de sincronización
+        **campos_disparador(dia_idx, hora),
         args = [id_reserva, hora, centro, clase],
-        misfire_grace_time=60,  # Permite 1 minuto de retraso en caso de que el sistema esté ocupado
+        misfire_grace_time=MARGEN_MISFIRE,  # Permite cierto retraso en caso de que el sistema esté ocupado
         id = id_job,
     )
   
 
-if not scheduler.running:
-    scheduler.start()
+def lanzar_disparo(contexto, preparada, apertura, tiempos):
+    """
+    Programa el disparo de una reserva ya preparada como una tarea propia, que arranca justo
+    antes del precalentamiento. Así el hilo que la ha preparado queda libre durante los
+    ANTELACION_PREPARACION segundos hasta la apertura, y las reservas que abren a la vez no
+    esperan a que se libere un hilo del ejecutor 'default'.
+    La tarea va al jobstore en memoria porque lleva la sesión del usuario con el gimnasio, y
+    se ejecuta aunque el scheduler despierte tarde: no tiene margen de misfire.
+    """
+    inicio = apertura - timedelta(seconds=PRECALENTAMIENTO_SEGUNDOS + MARGEN_DISPARO_SEGUNDOS)
+    if inicio <= datetime.now():
+        # La preparación ha terminado tarde: se dispara en este mismo hilo
+        completar_reserva(contexto, preparada, apertura, tiempos)
+        return None
+    return scheduler.add_job(
+        completar_reserva,
+        'date',
+        run_date = inicio,
+        args = [contexto, preparada, apertura, tiempos],
+        jobstore = 'memoria',
+        misfire_grace_time = None,
+    )
+
+
+def lanzar_reserva_selenium(contexto, apertura, tiempos):
+    """
+    Ejecuta la reserva por Selenium en su propio ejecutor sin bloquear el hilo que la llama.
+    Se programa para la apertura (o para ya, si no se indica), así que no ocupa un hilo de
+    Selenium mientras espera. La tarea se guarda en el jobstore en memoria para no persistir
+    el contexto de la reserva, con la contraseña cifrada del usuario.
+    """
+    return scheduler.add_job(
+        ejecutar_reserva_selenium,
+        'date',
+        run_date = apertura,
+        args = [contexto, apertura, tiempos],
+        executor = 'selenium',
+        jobstore = 'memoria',
+    )
+
+
+def informe_concurrencia():
+    """
+    Muestra la concurrencia efectiva del scheduler y del transporte HTTP al arrancar.
+    """
+    print("Concurrencia del scheduler:")
+    print(f"  - Reservas por API: {HILOS_RESERVAS} hilos (modo {MODO_EJECUCION}" + (f", {CONCURRENCIA_ASYNC} peticiones async simultáneas)" if MODO_EJECUCION == "async" else ")"))
+    print(f"  - Reservas por Selenium: {HILOS_SELENIUM} hilos, {chrome_pool.maximo} navegadores como máximo")
+    print(f"  - Tareas: max_instances={MAX_INSTANCIAS}, coalesce={AGRUPAR_EJECUCIONES}, misfire_grace_time={MARGEN_MISFIRE}s")
+    print(f"  - Conexiones HTTP con el gimnasio: {http_session.POOL_MAXSIZE}")
+    if rate_limiter.activo:
+        print(f"  - Límite de peticiones al gimnasio: {RATE_GLOBAL}/s (ráfaga {RAFAGA_GLOBAL}, {rate_limiter.reserva_prioritaria:.0f} tokens reservados para reservas)")
+    if MODO_EJECUCION != "async" and HILOS_RESERVAS > http_session.POOL_MAXSIZE:
+        print(f"  Aviso: hay más hilos ({HILOS_RESERVAS}) que conexiones en el pool HTTP ({http_session.POOL_MAXSIZE}). Aumenta VG_POOL_MAXSIZE.")
+    if rate_limiter.activo:
+        with SessionLocal() as db:
+            reservas = max_reservas_por_apertura(db)
+        logins = logins_antes_de_apertura()
+        if reservas > logins:
+            print(f"  Aviso: hasta {reservas} reservas comparten apertura, pero el límite de logins solo permite {logins} "
+                  f"en los {ANTELACION_PREPARACION} s de preparación. Sin token en caché, las demás se prepararán tarde. "
+                  f"Aumenta VG_RATE_LOGIN o RESERVA_ANTELACION_SEGUNDOS.")
+
+
+def logins_antes_de_apertura() -> int:
+    """
+    Logins al gimnasio que caben en la preparación de una apertura (ANTELACION_PREPARACION
+    segundos) según los presupuestos del limitador: el de logins y la parte del global que no
+    está reservada para las reservas.
+    """
+    capacidades = []
+    tasa, rafaga = PRESUPUESTOS["login"]
+    if tasa > 0:
+        capacidades.append(rafaga + tasa * ANTELACION_PREPARACION)
+    if RATE_GLOBAL > 0:
+        capacidades.append(RAFAGA_GLOBAL - rate_limiter.reserva_prioritaria + RATE_GLOBAL * ANTELACION_PREPARACION)
+    return int(min(capacidades)) if capacidades else 0
+
+
+def sondear_jobstore():
+    # No hace nada: basta con que el scheduler despierte para leer las tareas nuevas del jobstore
+    pass
+
+
+def iniciar_scheduler(ejecutar: bool = True):
+    """
+    Arranca el scheduler.
+    Si ejecutar es False el scheduler arranca en pausa: las tareas se guardan en el jobstore
+    compartido pero no se ejecutan en este proceso, sino en el worker (python -m app.worker).
+    """
+    global _ejecuta_tareas
+    if scheduler.running:
+        return
+
+    _ejecuta_tareas = ejecutar
+    if ejecutar:
+        # El worker no se entera de las tareas que añade la API hasta que despierta,
+        # así que se despierta al menos cada SONDEO_SEGUNDOS para leer el jobstore.
+        scheduler.add_job(
+            sondear_jobstore,
+            'interval',
+            seconds = SONDEO_SEGUNDOS,
+            id = "sondeo_jobstore",
+            jobstore = 'memoria',
+            replace_existing = True,
+        )
+        instrumentar_scheduler(scheduler)
+        scheduler.start()
+        # Los correos de confirmación se envían desde el proceso que ejecuta las reservas
+        iniciar_outbox()
+        # Los navegadores tardan varios segundos en arrancar: se arrancan antes de necesitarlos
+        threading.Thread(target=chrome_pool.precalentar, name="chrome-pool", daemon=True).start()
+        informe_concurrencia()
+    else:
+        scheduler.start(paused=True)
+        print("Scheduler iniciado en modo API: las reservas se ejecutan en el worker.")
+
+
+def detener_scheduler():
+    """
+    Detiene el scheduler. Un scheduler en pausa no se detiene con shutdown(), porque al
+    despertar por última vez procesaría las tareas vencidas y podría eliminar tareas de un
+    solo uso que le corresponde ejecutar al worker. Su hilo es daemon y termina con el proceso.
+    """
+    if scheduler.running and _ejecuta_tareas:
+        scheduler.shutdown()
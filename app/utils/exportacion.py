@@ -0,0 +1,47 @@
+import csv
+import io
+import json
+from datetime import datetime
+from app.database import SessionLocal
+
+# Filas que se leen de la base de datos y se envían al cliente en cada bloque
+EXPORTACION_LOTE = 1000
+
+TIPOS_EXPORTACION = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _serializar(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor)}")
+
+
+def _ndjson(columnas: list, filas) -> str:
+    return "".join(json.dumps(dict(zip(columnas, fila)), default=_serializar, ensure_ascii=False) + "\n" for fila in filas)
+
+
+def _csv(filas) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(filas)
+    return buffer.getvalue()
+
+
+def exportar(consulta, formato: str):
+    """
+    Generador que recorre la consulta con un cursor del servidor (stream_results) y envía
+    las filas en bloques de EXPORTACION_LOTE, sin cargar la tabla entera en memoria.
+
+    Abre su propia sesión: la de get_db ya está cerrada cuando se envía la respuesta.
+    """
+    with SessionLocal() as db:
+        resultado = db.execute(consulta.execution_options(stream_results=True, yield_per=EXPORTACION_LOTE))
+        columnas = list(resultado.keys())
+
+        if formato == "csv":
+            yield _csv([columnas])
+
+        for bloque in resultado.partitions():
+            yield _csv(bloque) if formato == "csv" else _ndjson(columnas, bloque)
@@ -1,14 +1,21 @@
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Cargar la clave desde el archivo .env
-fernet_key = os.getenv('FERNET_KEY')
+# Cargar las claves desde el archivo .env.
+# FERNET_KEYS admite varias claves separadas por comas: la primera cifra y todas descifran,
+# así se puede rotar la clave sin dejar de leer las contraseñas cifradas con las anteriores.
+# FERNET_KEY se mantiene para las instalaciones con una sola clave.
+fernet_keys = os.getenv('FERNET_KEYS') or os.getenv('FERNET_KEY')
+if not fernet_keys:
+    raise RuntimeError("No se ha configurado FERNET_KEYS ni FERNET_KEY")
 
-# Inicializar el cifrador Fernet con la clave
-cipher = Fernet(fernet_key.encode())
+# Inicializar el cifrador con las claves
+claves = [Fernet(clave.strip().encode()) for clave in fernet_keys.split(",") if clave.strip()]
+clave_principal = claves[0]
+cipher = MultiFernet(claves)
 
 # Funciones de cifrado y descifrado
 def cifrar_contraseña(contraseña: str) -> str:
@@ -20,3 +27,16 @@ def descifrar_contraseña(contraseña_cifrada: str) -> str:
     contraseña_bytes = contraseña_cifrada.encode('utf-8')  # Convertir de string a bytes
     contraseña_descifrada = cipher.decrypt(contraseña_bytes)
     return contraseña_descifrada.decode('utf-8')  # Convertir a string
+
+def cifrada_con_clave_principal(contraseña_cifrada: str) -> bool:
+    try:
+        clave_principal.decrypt(contraseña_cifrada.encode('utf-8'))
+        return True
+    except InvalidToken:
+        return False
+
+def rotar_contraseña(contraseña_cifrada: str) -> str:
+    """
+    Vuelve a cifrar con la clave principal una contraseña cifrada con cualquiera de las claves.
+    """
+    return cipher.rotate(contraseña_cifrada.encode('utf-8')).decode('utf-8')
@@ -5,11 +5,15 @@ from typing import Annotated
 from pydantic import BaseModel
 from jwt.exceptions import InvalidTokenError
 from fastapi import Depends, HTTPException, status
-from app.database import get_db
+from fastapi.concurrency import run_in_threadpool
+from app.database import SessionLocal, get_db
 from app.database import Usuario
 from sqlalchemy.orm import Session
+from collections import OrderedDict
 from dotenv import load_dotenv
 import os
+import threading
+import time
 
 
 # Clave secreta para firmar los tokens 
@@ -32,11 +36,68 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: str | None = None
 
-def get_user_on_db(username: str):
-    # Obtener la sesión de la base de datos
-    db = next(get_db())
-    usuario = db.get(Usuario, username)
-    return usuario
+# Caché de usuarios autenticados: evita una consulta a la base de datos por cada petición.
+# Es local a cada proceso: invalidate() solo limpia la del proceso que cambia el usuario, así que
+# con varios workers de uvicorn los demás pueden servir el usuario anterior durante PRINCIPAL_TTL
+# segundos. Por eso la caducidad es corta; con 0 se desactiva.
+PRINCIPAL_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "10"))
+PRINCIPAL_MAXIMO = int(os.getenv("PRINCIPAL_CACHE_MAXIMO", "1024"))
+
+
+class PrincipalCache:
+    """
+    Caché LRU con caducidad de los usuarios autenticados, por sujeto del token.
+    Guarda copias desvinculadas de la sesión, por lo que no deben modificarse.
+    Las invalidaciones no llegan a otros procesos (ver PRINCIPAL_TTL).
+    """
+
+    def __init__(self, ttl: float = PRINCIPAL_TTL, maximo: int = PRINCIPAL_MAXIMO):
+        self.ttl = ttl
+        self.maximo = maximo
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sub: str):
+        with self._lock:
+            entrada = self._entradas.get(sub)
+            if entrada is None:
+                return None
+            if entrada[0] <= time.monotonic():
+                del self._entradas[sub]
+                return None
+            self._entradas.move_to_end(sub)
+            return entrada[1]
+
+    def store(self, sub: str, usuario: Usuario):
+        if self.ttl <= 0:
+            return
+        copia = Usuario(id_usuario=usuario.id_usuario, contraseña=usuario.contraseña)
+        with self._lock:
+            self._entradas[sub] = (time.monotonic() + self.ttl, copia)
+            self._entradas.move_to_end(sub)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+
+    def invalidate(self, sub: str = None):
+        with self._lock:
+            if sub is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(sub, None)
+
+
+principal_cache = PrincipalCache()
+
+
+def get_user_on_db(username: str, db: Session = None):
+    """
+    Busca el usuario en la base de datos. Si no se pasa una sesión se abre una
+    que se cierra al terminar.
+    """
+    if db is not None:
+        return db.get(Usuario, username)
+    with SessionLocal() as db:
+        return db.get(Usuario, username)
     
 def create_token(data: dict, expires_delta: int):
     """
@@ -68,7 +129,7 @@ def verify_token(token: str):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)):
 
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -84,7 +145,13 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     except InvalidTokenError:
         raise credentials_exception
    
-    user = get_user_on_db(username=token_data.username)
+    user = principal_cache.get(token_data.username)
+    if user is not None:
+        return user
+
+    # La consulta es bloqueante: se hace fuera del bucle de eventos con la sesión de la petición
+    user = await run_in_threadpool(get_user_on_db, token_data.username, db)
     if user is None:
         raise credentials_exception
+    principal_cache.store(token_data.username, user)
     return user
@@ -0,0 +1,119 @@
+import atexit
+import os
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from app.database import Log, SessionLocal
+
+load_dotenv()
+
+# Si está desactivado, insertar_log escribe cada log en su propia transacción como antes
+LOG_BUFFER_ACTIVO = os.getenv("LOG_BUFFER_ACTIVO", "true").lower() == "true"
+# Número de logs acumulados que provoca una escritura inmediata
+LOG_BUFFER_TAMAÑO = int(os.getenv("LOG_BUFFER_SIZE", "100"))
+# Segundos máximos que un log permanece en memoria antes de escribirse
+LOG_BUFFER_INTERVALO = float(os.getenv("LOG_BUFFER_INTERVALO", "2"))
+# Límite de logs en memoria si la base de datos no está disponible; los más antiguos se descartan
+LOG_BUFFER_MAXIMO = int(os.getenv("LOG_BUFFER_MAXIMO", "10000"))
+
+
+class LogBuffer:
+    """
+    Acumula los logs en memoria y los escribe en bloque en una sola transacción, cuando
+    se alcanza LOG_BUFFER_TAMAÑO, cada LOG_BUFFER_INTERVALO segundos y al terminar el proceso.
+    Así las reservas no esperan a que SQLite sincronice el disco por cada línea de log.
+    """
+
+    def __init__(self, tamaño: int = LOG_BUFFER_TAMAÑO, intervalo: float = LOG_BUFFER_INTERVALO, maximo: int = LOG_BUFFER_MAXIMO):
+        self.tamaño = tamaño
+        self.intervalo = intervalo
+        self.maximo = maximo
+        self._registros = []
+        self._lock = threading.Lock()
+        self._escritura_lock = threading.Lock()
+        self._lleno = threading.Event()
+        self._hilo = None
+
+    def añadir(self, id_usuario, id_reserva, mensaje) -> dict:
+        registro = {
+            "id_usuario": id_usuario,
+            "id_reserva": id_reserva,
+            "mensaje": mensaje,
+            "fecha_creacion": datetime.now(),
+        }
+        with self._lock:
+            self._registros.append(registro)
+            pendientes = len(self._registros)
+            if self._hilo is None:
+                self._iniciar()
+
+        if pendientes >= self.tamaño:
+            self._lleno.set()
+        return registro
+
+    def flush(self) -> int:
+        """
+        Escribe en la base de datos todos los logs pendientes.
+        Si el bloque falla se escriben uno a uno (ver _escribir_por_filas), para que un log
+        inválido no impida escribir el resto.
+        Returns el número de logs escritos.
+        """
+        with self._escritura_lock:
+            with self._lock:
+                registros, self._registros = self._registros, []
+            if not registros:
+                return 0
+
+            try:
+                with SessionLocal() as db:
+                    db.execute(insert(Log), registros)
+                    db.commit()
+            except Exception as e:
+                print(f"Error al escribir {len(registros)} logs en la base de datos: {e}")
+                return self._escribir_por_filas(registros)
+
+            return len(registros)
+
+    def _escribir_por_filas(self, registros: list) -> int:
+        """
+        Escribe los logs en una transacción con un savepoint por log. Los que la base de datos
+        rechaza (p. ej. por una clave ajena que ya no existe) se descartan, porque fallarían
+        siempre. Si falla otra cosa, como la conexión, se devuelven todos al buffer para
+        reintentarlo en la siguiente escritura.
+        Returns el número de logs escritos.
+        """
+        descartados = 0
+        try:
+            with SessionLocal() as db:
+                for registro in registros:
+                    try:
+                        with db.begin_nested():
+                            db.execute(insert(Log), [registro])
+                    except (IntegrityError, DataError) as e:
+                        descartados += 1
+                        print(f"Log descartado ({registro['id_usuario']}, reserva {registro['id_reserva']}): {e.orig}")
+                db.commit()
+        except Exception as e:
+            print(f"Error al escribir {len(registros)} logs en la base de datos: {e}")
+            with self._lock:
+                self._registros = (registros + self._registros)[-self.maximo:]
+            return 0
+
+        return len(registros) - descartados
+
+    def _iniciar(self):
+        self._hilo = threading.Thread(target=self._bucle, name="log-buffer", daemon=True)
+        self._hilo.start()
+        atexit.register(self.flush)
+
+    def _bucle(self):
+        while True:
+            self._lleno.wait(self.intervalo)
+            self._lleno.clear()
+            self.flush()
+
+
+# Buffer compartido por todo el proceso
+log_buffer = LogBuffer()
@@ -0,0 +1,136 @@
+import os
+import time
+from datetime import datetime
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess, start_http_server
+from sqlalchemy import event
+
+load_dotenv()
+
+# Puerto en el que el worker expone sus métricas (0 lo desactiva). La API las expone en /metrics.
+METRICAS_PUERTO_WORKER = int(os.getenv("METRICAS_PUERTO_WORKER", "9100"))
+
+# Con varios procesos de uvicorn, prometheus_client agrega las métricas de todos ellos
+# si PROMETHEUS_MULTIPROC_DIR apunta a un directorio compartido (vacío al arrancar).
+MULTIPROCESO = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Buckets en segundos pensados para peticiones de red y la apertura de las reservas
+BUCKETS_RED = (0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2.5, 5, 10, 30)
+BUCKETS_RAPIDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+LATENCIA_GIMNASIO = Histogram(
+    "vg_peticion_segundos",
+    "Duración de las peticiones a la API del gimnasio por endpoint",
+    ["endpoint"],
+    buckets=BUCKETS_RED,
+)
+ESPERA_RATE_LIMIT = Histogram(
+    "vg_rate_limit_espera_segundos",
+    "Espera por el limitador de peticiones al gimnasio por endpoint",
+    ["endpoint"],
+    buckets=BUCKETS_RAPIDOS,
+)
+RETRASO_SCHEDULER = Histogram(
+    "scheduler_retraso_disparo_segundos",
+    "Retraso entre la hora programada de una tarea y su envío al ejecutor",
+    ["jobstore"],
+    buckets=BUCKETS_RAPIDOS + (5, 10, 30, 60),
+)
+TAREAS_PERDIDAS = Counter(
+    "scheduler_tareas_perdidas",
+    "Ejecuciones de tareas descartadas por el scheduler (misfire o max_instances)",
+    ["jobstore", "motivo"],
+)
+# Sin la clase como etiqueta: es texto libre del usuario y crearía una serie por cada nombre distinto.
+# El detalle por clase está en intentos_reserva (GET /reservas/estadisticas).
+RESERVAS = Counter(
+    "reservas",
+    "Reservas ejecutadas por centro, backend y resultado",
+    ["centro", "backend", "resultado"],
+)
+HASTA_RESERVA = Histogram(
+    "reserva_hasta_confirmacion_segundos",
+    "Tiempo desde la apertura de la reserva hasta la respuesta del gimnasio",
+    ["backend"],
+    buckets=BUCKETS_RED,
+)
+COMMIT_DB = Histogram(
+    "db_commit_segundos",
+    "Duración de los commits de las sesiones de base de datos",
+    buckets=BUCKETS_RAPIDOS,
+)
+PETICIONES_HTTP = Histogram(
+    "http_peticion_segundos",
+    "Duración de las peticiones a la API de reservas por ruta",
+    ["metodo", "ruta", "estado"],
+    buckets=BUCKETS_RAPIDOS + (5, 10),
+)
+
+
+def registrar_reserva(centro, backend: str, realizada: bool, hasta_reserva_ms: float = None):
+    """
+    Cuenta el resultado de una reserva y, si se ha realizado en la apertura,
+    el tiempo hasta su confirmación.
+    """
+    RESERVAS.labels(str(centro), backend, "exito" if realizada else "error").inc()
+    if realizada and hasta_reserva_ms is not None:
+        HASTA_RESERVA.labels(backend).observe(hasta_reserva_ms / 1000)
+
+
+def instrumentar_commits(fabrica_sesiones):
+    """
+    Mide la duración de los commits (incluido el flush) de las sesiones creadas por la fábrica.
+    """
+    @event.listens_for(fabrica_sesiones, "before_commit")
+    def _inicio_commit(session):
+        session.info["inicio_commit"] = time.perf_counter()
+
+    @event.listens_for(fabrica_sesiones, "after_commit")
+    def _fin_commit(session):
+        inicio = session.info.pop("inicio_commit", None)
+        if inicio is not None:
+            COMMIT_DB.observe(time.perf_counter() - inicio)
+
+
+def instrumentar_scheduler(scheduler):
+    """
+    Registra el retraso de disparo de cada tarea y las ejecuciones que el scheduler descarta.
+    """
+    def _tarea_enviada(evento):
+        if evento.scheduled_run_times:
+            programada = evento.scheduled_run_times[-1]
+            retraso = (datetime.now(programada.tzinfo) - programada).total_seconds()
+            RETRASO_SCHEDULER.labels(evento.jobstore).observe(max(retraso, 0))
+
+    def _tarea_perdida(evento):
+        motivo = "misfire" if evento.code == EVENT_JOB_MISSED else "max_instancias"
+        TAREAS_PERDIDAS.labels(evento.jobstore, motivo).inc()
+
+    scheduler.add_listener(_tarea_enviada, EVENT_JOB_SUBMITTED)
+    scheduler.add_listener(_tarea_perdida, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+
+
+def _registro():
+    if not MULTIPROCESO:
+        return REGISTRY
+    registro = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registro)
+    return registro
+
+
+def exportar() -> tuple:
+    """
+    Returns (contenido, tipo de contenido) con las métricas en el formato de texto de Prometheus.
+    """
+    return generate_latest(_registro()), CONTENT_TYPE_LATEST
+
+
+def iniciar_servidor_metricas(puerto: int = METRICAS_PUERTO_WORKER):
+    """
+    Expone las métricas en http://0.0.0.0:<puerto>/ desde un hilo propio, para procesos sin API como el worker.
+    """
+    if puerto <= 0:
+        return
+    start_http_server(puerto, registry=_registro())
+    print(f"Métricas de Prometheus en el puerto {puerto}")
@@ -0,0 +1,55 @@
+"""
+Proceso dedicado a la ejecución de las reservas.
+
+Arranca el scheduler y ejecuta las tareas guardadas en el jobstore compartido. La API,
+arrancada con SCHEDULER_MODO=api, solo añade, elimina o pausa tareas en ese jobstore,
+de modo que se pueden levantar varios workers de uvicorn sin disparar reservas dos veces.
+
+Las métricas de Prometheus del worker se exponen en el puerto METRICAS_PUERTO_WORKER (9100 por defecto).
+
+Uso:
+    python -m app.worker                 # Ejecuta el scheduler hasta recibir SIGINT/SIGTERM
+    python -m app.worker --reconciliar   # Reconcilia reservas y tareas y termina
+"""
+import argparse
+import signal
+import threading
+from app.database import init_db
+from app.reconciliacion import reconciliar_reservas, programar_reconciliacion
+from app.tasks import detener_scheduler, iniciar_scheduler
+from app.utils.metricas import iniciar_servidor_metricas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker del scheduler de reservas")
+    parser.add_argument("--reconciliar", action="store_true", help="Reconcilia las reservas con las tareas programadas y termina")
+    parser.add_argument("--simular", action="store_true", help="Con --reconciliar, muestra las diferencias sin aplicarlas")
+    args = parser.parse_args()
+
+    init_db()
+
+    if args.reconciliar:
+        # El scheduler arranca en pausa para no ejecutar ninguna tarea desde este proceso
+        iniciar_scheduler(ejecutar=False)
+        reconciliar_reservas(aplicar=not args.simular)
+        detener_scheduler()
+        return
+
+    iniciar_scheduler(ejecutar=True)
+    iniciar_servidor_metricas()
+    reconciliar_reservas()
+    programar_reconciliacion()
+
+    parada = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: parada.set())
+    signal.signal(signal.SIGTERM, lambda *_: parada.set())
+
+    print("Worker de reservas en marcha.")
+    parada.wait()
+
+    print("Deteniendo el worker de reservas...")
+    detener_scheduler()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Benchmark de una ráfaga de reservas contra el gimnasio simulado (benchmarks.vivagym_stub).
+
+Crea en una base de datos temporal N usuarios con una reserva cada uno, todas con apertura
+en el mismo minuto, y las programa en el scheduler de la aplicación para que
+ejecutar_reserva las prepare y las dispare a la vez. Al terminar
+resume, a partir de intentos_reserva, el resultado de las reservas, los percentiles del
+tiempo hasta la reserva y de cada fase, y el retraso del scheduler.
+
+La apertura es siempre al inicio de un minuto (como las reservas reales), así que la
+ráfaga puede tardar hasta un minuto en empezar.
+
+Uso:
+    python -m benchmarks.reservas_rafaga --usuarios 200 --clases 4 --modo threads --latencia-ms 80 --tasa-error 0.01
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import requests
+from benchmarks.vivagym_stub import CLASES, argumentos, opciones
+
+CENTRO = "134"
+
+
+def _configurar_entorno(directorio: str, args):
+    # Debe hacerse antes de importar la aplicación, que lee la configuración al importarse
+    os.environ["DATABASE_URL"] = f"sqlite:///{directorio}/reservas.db"
+    os.environ["JOBSTORE_URL"] = f"sqlite:///{directorio}/tasks.db"
+    os.environ["VG_BASE_URL"] = f"http://127.0.0.1:{args.puerto}"
+    os.environ["RESERVA_MODO"] = args.modo
+    os.environ["RESERVA_ANTELACION_SEGUNDOS"] = str(args.antelacion)
+    # Sin navegador en el benchmark: los fallos de la API no se desvían a Selenium
+    os.environ["RESERVA_FALLBACK_SELENIUM"] = "false"
+    if not os.getenv("FERNET_KEYS") and not os.getenv("FERNET_KEY"):
+        from cryptography.fernet import Fernet
+        os.environ["FERNET_KEY"] = Fernet.generate_key().decode()
+
+
+def _arrancar_gimnasio(args, clases: list, hora: str) -> subprocess.Popen:
+    """
+    Arranca el gimnasio simulado en otro proceso, para que no compita por el GIL con las reservas.
+    """
+    proceso = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.vivagym_stub", "--puerto", str(args.puerto),
+        "--nombres", ",".join(clases), "--horas", hora, *opciones(args),
+    ])
+    fin = time.monotonic() + 30
+    while time.monotonic() < fin:
+        try:
+            requests.get(f"http://127.0.0.1:{args.puerto}/resumen", timeout=1)
+            return proceso
+        except requests.exceptions.ConnectionError:
+            if proceso.poll() is not None:
+                break
+            time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError(f"El gimnasio simulado no ha arrancado en el puerto {args.puerto}")
+
+
+def _proxima_apertura(antelacion: int) -> datetime:
+    """
+    Primer inicio de minuto que deja tiempo para programar las reservas antes de su preparación.
+    """
+    return (datetime.now() + timedelta(seconds=antelacion + 5)).replace(second=0, microsecond=0) + timedelta(minutes=1)
+
+
+def _sembrar(usuarios: int, clases: list, hora: str) -> list:
+    from sqlalchemy import insert, select
+    from app.database import Reserva, SessionLocal, Usuario
+    from app.utils.fernet_encryption import cifrar_contraseña
+
+    contraseña = cifrar_contraseña("benchmark")
+    with SessionLocal() as db:
+        db.execute(insert(Usuario), [{"id_usuario": f"usuario{i}@benchmark.local", "contraseña": contraseña} for i in range(usuarios)])
+        db.execute(insert(Reserva), [
+            {"dia_semana": "monday", "hora": hora, "clase": clases[i % len(clases)], "centro": CENTRO, "id_usuario": f"usuario{i}@benchmark.local"}
+            for i in range(usuarios)
+        ])
+        db.commit()
+        return db.execute(select(Reserva.id_reserva, Reserva.hora, Reserva.centro, Reserva.clase)).all()
+
+
+def _esperar_intentos(apertura: datetime, total: int, limite: float) -> int:
+    from sqlalchemy import func, select
+    from app.database import IntentoReserva, SessionLocal
+
+    hechos = 0
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        with SessionLocal() as db:
+            hechos = db.scalar(select(func.count()).where(IntentoReserva.programada_para == apertura, IntentoReserva.backend == "api"))
+        if hechos >= total:
+            return hechos
+        time.sleep(0.5)
+    return hechos
+
+
+def _percentiles(valores: list) -> str:
+    from app.db_utils import percentil
+
+    if not valores:
+        return "sin datos"
+    valores = sorted(valores)
+    return ", ".join(f"p{p}={percentil(valores, p):.1f} ms" for p in (50, 95, 99)) + f" ({len(valores)} muestras)"
+
+
+def _informe(apertura: datetime, antelacion: int, duracion: float):
+    from collections import Counter
+    from sqlalchemy import select
+    from app.database import IntentoReserva, SessionLocal
+
+    with SessionLocal() as db:
+        intentos = db.scalars(select(IntentoReserva).where(IntentoReserva.programada_para == apertura, IntentoReserva.backend == "api")).all()
+
+    exitos = [i for i in intentos if i.resultado == "exito"]
+    inicio_previsto = apertura - timedelta(seconds=antelacion)
+    print(f"\nResultados ({len(intentos)} reservas): {dict(Counter(i.resultado for i in intentos))}")
+    print(f"Estados de create-booking: {dict(Counter(i.estado_reserva for i in intentos if i.estado_reserva))}")
+    print(f"Tiempo hasta la reserva: {_percentiles([i.ms_hasta_reserva for i in exitos])}")
+    for fase in ("descifrado", "autenticacion", "busqueda", "creacion"):
+        print(f"  {fase}: {_percentiles([getattr(i, f'ms_{fase}') for i in intentos if getattr(i, f'ms_{fase}') is not None])}")
+    print(f"Retraso del scheduler: {_percentiles([(i.inicio - inicio_previsto).total_seconds() * 1000 for i in intentos])}")
+    print(f"Retraso del disparo respecto a la apertura: {_percentiles([(i.disparo - apertura).total_seconds() * 1000 for i in intentos if i.disparo])}")
+    if exitos:
+        ultima = max(i.ms_hasta_reserva for i in exitos) / 1000
+        print(f"Rendimiento: {len(exitos)} reservas en {ultima:.2f} s desde la apertura ({len(exitos) / ultima:.1f} reservas/s)")
+    print(f"Duración total de la ráfaga: {duracion:.2f} s")
+
+
+def _ejecutar(args, reservas: list, clases: int, apertura: datetime):
+    from app.gateway.rate_limiter import rate_limiter
+    from app.tasks import ANTELACION_PREPARACION, HILOS_RESERVAS, ejecutar_reserva, scheduler
+
+    # El scheduler de la aplicación, que también ejecuta las tareas de disparo (ver lanzar_disparo)
+    for reserva in reservas:
+        scheduler.add_job(ejecutar_reserva, "date", run_date=apertura - timedelta(seconds=ANTELACION_PREPARACION), args=list(reserva), jobstore="memoria")
+    scheduler.start()
+
+    print(f"{len(reservas)} reservas de {clases} clases con apertura a las {apertura:%H:%M:%S} (modo {args.modo}, {HILOS_RESERVAS} hilos)")
+    print(f"Esperando {(apertura - datetime.now()).total_seconds():.0f} s hasta la apertura...")
+
+    completadas = _esperar_intentos(apertura, len(reservas), (apertura - datetime.now()).total_seconds() + args.espera_max)
+    duracion = (datetime.now() - apertura).total_seconds()
+    if completadas < len(reservas):
+        print(f"Aviso: solo han terminado {completadas} de {len(reservas)} reservas")
+
+    scheduler.shutdown(wait=False)
+    _informe(apertura, ANTELACION_PREPARACION, duracion)
+    print(f"Gimnasio simulado: {requests.get(f'http://127.0.0.1:{args.puerto}/resumen', timeout=5).json()}")
+    print(f"Limitador de peticiones: {rate_limiter.metricas()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ráfaga de reservas contra el gimnasio simulado")
+    parser.add_argument("--usuarios", type=int, default=200, help="Usuarios, con una reserva cada uno")
+    parser.add_argument("--clases", type=int, default=4, help=f"Clases entre las que se reparten las reservas (máximo {len(CLASES)})")
+    parser.add_argument("--modo", choices=["threads", "async"], default="threads", help="RESERVA_MODO de la ejecución")
+    parser.add_argument("--antelacion", type=int, default=5, help="Segundos de preparación antes de la apertura")
+    parser.add_argument("--puerto", type=int, default=8090, help="Puerto del gimnasio simulado")
+    parser.add_argument("--espera-max", type=float, default=180, help="Segundos máximos de espera por las reservas")
+    argumentos(parser)
+    # Por defecto caben todas las reservas; con --capacidad se prueba la clase llena
+    parser.set_defaults(capacidad=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directorio:
+        _configurar_entorno(directorio, args)
+
+        from app.database import init_db
+        from app.tasks import ANTELACION_PREPARACION
+
+        clases = CLASES[:max(1, args.clases)]
+        apertura = _proxima_apertura(ANTELACION_PREPARACION)
+        hora = f"{apertura:%H:%M}"
+
+        gimnasio = _arrancar_gimnasio(args, clases, hora)
+        try:
+            init_db()
+            reservas = _sembrar(args.usuarios, clases, hora)
+            _ejecutar(args, reservas, len(clases), apertura)
+        finally:
+            gimnasio.terminate()
+            gimnasio.wait()
+
+
+if __name__ == "__main__":
+    main()
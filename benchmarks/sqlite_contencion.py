@@ -0,0 +1,101 @@
+"""
+Benchmark de contención de SQLite: varios hilos escriben logs y leen reservas a la vez
+sobre una base de datos temporal, primero con la configuración por defecto de SQLAlchemy
+y después con el perfil de app.database (WAL, busy_timeout, pragmas y pool).
+
+Uso:
+    python -m benchmarks.sqlite_contencion --hilos 50 --segundos 10
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, Log, Reserva, Usuario, crear_engine
+
+
+def _preparar(engine):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Usuario), [{"id_usuario": "bench", "contraseña": "x"}])
+        connection.execute(insert(Reserva), [
+            {"dia_semana": "lunes", "hora": f"{h:02d}:00", "clase": f"Clase {h}", "centro": "1", "id_usuario": "bench"}
+            for h in range(24)
+        ])
+
+
+def _trabajador(Session, fin: float, escrituras_por_lectura: int, resultados: dict, lock: threading.Lock):
+    latencias = []
+    operaciones = 0
+    bloqueos = 0
+    n = 0
+    while time.perf_counter() < fin:
+        n += 1
+        inicio = time.perf_counter()
+        try:
+            with Session() as db:
+                if n % (escrituras_por_lectura + 1) == 0:
+                    db.execute(select(Reserva.id_reserva, Reserva.clase).where(Reserva.id_usuario == "bench")).all()
+                else:
+                    db.execute(insert(Log), [{"id_usuario": "bench", "mensaje": "benchmark"}])
+                    db.commit()
+            operaciones += 1
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            bloqueos += 1
+
+    with lock:
+        resultados["operaciones"] += operaciones
+        resultados["bloqueos"] += bloqueos
+        resultados["latencias"].extend(latencias)
+
+
+def ejecutar(perfil: bool, hilos: int, segundos: float, escrituras_por_lectura: int) -> dict:
+    with tempfile.TemporaryDirectory() as directorio:
+        engine = crear_engine(f"sqlite:///{os.path.join(directorio, 'bench.db')}", perfil=perfil)
+        _preparar(engine)
+        Session = sessionmaker(bind=engine)
+
+        resultados = {"operaciones": 0, "bloqueos": 0, "latencias": []}
+        lock = threading.Lock()
+        fin = time.perf_counter() + segundos
+        trabajadores = [
+            threading.Thread(target=_trabajador, args=(Session, fin, escrituras_por_lectura, resultados, lock))
+            for _ in range(hilos)
+        ]
+        for hilo in trabajadores:
+            hilo.start()
+        for hilo in trabajadores:
+            hilo.join()
+        engine.dispose()
+
+    latencias = sorted(resultados["latencias"]) or [0.0]
+    return {
+        "perfil": "app.database" if perfil else "por defecto",
+        "operaciones/s": round(resultados["operaciones"] / segundos, 1),
+        "bloqueos": resultados["bloqueos"],
+        "p50_ms": round(statistics.median(latencias), 2),
+        "p95_ms": round(latencias[int(len(latencias) * 0.95) - 1 if len(latencias) > 1 else 0], 2),
+        "max_ms": round(latencias[-1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de contención de SQLite")
+    parser.add_argument("--hilos", type=int, default=50)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--escrituras-por-lectura", type=int, default=3)
+    args = parser.parse_args()
+
+    for perfil in (False, True):
+        print(ejecutar(perfil, args.hilos, args.segundos, args.escrituras_por_lectura))
+
+
+if __name__ == "__main__":
+    main()
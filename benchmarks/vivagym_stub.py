@@ -0,0 +1,208 @@
+"""
+Servidor local que imita la API del gimnasio para pruebas de carga sin tocar el servicio real.
+
+Implementa los cuatro endpoints que usa VG_API:
+- POST /api/user/authenticate
+- POST /api/classes/search-booking-participations
+- POST /api/booking/create-booking
+- POST /api/booking/cancel-booking
+
+Cada petición tarda una latencia configurable (media ± jitter) y puede fallar con un 503
+según la tasa de error. Cada clase admite un número limitado de reservas; con la clase
+llena create-booking responde con --estado-completo. El horario devuelve cada una de las
+clases configuradas a cada una de las horas configuradas, en cualquier centro y fecha, con
+la participación del usuario en las clases en las que tiene plaza.
+
+Para usarlo desde la aplicación: VG_BASE_URL=http://127.0.0.1:8090
+
+Uso:
+    python -m benchmarks.vivagym_stub --puerto 8090 --latencia-ms 80 --jitter-ms 40 --tasa-error 0.01 --capacidad 20
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import secrets
+import threading
+from collections import Counter
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+CLASES = ["Body Pump", "Virtual Cycling", "Yoga", "Pilates"]
+HORAS = ["09:00", "10:30", "18:00", "19:30"]
+
+
+class Gimnasio:
+    """
+    Estado del gimnasio simulado: tokens emitidos, clases, plazas ocupadas y contadores de peticiones.
+    """
+
+    def __init__(self, latencia_ms: float = 80, jitter_ms: float = 40, tasa_error: float = 0.0, capacidad: int = 20,
+                 estado_completo: int = 422, clases: list = None, horas: list = None):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.tasa_error = tasa_error
+        self.capacidad = capacidad
+        self.estado_completo = estado_completo
+        self.clases = clases or CLASES
+        self.horas = horas or HORAS
+        self._tokens = {}  # token -> email
+        self._usuarios = {}  # email -> id de usuario
+        self._clases = {}  # (centro, fecha, nombre, hora) -> id de la clase
+        self._plazas = {}  # id de la clase -> {id de participación: id de usuario}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.peticiones = Counter()  # (endpoint, código HTTP) -> número de peticiones
+
+    async def latencia(self):
+        espera = max(0.0, random.gauss(self.latencia_ms, self.jitter_ms / 2)) / 1000
+        await asyncio.sleep(espera)
+
+    def falla(self) -> bool:
+        return random.random() < self.tasa_error
+
+    def autenticar(self, email: str) -> dict:
+        with self._lock:
+            id_usuario = self._usuarios.setdefault(email, next(self._ids))
+            token = secrets.token_hex(16)
+            self._tokens[token] = email
+        return {"token": token, "user": {"userId": id_usuario, "centerId": 1}}
+
+    def usuario(self, request: Request):
+        autorizacion = request.headers.get("authorization", "")
+        with self._lock:
+            email = self._tokens.get(autorizacion.removeprefix("Bearer "))
+            return self._usuarios.get(email)
+
+    def horario(self, centros: list, fecha: str, id_usuario: int) -> list:
+        respuesta = []
+        with self._lock:
+            for centro in centros:
+                for nombre in self.clases:
+                    for hora in self.horas:
+                        id_clase = self._clases.setdefault((str(centro), fecha, nombre, hora), next(self._ids))
+                        plazas = self._plazas.get(id_clase, {})
+                        id_participacion = next((p for p, u in plazas.items() if u == id_usuario), None)
+                        respuesta.append({
+                            "booking": {"id": id_clase, "name": nombre, "startTime": hora, "center": centro, "date": fecha},
+                            "participation": {"id": id_participacion} if id_participacion is not None else None,
+                        })
+        return respuesta
+
+    def reservar(self, id_usuario: int, id_clase: int):
+        """
+        Returns (código HTTP, cuerpo) de la reserva de una plaza en la clase.
+        """
+        with self._lock:
+            if id_clase not in self._clases.values():
+                return 404, {"message": "Clase no encontrada"}
+            plazas = self._plazas.setdefault(id_clase, {})
+            if id_usuario in plazas.values():
+                return 409, {"message": "Ya tienes una reserva en esta clase"}
+            if len(plazas) >= self.capacidad:
+                return self.estado_completo, {"message": "Clase completa"}
+            id_participacion = next(self._ids)
+            plazas[id_participacion] = id_usuario
+        return 200, {"id": id_participacion}
+
+    def cancelar(self, id_usuario: int, id_participacion: int):
+        with self._lock:
+            for plazas in self._plazas.values():
+                if plazas.get(id_participacion) == id_usuario:
+                    del plazas[id_participacion]
+                    return 200, {}
+        return 404, {"message": "Reserva no encontrada"}
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "peticiones": {f"{endpoint} {codigo}": n for (endpoint, codigo), n in sorted(self.peticiones.items())},
+                "plazas_ocupadas": sum(len(plazas) for plazas in self._plazas.values()),
+            }
+
+
+def crear_app(gimnasio: Gimnasio) -> FastAPI:
+    app = FastAPI()
+
+    async def responder(endpoint: str, atender):
+        await gimnasio.latencia()
+        if gimnasio.falla():
+            codigo, cuerpo = 503, {"message": "Servicio no disponible"}
+        else:
+            codigo, cuerpo = atender()
+        with gimnasio._lock:
+            gimnasio.peticiones[(endpoint, codigo)] += 1
+        return JSONResponse(cuerpo, status_code=codigo)
+
+    @app.api_route("/", methods=["GET", "HEAD"])
+    async def raiz():
+        # VG_API.warm_up abre las conexiones con un HEAD a la raíz
+        return JSONResponse({})
+
+    @app.post("/api/user/authenticate")
+    async def authenticate(request: Request):
+        datos = await request.json()
+        return await responder("authenticate", lambda: (200, gimnasio.autenticar(datos["email"])))
+
+    @app.post("/api/classes/search-booking-participations")
+    async def search(request: Request):
+        datos = await request.json()
+        id_usuario = gimnasio.usuario(request)
+        return await responder("search", lambda: (200, gimnasio.horario(datos["centers"], datos["dateFrom"], id_usuario)) if id_usuario else (401, {}))
+
+    @app.post("/api/booking/create-booking")
+    async def create(request: Request):
+        datos = await request.json()
+        id_usuario = gimnasio.usuario(request)
+        return await responder("create", lambda: gimnasio.reservar(id_usuario, datos["bookingId"]) if id_usuario else (401, {}))
+
+    @app.post("/api/booking/cancel-booking")
+    async def cancel(request: Request):
+        datos = await request.json()
+        id_usuario = gimnasio.usuario(request)
+        return await responder("cancel", lambda: gimnasio.cancelar(id_usuario, datos["participationId"]) if id_usuario else (401, {}))
+
+    @app.get("/resumen")
+    async def resumen():
+        return gimnasio.resumen()
+
+    return app
+
+
+def argumentos(parser: argparse.ArgumentParser):
+    """
+    Añade al parser las opciones del gimnasio simulado (también las usa benchmarks.reservas_rafaga).
+    """
+    parser.add_argument("--latencia-ms", type=float, default=80, help="Latencia media de cada petición")
+    parser.add_argument("--jitter-ms", type=float, default=40, help="Variación de la latencia")
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="Fracción de peticiones que responden 503")
+    parser.add_argument("--capacidad", type=int, default=20, help="Plazas de cada clase")
+    parser.add_argument("--estado-completo", type=int, default=422, help="Código HTTP con la clase llena")
+
+
+def opciones(args) -> list:
+    """
+    Opciones de línea de comandos equivalentes a args, para arrancar el servidor en otro proceso.
+    """
+    return [
+        "--latencia-ms", str(args.latencia_ms), "--jitter-ms", str(args.jitter_ms), "--tasa-error", str(args.tasa_error),
+        "--capacidad", str(args.capacidad), "--estado-completo", str(args.estado_completo),
+    ]
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API del gimnasio")
+    parser.add_argument("--puerto", type=int, default=8090)
+    parser.add_argument("--nombres", default=",".join(CLASES), help="Clases del horario, separadas por comas")
+    parser.add_argument("--horas", default=",".join(HORAS), help="Horas del horario (HH:MM), separadas por comas")
+    argumentos(parser)
+    args = parser.parse_args()
+
+    gimnasio = Gimnasio(args.latencia_ms, args.jitter_ms, args.tasa_error, args.capacidad, args.estado_completo, args.nombres.split(","), args.horas.split(","))
+    uvicorn.run(crear_app(gimnasio), host="127.0.0.1", port=args.puerto, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import pytest
+from cryptography.fernet import Fernet
+
+# La aplicación lee la configuración al importarse, así que se fija antes de importar nada de app
+_directorio = tempfile.mkdtemp(prefix="reservas-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_directorio}/reservas.db"
+os.environ["JOBSTORE_URL"] = f"sqlite:///{_directorio}/tasks.db"
+os.environ["LOG_BUFFER_ACTIVO"] = "false"
+os.environ.setdefault("FERNET_KEY", Fernet.generate_key().decode())
+os.environ.setdefault("JWT_KEY", "tests")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def base_de_datos():
+    from app.database import init_db
+
+    init_db()
+
+
+@pytest.fixture
+def crear_reserva():
+    """
+    Crea un usuario con una reserva y devuelve el id de la reserva.
+    Al terminar el test se borran las reservas y los usuarios creados.
+    """
+    from app.database import Reserva, SessionLocal, Usuario
+    from app.utils.fernet_encryption import cifrar_contraseña
+
+    creadas = []
+
+    def crear(email="usuario@test.local", dia_semana="monday", hora="09:00", clase="Yoga", centro="134"):
+        with SessionLocal() as db:
+            db.merge(Usuario(id_usuario=email, contraseña=cifrar_contraseña("secreto")))
+            reserva = Reserva(dia_semana=dia_semana, hora=hora, clase=clase, centro=centro, id_usuario=email)
+            db.add(reserva)
+            db.commit()
+            creadas.append((reserva.id_reserva, email))
+            return reserva.id_reserva
+
+    yield crear
+
+    with SessionLocal() as db:
+        for id_reserva, email in creadas:
+            db.query(Reserva).filter(Reserva.id_reserva == id_reserva).delete()
+            db.query(Usuario).filter(Usuario.id_usuario == email).delete()
+        db.commit()
@@ -0,0 +1,113 @@
+import pytest
+from app.gateway import chrome_pool as modulo
+from app.gateway.chrome_pool import ChromePool, SinNavegadorLibre
+
+
+class NavegadorFalso:
+    """Sustituye a _Navegador sin arrancar Chrome."""
+    arrancados = []
+
+    def __init__(self):
+        self.driver = object()
+        self.usos = 0
+        self.memoria = 100
+        self.responde = True
+        self.limpiezas = 0
+        self.cerrado = False
+        NavegadorFalso.arrancados.append(self)
+
+    def sano(self):
+        return self.responde
+
+    def memoria_mb(self):
+        return self.memoria
+
+    def limpiar(self):
+        self.limpiezas += 1
+
+    def cerrar(self):
+        self.cerrado = True
+
+
+@pytest.fixture(autouse=True)
+def navegadores(monkeypatch):
+    NavegadorFalso.arrancados.clear()
+    monkeypatch.setattr(modulo, "_Navegador", NavegadorFalso)
+    return NavegadorFalso.arrancados
+
+
+def _usar(pool):
+    with pool.driver(espera=0) as driver:
+        return driver
+
+
+def test_reutiliza_el_navegador_limpio(navegadores):
+    pool = ChromePool(maximo=1, max_usos=10, memoria_max=1024)
+
+    assert _usar(pool) is _usar(pool)
+    assert len(navegadores) == 1
+    assert navegadores[0].limpiezas == 2
+
+
+def test_recicla_tras_el_máximo_de_usos(navegadores):
+    pool = ChromePool(maximo=1, max_usos=2, memoria_max=1024)
+
+    _usar(pool)
+    _usar(pool)
+    _usar(pool)
+
+    assert len(navegadores) == 2
+    assert navegadores[0].cerrado and not navegadores[1].cerrado
+    assert pool.estado()["abiertos"] == 1
+
+
+def test_recicla_si_supera_la_memoria(navegadores):
+    pool = ChromePool(maximo=1, max_usos=10, memoria_max=500)
+    _usar(pool)
+    navegadores[0].memoria = 600
+
+    _usar(pool)
+    _usar(pool)
+
+    assert navegadores[0].cerrado
+    assert len(navegadores) == 2
+
+
+def test_sustituye_un_navegador_que_no_responde(navegadores):
+    pool = ChromePool(maximo=1, max_usos=10, memoria_max=1024)
+    _usar(pool)
+    navegadores[0].responde = False
+
+    _usar(pool)
+
+    assert navegadores[0].cerrado
+    assert len(navegadores) == 2
+
+
+def test_sin_navegador_libre(navegadores):
+    pool = ChromePool(maximo=1, max_usos=10, memoria_max=1024)
+
+    with pool.driver(espera=0):
+        with pytest.raises(SinNavegadorLibre):
+            _usar(pool)
+
+
+class PoolQueFalla:
+    def __init__(self, error):
+        self.error = error
+
+    def driver(self):
+        raise self.error
+
+
+@pytest.mark.parametrize("error, estado", [
+    (SinNavegadorLibre("sin plazas"), "sin_navegador"),
+    # socket.timeout es TimeoutError: es el navegador el que no responde
+    (TimeoutError("read timed out"), "timeout"),
+])
+def test_reservar_web_distingue_la_espera_del_pool(monkeypatch, error, estado):
+    from app.gateway import vg_selenium
+
+    monkeypatch.setattr(vg_selenium, "chrome_pool", PoolQueFalla(error))
+
+    assert vg_selenium.reservar_web("web@test.local", "secreto", "2026-10-19", "134", "Yoga", "09:00") == estado
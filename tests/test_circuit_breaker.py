@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+import pytest
+from app.gateway import circuit_breaker
+from app.gateway.circuit_breaker import ABIERTO, CERRADO, SEMIABIERTO, CircuitBreaker, es_fallo_backend
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Reloj manual para circuit_breaker: se avanza con reloj.avanzar(segundos)."""
+    class Reloj:
+        ahora = 1000.0
+
+        def avanzar(self, segundos):
+            self.ahora += segundos
+
+    r = Reloj()
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=lambda: r.ahora))
+    return r
+
+
+def test_se_abre_tras_los_fallos_consecutivos(reloj):
+    circuito = CircuitBreaker("prueba", umbral=3, espera=30)
+
+    circuito.fallo()
+    circuito.fallo()
+    circuito.exito()  # Un éxito reinicia la cuenta
+    circuito.fallo()
+    circuito.fallo()
+    assert circuito.estado == CERRADO and circuito.permite()
+
+    circuito.fallo()
+    assert circuito.estado == ABIERTO
+    assert not circuito.permite()
+
+
+def test_pasada_la_espera_deja_pasar_una_sola_prueba(reloj):
+    circuito = CircuitBreaker("prueba", umbral=1, espera=30)
+    circuito.fallo()
+
+    reloj.avanzar(29)
+    assert not circuito.permite()
+
+    reloj.avanzar(1)
+    assert circuito.permite()
+    assert circuito.estado == SEMIABIERTO
+    # Mientras la prueba está en curso no se permite ninguna otra reserva
+    assert not circuito.permite()
+
+    circuito.exito()
+    assert circuito.estado == CERRADO
+    assert circuito.permite()
+
+
+def test_una_prueba_fallida_vuelve_a_abrirlo(reloj):
+    circuito = CircuitBreaker("prueba", umbral=5, espera=30)
+    for _ in range(5):
+        circuito.fallo()
+    reloj.avanzar(30)
+    assert circuito.permite()
+
+    # Un solo fallo en semiabierto basta para abrirlo otra vez durante toda la espera
+    circuito.fallo()
+    assert circuito.estado == ABIERTO
+    reloj.avanzar(29)
+    assert not circuito.permite()
+
+
+def test_una_prueba_sin_resultado_no_lo_deja_bloqueado(reloj):
+    circuito = CircuitBreaker("prueba", umbral=1, espera=30)
+    circuito.fallo()
+    reloj.avanzar(30)
+    assert circuito.permite()
+
+    # La prueba no informa de su resultado: pasada otra espera se permite otra prueba
+    reloj.avanzar(30.1)
+    assert circuito.permite()
+
+
+@pytest.mark.parametrize("estado, fallo", [
+    ("timeout", True), ("conexion", True), (500, True), (503, True),
+    (200, False), (404, False), (429, False), ("clase_llena", False), (None, False),
+])
+def test_solo_cuentan_los_fallos_del_backend(estado, fallo):
+    circuito = CircuitBreaker("prueba", umbral=1)
+
+    assert es_fallo_backend(estado) is fallo
+    assert circuito.registrar(estado) is fallo
+    assert circuito.estado == (ABIERTO if fallo else CERRADO)
@@ -0,0 +1,80 @@
+import socket
+import pytest
+from aiosmtpd.controller import Controller
+from app.database import CorreoPendiente, SessionLocal
+from app.gateway import correo
+
+
+class Buzon:
+    """
+    Handler de aiosmtpd que guarda los mensajes recibidos y la sesión SMTP de cada uno.
+    """
+    def __init__(self):
+        self.mensajes = []
+        self.sesiones = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.mensajes.append(envelope)
+        if not any(sesion is session for sesion in self.sesiones):
+            self.sesiones.append(session)
+        return "250 Message accepted for delivery"
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(autouse=True)
+def bandeja_vacia(monkeypatch):
+    with SessionLocal() as db:
+        db.query(CorreoPendiente).delete()
+        db.commit()
+    # Con credenciales configuradas: el servidor de prueba no ofrece AUTH y no debe pedirse login
+    monkeypatch.setattr(correo, "EMAIL_ADDRESS", "reservas@test.local")
+    monkeypatch.setattr(correo, "EMAIL_PASSWORD", "secreto")
+    monkeypatch.setattr(correo, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(correo, "SMTP_SERVER", "127.0.0.1")
+
+
+@pytest.fixture
+def servidor_smtp(monkeypatch):
+    buzon = Buzon()
+    controller = Controller(buzon, hostname="127.0.0.1", port=_puerto_libre())
+    controller.start()
+    monkeypatch.setattr(correo, "SMTP_PORT", controller.port)
+    yield buzon
+    controller.stop()
+
+
+def _encolar(n: int):
+    for i in range(n):
+        correo.encolar_correo(f"usuario{i}@test.local", f"Reserva {i}", f"<p>Reserva {i}</p>")
+
+
+def test_envia_el_lote_en_una_sesion(servidor_smtp):
+    _encolar(5)
+
+    assert correo.enviar_pendientes(lote=10) == 5
+
+    assert len(servidor_smtp.mensajes) == 5
+    assert len(servidor_smtp.sesiones) == 1
+    assert sorted(m.rcpt_tos[0] for m in servidor_smtp.mensajes) == [f"usuario{i}@test.local" for i in range(5)]
+    with SessionLocal() as db:
+        assert db.query(CorreoPendiente).filter(CorreoPendiente.fecha_envio.is_(None)).count() == 0
+    assert correo.enviar_pendientes(lote=10) == 0
+
+
+def test_marca_como_fallidos_los_correos_sin_intentos(monkeypatch):
+    # Sin servidor en el puerto: cada pasada cuenta un intento fallido
+    monkeypatch.setattr(correo, "SMTP_PORT", _puerto_libre())
+    monkeypatch.setattr(correo, "OUTBOX_MAX_INTENTOS", 1)
+    _encolar(2)
+
+    assert correo.enviar_pendientes() == 2
+
+    with SessionLocal() as db:
+        correos = db.query(CorreoPendiente).all()
+        assert all(c.fecha_fallo is not None and c.fecha_envio is None for c in correos)
+    assert correo.enviar_pendientes() == 0
@@ -0,0 +1,76 @@
+import os
+import threading
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import text
+from app import database
+
+
+def test_perfil_de_sqlite(tmp_path):
+    engine = database.crear_engine(f"sqlite:///{tmp_path}/perfil.db")
+    with engine.connect() as conexion:
+        assert conexion.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conexion.execute(text("PRAGMA busy_timeout")).scalar() == database.SQLITE_BUSY_TIMEOUT_MS
+        # NORMAL
+        assert conexion.execute(text("PRAGMA synchronous")).scalar() == 1
+    engine.dispose()
+
+
+def test_escritores_simultáneos_esperan_en_lugar_de_fallar(tmp_path):
+    engine = database.crear_engine(f"sqlite:///{tmp_path}/concurrencia.db")
+    with engine.begin() as conexion:
+        conexion.execute(text("CREATE TABLE contador (id INTEGER PRIMARY KEY, hilo INTEGER)"))
+    errores = []
+
+    def escribir(hilo):
+        try:
+            for _ in range(20):
+                with engine.begin() as conexion:
+                    conexion.execute(text("INSERT INTO contador (hilo) VALUES (:hilo)"), {"hilo": hilo})
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=escribir, args=(hilo,)) for hilo in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert errores == []
+    with engine.connect() as conexion:
+        assert conexion.execute(text("SELECT COUNT(*) FROM contador")).scalar() == 160
+    engine.dispose()
+
+
+def _config_alembic():
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(database.__file__)))
+    config = Config(os.path.join(raiz, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(raiz, "app", "migrations"))
+    return config
+
+
+def test_las_migraciones_crean_el_esquema_de_los_modelos():
+    # La base de datos de los tests se crea con init_db, es decir, con las migraciones
+    with database.engine.connect() as conexion:
+        diferencias = compare_metadata(MigrationContext.configure(conexion), database.Base.metadata)
+    assert diferencias == []
+
+
+def test_sql_de_las_migraciones_para_postgresql(monkeypatch, capsys):
+    monkeypatch.setattr(database, "DATABASE_URL", "postgresql+psycopg2://reservas@localhost/reservas")
+
+    command.upgrade(_config_alembic(), "head", sql=True)
+
+    sql = capsys.readouterr().out
+    assert "CREATE TABLE usuarios" in sql
+    assert "CREATE TABLE intentos_reserva" in sql
+    assert "UPDATE alembic_version SET version_num='0005'" in sql
+
+
+def test_engine_con_pool_para_postgresql():
+    engine = database.crear_engine("postgresql+psycopg2://reservas@localhost/reservas")
+
+    assert engine.dialect.name == "postgresql"
+    assert engine.pool.size() == database.DB_POOL_SIZE
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import pytest
+from app.gateway import http_session
+
+
+class _Eco(BaseHTTPRequestHandler):
+    """Responde con la cabecera Host y las cookies recibidas, e intenta fijar una cookie."""
+    protocol_version = "HTTP/1.1"
+    conexiones = set()
+
+    def do_GET(self):
+        _Eco.conexiones.add(self.client_address)
+        cuerpo = json.dumps({"host": self.headers["Host"], "cookie": self.headers["Cookie"]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.send_header("Set-Cookie", "sesion=de-otro-usuario; Path=/")
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_HEAD(self):
+        _Eco.conexiones.add(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor():
+    _Eco.conexiones.clear()
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _Eco)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield servidor.server_address[1]
+    servidor.shutdown()
+
+
+@pytest.fixture
+def host_cacheado(monkeypatch):
+    # Un nombre que no resuelve ningún DNS: solo se puede llegar a él por la caché
+    monkeypatch.setattr(http_session, "_dns_hosts", {"gimnasio.test"})
+    monkeypatch.setattr(http_session, "_dns_cache", {})
+    http_session._guardar_direccion("gimnasio.test", [(None, None, None, None, ("127.0.0.1", 0))])
+    return "gimnasio.test"
+
+
+def test_el_cliente_asincrono_usa_la_caché_dns(servidor, host_cacheado):
+    async def pedir():
+        async with httpx.AsyncClient(transport=http_session._TransporteDNS()) as cliente:
+            return await cliente.get(f"http://{host_cacheado}:{servidor}/")
+
+    respuesta = asyncio.run(pedir())
+    assert respuesta.json() == {"host": f"{host_cacheado}:{servidor}", "cookie": None}
+    # La respuesta conserva la URL con el nombre del host
+    assert respuesta.request.url.host == host_cacheado
+
+
+def test_la_sesión_usa_la_caché_dns(servidor, host_cacheado, monkeypatch):
+    monkeypatch.setattr(http_session, "_session", None)
+    respuesta = http_session.get_session().get(f"http://{host_cacheado}:{servidor}/", timeout=5)
+    assert respuesta.json() == {"host": f"{host_cacheado}:{servidor}", "cookie": None}
+
+
+def test_un_fallo_de_conexión_olvida_la_dirección(host_cacheado):
+    async def pedir():
+        async with httpx.AsyncClient(transport=http_session._TransporteDNS()) as cliente:
+            # Nada escucha en el puerto 9 (discard) de la máquina de tests
+            await cliente.get(f"http://{host_cacheado}:9/")
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(pedir())
+    assert host_cacheado not in http_session._dns_cache
+
+
+def test_un_único_cliente_asincrono_entre_hilos(monkeypatch):
+    monkeypatch.setattr(http_session, "_async_client", None)
+    clientes = []
+    hilos = [threading.Thread(target=lambda: clientes.append(http_session.get_async_client())) for _ in range(20)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert len({id(cliente) for cliente in clientes}) == 1
+
+
+def test_la_sesión_no_comparte_cookies_entre_usuarios(servidor, monkeypatch):
+    monkeypatch.setattr(http_session, "_session", None)
+    sesion = http_session.get_session()
+
+    sesion.get(f"http://127.0.0.1:{servidor}/", timeout=5)
+    respuesta = sesion.get(f"http://127.0.0.1:{servidor}/", timeout=5)
+
+    assert respuesta.json()["cookie"] is None
+    assert len(sesion.cookies) == 0
+
+
+def test_el_precalentamiento_deja_conexiones_abiertas(servidor, monkeypatch):
+    monkeypatch.setattr(http_session, "_session", None)
+
+    http_session.warm_up(f"http://127.0.0.1:{servidor}/", conexiones=3)
+    conexiones = set(_Eco.conexiones)
+    http_session.get_session().get(f"http://127.0.0.1:{servidor}/", timeout=5)
+
+    # La petición reutiliza una de las conexiones keep-alive ya abiertas
+    assert 1 <= len(conexiones) <= 3
+    assert _Eco.conexiones == conexiones
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+import pytest
+from app.database import IntentoReserva, SessionLocal
+from app.db_utils import estadisticas_intentos, insertar_intento_reserva, percentil
+
+APERTURA = datetime(2001, 3, 5, 9, 0)
+CENTRO = "intentos-test"
+
+
+@pytest.fixture
+def intentos():
+    """
+    Guarda 20 intentos por API de Yoga (uno de cada cuatro fallido) y uno por Selenium de Pilates.
+    """
+    with SessionLocal() as db:
+        for i in range(1, 21):
+            insertar_intento_reserva(
+                db, centro=CENTRO, clase="Yoga", fecha_clase=APERTURA + timedelta(days=2), backend="api",
+                programada_para=APERTURA, inicio=APERTURA - timedelta(seconds=30),
+                resultado="error" if i % 4 == 0 else "exito", ms_creacion=float(i), ms_hasta_reserva=float(i * 10),
+            )
+        insertar_intento_reserva(
+            db, centro=CENTRO, clase="Pilates", fecha_clase=APERTURA + timedelta(days=2), backend="selenium",
+            programada_para=APERTURA + timedelta(hours=1), inicio=APERTURA, resultado="exito", ms_selenium=4000.0,
+        )
+
+    yield
+
+    with SessionLocal() as db:
+        db.query(IntentoReserva).filter(IntentoReserva.centro == CENTRO).delete()
+        db.commit()
+
+
+def test_percentil_rango_más_cercano():
+    valores = list(range(1, 21))
+
+    assert percentil(valores, 50) == 10
+    assert percentil(valores, 95) == 19
+    assert percentil(valores, 100) == 20
+    assert percentil([7], 95) == 7
+    assert percentil([], 50) is None
+
+
+def test_estadisticas_por_clase(intentos):
+    with SessionLocal() as db:
+        estadisticas = estadisticas_intentos(db, APERTURA, APERTURA + timedelta(days=1), centro=CENTRO)
+
+    pilates, yoga = estadisticas
+    assert (yoga["clase"], yoga["intentos"], yoga["exitos"]) == ("Yoga", 20, 15)
+    # La creación cuenta todos los intentos y el tiempo hasta la reserva solo los que tuvieron éxito
+    assert yoga["fases"]["creacion"] == {"p50_ms": 10.0, "p95_ms": 19.0, "muestras": 20}
+    assert yoga["fases"]["hasta_reserva"]["muestras"] == 15
+    assert (yoga["p50_ms"], yoga["p95_ms"]) == (100.0, 190.0)
+    assert pilates["fases"] == {"selenium": {"p50_ms": 4000.0, "p95_ms": 4000.0, "muestras": 1}}
+    assert pilates["p50_ms"] is None
+
+
+def test_estadisticas_filtran_por_backend_y_apertura(intentos):
+    with SessionLocal() as db:
+        assert [e["clase"] for e in estadisticas_intentos(db, APERTURA, APERTURA + timedelta(days=1), centro=CENTRO, backend="selenium")] == ["Pilates"]
+        assert [e["clase"] for e in estadisticas_intentos(db, APERTURA, APERTURA + timedelta(minutes=30), centro=CENTRO)] == ["Yoga"]
+        assert estadisticas_intentos(db, APERTURA + timedelta(days=1), APERTURA + timedelta(days=2), centro=CENTRO) == []
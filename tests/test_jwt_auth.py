@@ -0,0 +1,35 @@
+import time
+from app.database import SessionLocal, Usuario
+from app.db_utils import actualizar_contraseña_usuario
+from app.utils.jwt_auth import PrincipalCache, principal_cache
+
+
+def test_caduca_y_expulsa_el_menos_usado(monkeypatch):
+    cache = PrincipalCache(ttl=10, maximo=2)
+    ahora = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: ahora)
+    for nombre in ("ana", "bea", "carla"):
+        cache.store(nombre, Usuario(id_usuario=nombre, contraseña="x"))
+
+    assert cache.get("ana") is None
+    assert cache.get("bea").id_usuario == "bea"
+
+    monkeypatch.setattr(time, "monotonic", lambda: ahora + 11)
+    assert cache.get("bea") is None
+
+
+def test_desactivada_con_ttl_cero():
+    cache = PrincipalCache(ttl=0)
+    cache.store("ana", Usuario(id_usuario="ana", contraseña="x"))
+    assert cache.get("ana") is None
+
+
+def test_cambiar_la_contraseña_invalida_el_usuario_en_caché(crear_reserva):
+    crear_reserva(email="principal@test.local")
+    with SessionLocal() as db:
+        usuario = db.get(Usuario, "principal@test.local")
+        principal_cache.store(usuario.id_usuario, usuario)
+
+        actualizar_contraseña_usuario(db, usuario, "nueva-cifrada")
+
+    assert principal_cache.get("principal@test.local") is None
@@ -0,0 +1,21 @@
+from sqlalchemy import select
+from app.database import Log, SessionLocal
+from app.utils.log_buffer import LogBuffer
+
+
+def _mensajes() -> list:
+    with SessionLocal() as db:
+        return db.scalars(select(Log.mensaje).where(Log.id_usuario == "buffer@test.local")).all()
+
+
+def test_un_log_invalido_no_bloquea_el_resto():
+    buffer = LogBuffer(tamaño=1000, intervalo=60)
+    buffer.añadir("buffer@test.local", None, "primero")
+    buffer.añadir("buffer@test.local", None, None)  # mensaje es obligatorio: falla siempre
+    buffer.añadir("buffer@test.local", None, "segundo")
+
+    assert buffer.flush() == 2
+
+    assert sorted(_mensajes()) == ["primero", "segundo"]
+    # El log inválido se ha descartado y no vuelve a intentarse
+    assert buffer.flush() == 0
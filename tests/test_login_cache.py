@@ -0,0 +1,51 @@
+import asyncio
+import time
+from app.database import SessionLocal, Usuario
+from app.db_utils import actualizar_contraseña_usuario
+from app.gateway.login_cache import LoginCache, login_cache
+
+
+def test_recuerda_solo_la_contraseña_correcta(monkeypatch):
+    cache = LoginCache(recuerdo=300)
+    ahora = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: ahora)
+    cache.recordar("ana", "secreto")
+
+    assert cache.reciente("ana", "secreto")
+    assert not cache.reciente("ana", "otra")
+    assert not cache.reciente("bea", "secreto")
+
+    monkeypatch.setattr(time, "monotonic", lambda: ahora + 301)
+    assert not cache.reciente("ana", "secreto")
+
+
+def test_olvidar():
+    cache = LoginCache(recuerdo=300)
+    cache.recordar("ana", "secreto")
+    cache.olvidar("ana")
+    assert not cache.reciente("ana", "secreto")
+
+
+def test_cambiar_la_contraseña_olvida_el_login(crear_reserva):
+    crear_reserva(email="login@test.local")
+    login_cache.recordar("login@test.local", "anterior")
+    with SessionLocal() as db:
+        actualizar_contraseña_usuario(db, db.get(Usuario, "login@test.local"), "nueva-cifrada")
+
+    assert not login_cache.reciente("login@test.local", "anterior")
+
+
+def test_verificaciones_simultáneas_comparten_la_petición():
+    cache = LoginCache(recuerdo=300)
+    llamadas = []
+
+    async def autenticar():
+        llamadas.append(1)
+        await asyncio.sleep(0.01)
+        return True
+
+    async def verificar_a_la_vez():
+        return await asyncio.gather(*(cache.verificar("ana", "secreto", autenticar) for _ in range(5)))
+
+    assert asyncio.run(verificar_a_la_vez()) == [True] * 5
+    assert len(llamadas) == 1
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from app.database import Log, LogHistorico, SessionLocal
+from app.db_utils import archivar_logs, listar_logs
+
+
+def _insertar_logs(db, id_usuario, fechas, id_reserva=None):
+    logs = [Log(id_usuario=id_usuario, id_reserva=id_reserva, mensaje=f"log {numero}", fecha_creacion=fecha) for numero, fecha in enumerate(fechas)]
+    db.add_all(logs)
+    db.commit()
+    return [log.id_log for log in logs]
+
+
+def test_paginación_por_cursor(crear_reserva):
+    id_reserva = crear_reserva(email="logs@test.local")
+    inicio = datetime(2026, 10, 1, 12)
+    with SessionLocal() as db:
+        ids = _insertar_logs(db, "logs@test.local", [inicio + timedelta(hours=horas) for horas in range(5)], id_reserva)
+
+        paginas, cursor = [], None
+        while True:
+            logs, cursor = listar_logs(db, "logs@test.local", cursor=cursor, limite=2)
+            paginas.append([log["id_log"] for log in logs])
+            if cursor is None:
+                break
+
+        # Del más reciente al más antiguo, sin repetir ni saltarse ninguno
+        assert paginas == [ids[4:2:-1], ids[2:0:-1], ids[:1]]
+
+        logs, cursor = listar_logs(db, "logs@test.local", desde=inicio + timedelta(hours=1), hasta=inicio + timedelta(hours=3))
+        assert [log["id_log"] for log in logs] == [ids[2], ids[1]]
+        assert cursor is None
+        assert listar_logs(db, "logs@test.local", id_reserva=id_reserva + 1000) == ([], None)
+
+        db.execute(delete(Log).where(Log.id_log.in_(ids)))
+        db.commit()
+
+
+def test_archiva_por_lotes_solo_los_antiguos():
+    with SessionLocal() as db:
+        antiguos = _insertar_logs(db, None, [datetime(2000, 1, 1)] * 5)
+        recientes = _insertar_logs(db, None, [datetime(2000, 6, 1)])
+
+        assert archivar_logs(db, datetime(2000, 2, 1), lote=2) == 5
+
+        assert db.scalars(select(LogHistorico.id_log).where(LogHistorico.id_log.in_(antiguos)).order_by(LogHistorico.id_log)).all() == antiguos
+        assert db.scalars(select(Log.id_log).where(Log.id_log.in_(antiguos + recientes)).order_by(Log.id_log)).all() == recientes
+
+        db.execute(delete(Log).where(Log.id_log.in_(recientes)))
+        db.execute(delete(LogHistorico).where(LogHistorico.id_log.in_(antiguos)))
+        db.commit()
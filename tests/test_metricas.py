@@ -0,0 +1,16 @@
+from prometheus_client import REGISTRY
+from app.utils.metricas import registrar_reserva
+
+
+def _reservas(**etiquetas):
+    return REGISTRY.get_sample_value("reservas_total", etiquetas) or 0
+
+
+def test_las_reservas_se_cuentan_sin_la_clase():
+    antes = _reservas(centro="777", backend="api", resultado="exito")
+
+    registrar_reserva(777, "api", True, 120.0)
+
+    assert _reservas(centro="777", backend="api", resultado="exito") == antes + 1
+    [metrica] = [metrica for metrica in REGISTRY.collect() if metrica.name == "reservas"]
+    assert {tuple(sorted(muestra.labels)) for muestra in metrica.samples} == {("backend", "centro", "resultado")}
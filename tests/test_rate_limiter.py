@@ -0,0 +1,46 @@
+from app.gateway.rate_limiter import RateLimiter
+
+
+def test_los_logins_interactivos_tienen_su_propio_presupuesto():
+    limitador = RateLimiter(tasa_global=100, rafaga_global=100, reserva_prioritaria=0,
+                            presupuestos={"login": (1, 1), "login_interactivo": (1, 1)}, activo=True)
+
+    assert limitador._intentar("login") == 0
+    assert limitador._intentar("login") > 0
+    # Agotar el presupuesto de las reservas no retrasa el login de un usuario
+    assert limitador._intentar("login_interactivo") == 0
+
+
+def test_la_reserva_prioritaria_solo_la_usan_las_reservas():
+    limitador = RateLimiter(tasa_global=0.001, rafaga_global=10, reserva_prioritaria=3, presupuestos={}, activo=True)
+
+    assert [limitador._intentar("login") for _ in range(7)] == [0] * 7
+    # Los 3 tokens restantes quedan para las peticiones de reserva
+    assert limitador._intentar("search") > 0
+    assert [limitador._intentar("create") for _ in range(3)] == [0] * 3
+    assert limitador._intentar("create") > 0
+
+
+def test_logins_que_caben_en_la_preparación(monkeypatch):
+    from app import tasks
+
+    monkeypatch.setattr(tasks, "ANTELACION_PREPARACION", 30)
+    monkeypatch.setattr(tasks, "PRESUPUESTOS", {"login": (10, 20)})
+    monkeypatch.setattr(tasks, "RATE_GLOBAL", 50)
+    monkeypatch.setattr(tasks, "RAFAGA_GLOBAL", 100)
+    monkeypatch.setattr(tasks.rate_limiter, "reserva_prioritaria", 30)
+    # El límite de logins (20 + 10 * 30) es más estricto que el global (70 + 50 * 30)
+    assert tasks.logins_antes_de_apertura() == 320
+
+
+def test_aviso_si_los_logins_no_caben(monkeypatch, crear_reserva, capsys):
+    from app import tasks
+
+    for numero in range(3):
+        crear_reserva(email=f"apertura-{numero}@test.local", dia_semana="friday", hora="07:00")
+    monkeypatch.setattr(tasks.rate_limiter, "activo", True)
+    monkeypatch.setattr(tasks, "logins_antes_de_apertura", lambda: 2)
+
+    tasks.informe_concurrencia()
+
+    assert "hasta 3 reservas comparten apertura" in capsys.readouterr().out
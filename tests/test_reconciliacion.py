@@ -0,0 +1,27 @@
+import pytest
+from app.database import Reserva, SessionLocal, Usuario
+from app.reconciliacion import reconciliar_reservas
+from app.tasks import scheduler
+
+
+@pytest.fixture
+def scheduler_en_pausa():
+    scheduler.start(paused=True)
+    yield scheduler
+    scheduler.remove_all_jobs()
+    scheduler.shutdown(wait=False)
+
+
+def test_omite_reservas_invalidas_y_no_reprograma_las_correctas(scheduler_en_pausa):
+    with SessionLocal() as db:
+        db.merge(Usuario(id_usuario="reconciliacion@test.local", contraseña="x"))
+        db.add(Reserva(dia_semana="monday", hora="09:00", clase="Yoga", centro="134", id_usuario="reconciliacion@test.local"))
+        db.add(Reserva(dia_semana="lunes", hora="10:30", clase="Yoga", centro="134", id_usuario="reconciliacion@test.local"))
+        db.commit()
+
+    informe = reconciliar_reservas()
+    assert (informe["añadidas"], informe["invalidas"]) == (1, 1)
+
+    # Las tareas leídas del jobstore tienen el mismo disparador aunque no sean el mismo objeto
+    informe = reconciliar_reservas()
+    assert (informe["añadidas"], informe["eliminadas"], informe["corregidas"]) == (0, 0, 0)
@@ -0,0 +1,88 @@
+from app.gateway.retry_policy import RetryPolicy, segundos_retry_after
+
+
+class GimnasioFalso:
+    """
+    Sustituye a VG_API: responde a cada intento de reserva con el siguiente estado de la lista.
+    """
+    def __init__(self, estados, retry_after=None, participacion=None):
+        self.estados = list(estados)
+        self.retry_after = retry_after
+        self.participacion = participacion
+        self.reservas = 0
+        self.busquedas = 0
+        self.last_booking_status = None
+        self.last_retry_after = None
+
+    def commit_booking(self, payload):
+        self.reservas += 1
+        self.last_booking_status = self.estados.pop(0)
+        self.last_retry_after = self.retry_after if self.last_booking_status == 429 else None
+        return 1234 if self.last_booking_status == 200 else None
+
+    def find_participation(self, center, date, booking_id):
+        self.busquedas += 1
+        return self.participacion
+
+
+PAYLOAD = {"selectedUserCenterId": 134, "bookingId": 99}
+
+
+def _politica(**opciones):
+    valores = {"ventana": 10, "base": 0.001, "maximo": 0.01, "jitter": 0, "max_intentos": 5}
+    valores.update(opciones)
+    return RetryPolicy(**valores)
+
+
+def test_no_reintenta_409():
+    gimnasio = GimnasioFalso([409, 200])
+
+    assert _politica().run(gimnasio, PAYLOAD) == (None, 1)
+
+
+def test_no_reintenta_400():
+    gimnasio = GimnasioFalso([400, 200])
+
+    assert _politica().run(gimnasio, PAYLOAD) == (None, 1)
+    assert gimnasio.reservas == 1
+
+
+def test_no_repite_una_reserva_creada_sin_respuesta():
+    gimnasio = GimnasioFalso(["timeout", 200], participacion=555)
+
+    assert _politica().run(gimnasio, PAYLOAD, fecha="2026-10-19") == (555, 1)
+    assert gimnasio.reservas == 1
+    assert gimnasio.busquedas == 1
+
+
+def test_repite_la_reserva_si_no_se_creo():
+    gimnasio = GimnasioFalso(["conexion", 200])
+
+    assert _politica().run(gimnasio, PAYLOAD, fecha="2026-10-19") == (1234, 2)
+    assert gimnasio.busquedas == 1
+
+
+def test_respeta_retry_after(monkeypatch):
+    esperas = []
+    monkeypatch.setattr("app.gateway.retry_policy.time.sleep", esperas.append)
+    gimnasio = GimnasioFalso([429, 200], retry_after=3)
+
+    assert _politica().run(gimnasio, PAYLOAD) == (1234, 2)
+    assert esperas == [3]
+    # Si el gimnasio pide esperar más que la ventana de reintentos, no se reintenta
+    assert _politica(ventana=1).run(GimnasioFalso([429, 200], retry_after=3), PAYLOAD) == (None, 1)
+
+
+def test_segundos_retry_after():
+    assert segundos_retry_after("2") == 2
+    assert segundos_retry_after(None) is None
+    assert segundos_retry_after("no es una fecha") is None
+    assert segundos_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+
+
+def test_comprueba_la_reserva_antes_de_darla_por_fallida():
+    # Agotados los intentos tras un timeout, la reserva pudo crearse igualmente
+    gimnasio = GimnasioFalso(["timeout"], participacion=555)
+
+    assert _politica(max_intentos=1).run(gimnasio, PAYLOAD, fecha="2026-10-19") == (555, 1)
+    assert gimnasio.busquedas == 1
@@ -0,0 +1,87 @@
+import pytest
+from cryptography.fernet import Fernet, MultiFernet
+from app import rotar_claves
+from app.database import SessionLocal, Usuario
+from app.utils import fernet_encryption
+
+EMAILS = ["rotacion-a@test.local", "rotacion-b@test.local", "rotacion-c@test.local"]
+
+
+@pytest.fixture
+def clave_nueva(monkeypatch):
+    """
+    Guarda los usuarios cifrados con una clave antigua y pone una clave nueva como principal.
+    """
+    antigua, nueva = Fernet(Fernet.generate_key()), Fernet(Fernet.generate_key())
+    monkeypatch.setattr(fernet_encryption, "claves", [nueva, antigua])
+    monkeypatch.setattr(fernet_encryption, "clave_principal", nueva)
+    monkeypatch.setattr(fernet_encryption, "cipher", MultiFernet([nueva, antigua]))
+
+    with SessionLocal() as db:
+        for email in EMAILS:
+            db.add(Usuario(id_usuario=email, contraseña=antigua.encrypt(email.encode()).decode()))
+        db.commit()
+
+    yield nueva
+
+    with SessionLocal() as db:
+        db.query(Usuario).filter(Usuario.id_usuario.in_(EMAILS)).delete()
+        db.commit()
+
+
+def _contraseñas():
+    with SessionLocal() as db:
+        return dict(db.query(Usuario.id_usuario, Usuario.contraseña).filter(Usuario.id_usuario.in_(EMAILS)).all())
+
+
+def test_rota_todas_las_contraseñas(clave_nueva, tmp_path):
+    resumen = rotar_claves.rotar_claves(2, str(tmp_path / "progreso"), desde="rotacion-")
+
+    assert resumen["rotados"] == 3
+    for email, contraseña in _contraseñas().items():
+        assert clave_nueva.decrypt(contraseña.encode()).decode() == email
+
+    # Una segunda pasada no tiene nada que rotar
+    assert rotar_claves.rotar_claves(2, str(tmp_path / "progreso"), desde="rotacion-")["rotados"] == 0
+
+
+def test_continua_donde_se_quedó(clave_nueva, tmp_path, monkeypatch):
+    fichero = str(tmp_path / "progreso")
+    guardar = rotar_claves._guardar_progreso
+
+    def guardar_e_interrumpir(fichero, ultimo_id):
+        guardar(fichero, ultimo_id)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(rotar_claves, "_guardar_progreso", guardar_e_interrumpir)
+    with pytest.raises(KeyboardInterrupt):
+        rotar_claves.rotar_claves(2, fichero, desde="rotacion-")
+    monkeypatch.setattr(rotar_claves, "_guardar_progreso", guardar)
+
+    # El primer lote quedó guardado y anotado
+    assert rotar_claves._leer_progreso(fichero) == EMAILS[1]
+    rotadas = [email for email, contraseña in _contraseñas().items() if fernet_encryption.cifrada_con_clave_principal(contraseña)]
+    assert sorted(rotadas) == EMAILS[:2]
+
+    resumen = rotar_claves.rotar_claves(2, fichero, desde=rotar_claves._leer_progreso(fichero))
+    assert resumen["revisados"] == 1
+    assert resumen["rotados"] == 1
+    assert all(fernet_encryption.cifrada_con_clave_principal(contraseña) for contraseña in _contraseñas().values())
+
+
+def test_no_pisa_un_cambio_de_contraseña(clave_nueva, tmp_path, monkeypatch):
+    rotar = fernet_encryption.rotar_contraseña
+
+    def rotar_tras_cambio(contraseña):
+        # Mientras se rota, el usuario cambia su contraseña desde la API
+        with SessionLocal() as db:
+            db.query(Usuario).filter(Usuario.id_usuario == EMAILS[0]).update({"contraseña": fernet_encryption.cifrar_contraseña("nueva")})
+            db.commit()
+        monkeypatch.setattr(rotar_claves, "rotar_contraseña", rotar)
+        return rotar(contraseña)
+
+    monkeypatch.setattr(rotar_claves, "rotar_contraseña", rotar_tras_cambio)
+    resumen = rotar_claves.rotar_claves(10, str(tmp_path / "progreso"), desde="rotacion-")
+
+    assert resumen["conflictos"] == 1
+    assert fernet_encryption.descifrar_contraseña(_contraseñas()[EMAILS[0]]) == "nueva"
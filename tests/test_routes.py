@@ -0,0 +1,55 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routes import router
+from app.utils.jwt_auth import create_token
+
+
+@pytest.fixture
+def cliente():
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1")
+    return TestClient(app)
+
+
+@pytest.fixture
+def cabeceras(crear_reserva):
+    crear_reserva(email="rutas@test.local")
+    return {"Authorization": f"Bearer {create_token({'sub': 'rutas@test.local'}, 5)}"}
+
+
+def test_estadisticas_requieren_usuario(cliente, cabeceras):
+    assert cliente.get("/api/v1/reservas/estadisticas").status_code == 401
+
+    respuesta = cliente.get("/api/v1/reservas/estadisticas", headers=cabeceras)
+    assert respuesta.status_code == 200
+    assert "clases" in respuesta.json()
+
+
+@pytest.mark.parametrize("formato", ["json", "ndjson", "csv"])
+def test_listado_y_exportación_requieren_usuario(cliente, cabeceras, formato):
+    assert cliente.get("/api/v1/reservas/", params={"formato": formato}).status_code == 401
+
+    respuesta = cliente.get("/api/v1/reservas/", params={"formato": formato, "campos": "id_reserva,centro"}, headers=cabeceras)
+    assert respuesta.status_code == 200
+    assert "134" in respuesta.text
+
+
+def test_reservas_de_usuario_con_etag(cliente, cabeceras, crear_reserva):
+    respuesta = cliente.get("/api/v1/usuario/reservas", headers=cabeceras)
+    assert respuesta.status_code == 200
+    assert [reserva["centro"] for reserva in respuesta.json()["reservas"]] == ["134"]
+    assert respuesta.json()["reservas"][0]["confirmada"] is False
+    etag = respuesta.headers["ETag"]
+
+    # Sin cambios el cliente recibe 304 sin cuerpo
+    respuesta = cliente.get("/api/v1/usuario/reservas", headers={**cabeceras, "If-None-Match": etag})
+    assert respuesta.status_code == 304
+    assert respuesta.content == b""
+
+    # Una reserva nueva cambia el ETag
+    crear_reserva(email="rutas@test.local", clase="Pilates")
+    respuesta = cliente.get("/api/v1/usuario/reservas", headers={**cabeceras, "If-None-Match": etag})
+    assert respuesta.status_code == 200
+    assert respuesta.headers["ETag"] != etag
+    assert len(respuesta.json()["reservas"]) == 2
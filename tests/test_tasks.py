@@ -0,0 +1,220 @@
+from datetime import datetime, timedelta
+import pytest
+from app import tasks
+from app.gateway.retry_policy import RetryPolicy
+
+
+class VGApiFalso:
+    """
+    Sustituye a VG_API en ejecutar_reserva. Cada reserva responde con el siguiente estado de
+    la lista y find_participation con la siguiente participación.
+    """
+    instancias = []
+
+    def __init__(self, username, password, estados=("timeout",), participaciones=(None, 555)):
+        self.username = username
+        self.password = password
+        self.estados = list(estados)
+        self.participaciones = list(participaciones)
+        self.last_auth_status = 200
+        self.last_search_status = 200
+        self.last_booking_status = None
+        self.last_retry_after = None
+        self.busquedas = 0
+        VGApiFalso.instancias.append(self)
+
+    def authenticate(self):
+        return True
+
+    def prepare_booking(self, centro, fecha, hora, clase):
+        return {"selectedUserCenterId": centro, "bookingId": 99}
+
+    def commit_booking(self, payload):
+        self.last_booking_status = self.estados.pop(0)
+        return 1234 if self.last_booking_status == 200 else None
+
+    def find_participation(self, centro, fecha, booking_id):
+        self.busquedas += 1
+        return self.participaciones.pop(0)
+
+
+@pytest.fixture
+def selenium(monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(tasks, "reservar_por_selenium", lambda contexto, apertura, tiempos: llamadas.append(contexto["id_reserva"]))
+    monkeypatch.setattr(tasks, "POLITICA_REINTENTOS", RetryPolicy(ventana=0, base=0.001, maximo=0.001, jitter=0, max_intentos=1))
+    monkeypatch.setattr(tasks, "send_email", lambda *args: None)
+    tasks.circuito_api.exito()
+    VGApiFalso.instancias.clear()
+    return llamadas
+
+
+def test_no_pasa_a_selenium_si_la_reserva_sin_respuesta_se_creo(monkeypatch, crear_reserva, selenium):
+    monkeypatch.setattr(tasks, "VG_API", VGApiFalso)
+    id_reserva = crear_reserva(email="sin-respuesta@test.local")
+
+    tasks.ejecutar_reserva(id_reserva, "09:00", "134", "Yoga", fecha_reserva=datetime.now() + timedelta(days=1), programada=False)
+
+    # La comprobación de RetryPolicy aún no ve la reserva; la de antes de Selenium sí
+    assert VGApiFalso.instancias[0].busquedas == 2
+    assert selenium == []
+    with tasks.SessionLocal() as db:
+        assert tasks.obtener_reserva(db, id_reserva).id_reserva_gimnasio == 555
+
+
+def test_pasa_a_selenium_si_la_reserva_sin_respuesta_no_existe(monkeypatch, crear_reserva, selenium):
+    monkeypatch.setattr(tasks, "VG_API", lambda u, p: VGApiFalso(u, p, participaciones=(None, None)))
+    id_reserva = crear_reserva(email="sin-reserva@test.local")
+
+    tasks.ejecutar_reserva(id_reserva, "09:00", "134", "Yoga", fecha_reserva=datetime.now() + timedelta(days=1), programada=False)
+
+    assert selenium == [id_reserva]
+
+
+class SchedulerFalso:
+    """Guarda las tareas que se programan en lugar de ejecutarlas."""
+    running = True
+
+    def __init__(self):
+        self.tareas = []
+
+    def add_job(self, func, trigger, **opciones):
+        self.tareas.append((func, trigger, opciones))
+
+
+def test_el_disparo_programado_es_una_tarea_aparte(monkeypatch, crear_reserva, selenium):
+    monkeypatch.setattr(tasks, "VG_API", lambda u, p: VGApiFalso(u, p, estados=(200,)))
+    monkeypatch.setattr(tasks, "scheduler", SchedulerFalso())
+    monkeypatch.setattr(tasks, "esperar_hasta", lambda instante: None)
+    monkeypatch.setattr(tasks, "PRECALENTAMIENTO_SEGUNDOS", 0)
+    id_reserva = crear_reserva(email="disparo@test.local")
+    apertura = (datetime.now() + timedelta(minutes=2)).replace(second=0, microsecond=0)
+
+    tasks.ejecutar_reserva(id_reserva, apertura.strftime("%H:%M"), "134", "Yoga", fecha_reserva=apertura)
+
+    # La preparación ha terminado pero la reserva aún no se ha enviado
+    api = VGApiFalso.instancias[0]
+    assert api.last_booking_status is None
+    [(func, trigger, opciones)] = tasks.scheduler.tareas
+    assert trigger == "date"
+    assert opciones["jobstore"] == "memoria"
+    assert opciones["misfire_grace_time"] is None
+    assert opciones["run_date"] == apertura - timedelta(seconds=tasks.MARGEN_DISPARO_SEGUNDOS)
+
+    func(*opciones["args"])
+    assert api.last_booking_status == 200
+    with tasks.SessionLocal() as db:
+        assert tasks.obtener_reserva(db, id_reserva).id_reserva_gimnasio == 1234
+
+
+def test_sin_scheduler_el_disparo_espera_en_el_mismo_hilo(monkeypatch, crear_reserva, selenium):
+    monkeypatch.setattr(tasks, "VG_API", lambda u, p: VGApiFalso(u, p, estados=(200,)))
+    monkeypatch.setattr(tasks, "scheduler", SchedulerFalso())
+    monkeypatch.setattr(tasks.scheduler, "running", False)
+    esperas = []
+    monkeypatch.setattr(tasks, "esperar_hasta", esperas.append)
+    monkeypatch.setattr(tasks, "PRECALENTAMIENTO_SEGUNDOS", 0)
+    id_reserva = crear_reserva(email="disparo-inline@test.local")
+    apertura = (datetime.now() + timedelta(minutes=2)).replace(second=0, microsecond=0)
+
+    tasks.ejecutar_reserva(id_reserva, apertura.strftime("%H:%M"), "134", "Yoga", fecha_reserva=apertura)
+
+    assert tasks.scheduler.tareas == []
+    assert esperas == [apertura]
+    assert VGApiFalso.instancias[0].last_booking_status == 200
+
+
+def test_campos_disparador_cruzan_la_medianoche(monkeypatch):
+    monkeypatch.setattr(tasks, "ANTELACION_PREPARACION", 30)
+
+    # Apertura el lunes a las 00:00: la preparación arranca el domingo a las 23:59:30
+    assert tasks.campos_disparador(0, "00:00") == {"day_of_week": 6, "hour": 23, "minute": 59, "second": 30}
+    assert tasks.campos_disparador(6, "00:00")["day_of_week"] == 5
+    assert tasks.campos_disparador(2, "09:00") == {"day_of_week": 2, "hour": 8, "minute": 59, "second": 30}
+
+
+def test_eliminar_reserva_quita_tambien_la_ejecucion_inmediata(monkeypatch):
+    # En modo API la reserva que abre en menos de 24 h se delega al worker como tarea aparte
+    monkeypatch.setattr(tasks, "_ejecuta_tareas", False)
+    mañana = (datetime.now() + timedelta(days=1)).strftime("%A").lower()
+    tasks.programar_reserva(4242, mañana, "00:00", "134", "Yoga")
+    assert tasks.scheduler.get_job("4242") is not None
+    assert tasks.scheduler.get_job("4242_inmediata") is not None
+
+    tasks.eliminar_reserva_programada(4242)
+
+    assert tasks.scheduler.get_job("4242") is None
+    assert tasks.scheduler.get_job("4242_inmediata") is None
+
+
+def test_la_preparación_no_envía_la_reserva(monkeypatch, crear_reserva):
+    monkeypatch.setattr(tasks, "VG_API", lambda u, p: VGApiFalso(u, p, estados=(200,)))
+    VGApiFalso.instancias.clear()
+    id_reserva = crear_reserva(email="preparacion@test.local")
+    contexto = tasks.iniciar_reserva(id_reserva, "09:00", "134", "Yoga", fecha_reserva=datetime.now(), programada=False)
+    tiempos = {}
+
+    preparada = tasks.preparar_reserva(contexto, tiempos)
+
+    assert preparada["payload"] == {"selectedUserCenterId": "134", "bookingId": 99}
+    assert preparada["vg_api"].last_booking_status is None
+    assert set(tiempos) == {"descifrado", "autenticacion", "busqueda"}
+
+    participation_id, intentos = tasks.disparar_reserva(preparada, None, tiempos)
+    assert (participation_id, intentos) == (1234, 1)
+    assert "creacion" in tiempos and "espera" not in tiempos
+
+
+def test_una_búsqueda_fallida_no_es_una_clase_inexistente(crear_reserva):
+    id_reserva = crear_reserva(email="busqueda@test.local")
+    contexto = tasks.iniciar_reserva(id_reserva, "09:00", "134", "Yoga", fecha_reserva=datetime.now(), programada=False)
+
+    tasks.clasificar_busqueda_fallida(contexto, "timeout")
+    assert (contexto["resultado_preparacion"], contexto["estado_api"]) == ("error", "timeout")
+
+    contexto.pop("estado_api")
+    tasks.clasificar_busqueda_fallida(contexto, 200)
+    assert contexto["resultado_preparacion"] == "clase_no_encontrada"
+    assert "estado_api" not in contexto
+
+
+def test_la_apertura_más_cercana_cruza_la_medianoche():
+    # Una tarea de las 00:00 que arranca el día anterior a las 23:59:30 abre al día siguiente
+    assert tasks.instante_apertura(datetime(2026, 10, 18, 23, 59, 30), "00:00") == datetime(2026, 10, 19, 0, 0)
+    # Y si arranca con retraso, la apertura es la que acaba de pasar
+    assert tasks.instante_apertura(datetime(2026, 10, 19, 0, 0, 40), "00:00") == datetime(2026, 10, 19, 0, 0)
+
+
+def test_con_el_circuito_abierto_se_reserva_por_selenium(monkeypatch, crear_reserva, selenium):
+    monkeypatch.setattr(tasks, "VG_API", lambda u, p: VGApiFalso(u, p, estados=(503,), participaciones=(None, None)))
+    monkeypatch.setattr(tasks.circuito_api, "umbral", 1)
+    id_reserva = crear_reserva(email="circuito@test.local")
+
+    # El 503 abre el circuito y esta reserva pasa a Selenium
+    tasks.ejecutar_reserva(id_reserva, "09:00", "134", "Yoga", fecha_reserva=datetime.now() + timedelta(days=1), programada=False)
+    assert tasks.circuito_api.estado == "abierto"
+    assert selenium == [id_reserva]
+
+    # La siguiente ni siquiera intenta la API
+    tasks.ejecutar_reserva(id_reserva, "09:00", "134", "Yoga", fecha_reserva=datetime.now() + timedelta(days=1), programada=False)
+    assert len(VGApiFalso.instancias) == 1
+    assert selenium == [id_reserva, id_reserva]
+    tasks.circuito_api.exito()
+
+
+def test_la_reserva_queda_registrada_en_intentos(monkeypatch, crear_reserva, selenium):
+    monkeypatch.setattr(tasks, "VG_API", lambda u, p: VGApiFalso(u, p, estados=(200,)))
+    id_reserva = crear_reserva(email="intentos@test.local")
+
+    tasks.ejecutar_reserva(id_reserva, "09:00", "134", "Yoga", fecha_reserva=datetime.now() + timedelta(days=1), programada=False)
+
+    with tasks.SessionLocal() as db:
+        intentos = db.query(tasks.IntentoReserva).filter(tasks.IntentoReserva.id_usuario == "intentos@test.local").all()
+        assert len(intentos) == 1
+        intento = intentos[0]
+        assert (intento.backend, intento.resultado, intento.estado_reserva) == ("api", "exito", "200")
+        assert intento.id_reserva_gimnasio == 1234
+        assert intento.programada_para is None
+        assert intento.disparo is not None and intento.ms_creacion is not None
+        db.delete(intento)
+        db.commit()
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from app.gateway.timetable_cache import TimetableCache
+
+HORARIO = [{"booking": {"id": 7, "name": "Yoga", "startTime": "09:00"}}]
+
+
+def _descarga(llamadas: list):
+    def fetch():
+        llamadas.append(1)
+        return HORARIO, 200
+    return fetch
+
+
+def test_reutiliza_el_horario_hasta_invalidarlo():
+    cache = TimetableCache(ttl=60)
+    llamadas = []
+
+    assert cache.get_index(134, "2026-10-19", _descarga(llamadas)) == ({("Yoga", "09:00"): 7}, 200)
+    assert cache.get_index(134, "2026-10-19", _descarga(llamadas)) == ({("Yoga", "09:00"): 7}, None)
+    assert len(llamadas) == 1
+
+    # Sin fecha se invalidan todas las fechas del centro
+    cache.get_index(134, "2026-10-20", _descarga(llamadas))
+    cache.invalidate(134)
+    assert cache._entradas == {}
+
+
+def test_elimina_las_entradas_caducadas():
+    cache = TimetableCache(ttl=0)
+    llamadas = []
+
+    cache.get_index(134, "2026-10-19", _descarga(llamadas))
+    cache.get_index(135, "2026-10-19", _descarga(llamadas))
+
+    # Al guardar un horario se eliminan los caducados
+    assert list(cache._entradas) == [("135", "2026-10-19")]
+    # Al leer uno caducado se elimina y se descarga de nuevo
+    cache.get_index(135, "2026-10-19", _descarga(llamadas))
+    assert len(llamadas) == 3
+
+
+def test_solo_vuelve_a_descargar_un_horario_antiguo():
+    cache = TimetableCache(ttl=60)
+    llamadas = []
+    cache.get_index(134, "2026-10-19", _descarga(llamadas))
+
+    # Recién descargado: una clase que no aparece no provoca otra descarga
+    assert cache.expire_if_older(134, "2026-10-19", edad=30) is False
+    assert cache.get_index(134, "2026-10-19", _descarga(llamadas))[1] is None
+    # Con más antigüedad que el umbral se elimina y se descarga de nuevo
+    assert cache.expire_if_older(134, "2026-10-19", edad=0) is True
+    cache.get_index(134, "2026-10-19", _descarga(llamadas))
+    assert len(llamadas) == 2
+
+
+def test_hilos_y_corrutinas_comparten_la_descarga():
+    cache = TimetableCache(ttl=60)
+    llamadas = []
+    empezada = threading.Event()
+    seguir = threading.Event()
+
+    def descarga_lenta():
+        llamadas.append(1)
+        empezada.set()
+        seguir.wait(5)
+        return HORARIO, 200
+
+    async def descarga_async():
+        llamadas.append(1)
+        return HORARIO, 200
+
+    resultados = []
+    hilo = threading.Thread(target=lambda: resultados.append(cache.get_index(134, "2026-10-19", descarga_lenta)))
+    hilo.start()
+    empezada.wait(5)
+
+    async def esperar():
+        tarea = asyncio.create_task(cache.get_index_async(134, "2026-10-19", descarga_async))
+        await asyncio.sleep(0.05)
+        seguir.set()
+        return await tarea
+
+    # La corrutina espera a la descarga del hilo en lugar de hacer la suya
+    assert asyncio.run(esperar()) == ({("Yoga", "09:00"): 7}, 200)
+    hilo.join(5)
+    assert resultados == [({("Yoga", "09:00"): 7}, 200)]
+    assert len(llamadas) == 1
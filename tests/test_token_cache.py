@@ -0,0 +1,52 @@
+from app.database import Reserva, SessionLocal
+from app.db_utils import contraseñas_con_reservas_activas
+from app.gateway import vg_api
+from app.gateway.token_cache import TokenCache
+from app.utils.fernet_encryption import cifrar_contraseña
+
+
+def test_no_guarda_la_contraseña():
+    cache = TokenCache(margen=0)
+    cache.store("ana@test.local", "secreto", "token", 1, 134)
+
+    entrada = cache.get("ana@test.local", "secreto")
+    assert entrada["token"] == "token"
+    assert "secreto" not in entrada.values()
+    assert cache.get("ana@test.local", "otra") is None
+    assert cache.expiring(antelacion=10 ** 9) == ["ana@test.local"]
+
+
+def test_solo_renueva_los_tokens_de_usuarios_con_reservas(monkeypatch):
+    cache = TokenCache(margen=0)
+    monkeypatch.setattr(vg_api, "token_cache", cache)
+    renovados = []
+
+    class VGApiRenovable(vg_api.VG_API):
+        def authenticate(self, use_cache=True):
+            renovados.append((self.username, self.password))
+            cache.store(self.username, self.password, "nuevo", 1, 134)
+            return True
+
+    cache.store("activo@test.local", "secreto", "viejo", 1, 134)
+    cache.store("inactivo@test.local", "secreto", "viejo", 1, 134)
+
+    VGApiRenovable.refresh_cached_tokens(
+        antelacion=10 ** 9,
+        credenciales=lambda usernames: {"activo@test.local": cifrar_contraseña("secreto")},
+    )
+
+    assert renovados == [("activo@test.local", "secreto")]
+    assert cache.get("activo@test.local", "secreto")["token"] == "nuevo"
+    assert cache.get("inactivo@test.local", "secreto") is None
+
+
+def test_contraseñas_de_usuarios_con_reservas_activas(crear_reserva):
+    crear_reserva(email="con-reserva@test.local")
+    id_inactiva = crear_reserva(email="sin-reserva-activa@test.local")
+    with SessionLocal() as db:
+        db.get(Reserva, id_inactiva).reserva_activa = False
+        db.commit()
+
+        contraseñas = contraseñas_con_reservas_activas(db, ["con-reserva@test.local", "sin-reserva-activa@test.local", "nadie@test.local"])
+
+    assert list(contraseñas) == ["con-reserva@test.local"]
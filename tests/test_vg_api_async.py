@@ -0,0 +1,57 @@
+import asyncio
+import httpx
+import pytest
+from app.gateway import http_session
+from app.gateway.timetable_cache import timetable_cache
+from app.gateway.vg_api import VG_API
+from app.gateway.vg_api_async import VG_API_Async
+
+
+@pytest.fixture
+def gimnasio(monkeypatch):
+    """
+    Sustituye al gimnasio por un transporte de httpx que responde a cada petición con
+    respuestas[endpoint] y guarda los cuerpos que recibe.
+    """
+    respuestas = {}
+    peticiones = []
+
+    def responder(request):
+        endpoint = request.url.path
+        peticiones.append((endpoint, request.content))
+        return respuestas[endpoint]
+
+    cliente = httpx.AsyncClient(transport=httpx.MockTransport(responder))
+    monkeypatch.setattr(http_session, "get_async_client", lambda: cliente)
+    timetable_cache.invalidate()
+    return respuestas, peticiones
+
+
+def _api():
+    api = VG_API_Async("async@test.local", "secreto")
+    api.token, api.user_id, api.center_id = "token", 7, 134
+    return api
+
+
+def test_una_página_de_error_no_rompe_la_reserva(gimnasio):
+    respuestas, _ = gimnasio
+    respuestas[VG_API.CREATE_BOOKING_ENDPOINT] = httpx.Response(200, text="<html>Mantenimiento</html>")
+    respuestas[VG_API.SEARCH_BOOKING_ENDPOINT] = httpx.Response(200, text="<html>Mantenimiento</html>")
+    respuestas[VG_API.LOGIN_ENDPOINT] = httpx.Response(200, text="<html>Mantenimiento</html>")
+    api = _api()
+
+    assert asyncio.run(api.commit_booking(api._datos_reserva(134, 99))) is None
+    assert api.last_booking_status == 200
+    assert asyncio.run(api.search_booking_participations(134, "2026-10-19", "2026-10-19")) is None
+    assert asyncio.run(VG_API_Async("otro@test.local", "secreto").authenticate(use_cache=False)) is False
+
+
+def test_mismas_peticiones_que_el_cliente_síncrono(gimnasio):
+    respuestas, peticiones = gimnasio
+    respuestas[VG_API.CREATE_BOOKING_ENDPOINT] = httpx.Response(200, json={"id": 555})
+    api = _api()
+    sincrono = VG_API("async@test.local", "secreto")
+    sincrono.user_id, sincrono.center_id = 7, 134
+
+    assert asyncio.run(api.commit_booking(api._datos_reserva(134, 99))) == 555
+    assert httpx.Request("POST", "/", json=sincrono._datos_reserva(134, 99)).content == peticiones[0][1]
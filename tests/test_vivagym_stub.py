@@ -0,0 +1,76 @@
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from app.gateway import http_session
+from app.gateway.timetable_cache import timetable_cache
+from app.gateway.vg_api import VG_API
+from app.gateway.vg_api_async import VG_API_Async
+from benchmarks.vivagym_stub import Gimnasio, crear_app
+
+FECHA = "2026-10-19"
+
+
+def _sesion(cliente, email):
+    token = cliente.post(VG_API.LOGIN_ENDPOINT, json={"email": email, "password": "secreto"}).json()["token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _id_clase(cliente, cabeceras, nombre="Yoga", hora="09:00"):
+    horario = cliente.post(VG_API.SEARCH_BOOKING_ENDPOINT, json={"centers": [134], "dateFrom": FECHA, "dateTo": FECHA}, headers=cabeceras).json()
+    return next(clase["booking"]["id"] for clase in horario if (clase["booking"]["name"], clase["booking"]["startTime"]) == (nombre, hora))
+
+
+def test_plazas_limitadas_y_cancelación():
+    cliente = TestClient(crear_app(Gimnasio(latencia_ms=0, jitter_ms=0, capacidad=1)))
+    ana, luis = _sesion(cliente, "ana@test.local"), _sesion(cliente, "luis@test.local")
+    id_clase = _id_clase(cliente, ana)
+
+    respuesta = cliente.post(VG_API.CREATE_BOOKING_ENDPOINT, json={"bookingId": id_clase}, headers=ana)
+    assert respuesta.status_code == 200
+    id_participacion = respuesta.json()["id"]
+    assert cliente.post(VG_API.CREATE_BOOKING_ENDPOINT, json={"bookingId": id_clase}, headers=ana).status_code == 409
+    assert cliente.post(VG_API.CREATE_BOOKING_ENDPOINT, json={"bookingId": id_clase}, headers=luis).status_code == 422
+
+    # El horario muestra la participación de quien tiene plaza
+    horario = cliente.post(VG_API.SEARCH_BOOKING_ENDPOINT, json={"centers": [134], "dateFrom": FECHA, "dateTo": FECHA}, headers=ana).json()
+    assert {"id": id_participacion} in [clase["participation"] for clase in horario]
+
+    assert cliente.post(VG_API.CANCEL_BOOKING_ENDPOINT, json={"participationId": id_participacion}, headers=ana).status_code == 200
+    assert cliente.post(VG_API.CREATE_BOOKING_ENDPOINT, json={"bookingId": id_clase}, headers=luis).status_code == 200
+    assert cliente.get("/resumen").json()["plazas_ocupadas"] == 1
+
+
+def test_sin_token_y_con_errores():
+    gimnasio = Gimnasio(latencia_ms=0, jitter_ms=0)
+    cliente = TestClient(crear_app(gimnasio))
+
+    assert cliente.post(VG_API.CREATE_BOOKING_ENDPOINT, json={"bookingId": 1}, headers={"Authorization": "Bearer otro"}).status_code == 401
+
+    gimnasio.tasa_error = 1.0
+    assert cliente.post(VG_API.LOGIN_ENDPOINT, json={"email": "ana@test.local", "password": "secreto"}).status_code == 503
+    assert cliente.get("/resumen").json()["peticiones"] == {"authenticate 503": 1, "create 401": 1}
+
+
+@pytest.fixture
+def cliente_stub(monkeypatch):
+    """Dirige el cliente asíncrono de la aplicación al gimnasio simulado."""
+    cliente = httpx.AsyncClient(transport=httpx.ASGITransport(app=crear_app(Gimnasio(latencia_ms=0, jitter_ms=0))))
+    monkeypatch.setattr(http_session, "get_async_client", lambda: cliente)
+    timetable_cache.invalidate()
+    yield
+    timetable_cache.invalidate()
+
+
+def test_el_cliente_reserva_contra_el_stub(cliente_stub):
+    async def reservar():
+        api = VG_API_Async("stub@test.local", "secreto")
+        assert await api.authenticate(use_cache=False)
+        payload = await api.prepare_booking(134, FECHA, "18:00", "Pilates")
+        id_participacion = await api.commit_booking(payload)
+        return id_participacion, await api.find_participation(134, FECHA, payload["bookingId"])
+
+    id_participacion, encontrada = asyncio.run(reservar())
+
+    assert id_participacion is not None
+    assert encontrada == id_participacion